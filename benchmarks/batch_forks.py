@@ -0,0 +1,48 @@
+"""
+Benchmark: how long do many forks take to run, with and without --batch?
+
+Run from the top of the source tree with:
+
+    python3 -m benchmarks.batch_forks
+"""
+
+import random
+import timeit
+
+from graftlib.eval_cell import eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.parse_cell import parse_cell
+
+
+steps = 300
+max_forks = 200
+
+
+programs = [
+    "T(200,F) d=f*7 ^ S() d+=f/10 x+=1 S() r=f D()",
+    "dd=0 ^ T(11,F) d=f*30 d+=dd T(10,S) dd+=1",
+]
+
+
+def _seconds(program, batch) -> float:
+    trees = list(parse_cell(lex_cell(program)))
+
+    def run():
+        rand = random.Random(1).uniform
+        for _ in graftrun(trees, steps, rand, max_forks, eval_cell, batch):
+            pass
+
+    return min(timeit.repeat(run, number=1, repeat=3))
+
+
+def main():
+    for program in programs:
+        print(program)
+        for batch in (False, True):
+            print(
+                "    batch=%-5s %6.2f s" % (batch, _seconds(program, batch)))
+
+
+if __name__ == "__main__":
+    main()
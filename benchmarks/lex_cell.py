@@ -0,0 +1,57 @@
+"""
+Benchmark: how long does lex_cell take for small programs (like the
+bot runs) and for one large generated program?
+
+Run from the top of the source tree with:
+
+    python3 -m benchmarks.lex_cell
+"""
+
+import random
+import timeit
+
+from graftlib import cellstdlib
+from graftlib.lex_cell import lex_cell
+
+
+small_programs = [
+    "d+=10 S()",
+    "T(10,F) d+=f S() d+=1 r=f*3",
+    "Sq={:(x) x*x} a=[1,2,\"three\"] For(a,{:(v) d+=Sq(v)/3 S()})",
+    cellstdlib.cellstdlib,
+]
+
+
+def generated_program(statements: int) -> str:
+    rand = random.Random(1)
+    return "\n".join(
+        "v%d=%.2f d+=v%d*%d s<=%d S() F()" % (
+            i, rand.uniform(0, 100), i, rand.randint(1, 9), i)
+        for i in range(statements)
+    )
+
+
+def main():
+    def lex_small():
+        for program in small_programs:
+            for _ in lex_cell(program):
+                pass
+
+    seconds = min(timeit.repeat(lex_small, number=200, repeat=5)) / 200
+    print("small programs:  %8.1f us" % (seconds * 1e6))
+
+    big = generated_program(5000)
+
+    def lex_big():
+        for _ in lex_cell(big):
+            pass
+
+    seconds = min(timeit.repeat(lex_big, number=1, repeat=5))
+    print(
+        "large program:   %8.1f ms (%d characters, %.2f us each)" % (
+            seconds * 1e3, len(big), seconds * 1e6 / len(big))
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Microbenchmark: how long does it take to call a native function?
+
+Run from the top of the source tree with:
+
+    python3 -m benchmarks.native_calls
+"""
+
+import inspect
+import timeit
+
+from graftlib.compile_cell import CellCompiler
+from graftlib.eval_cell import eval_cell, fail_if_wrong_number_of_args
+from graftlib.lex_cell import lex_cell
+from graftlib.make_graft_env import make_graft_env
+from graftlib.parse_cell import parse_cell
+from graftlib.programenv import ProgramEnv
+
+
+repeats = 100_000
+
+
+def _per_call_us(fn) -> float:
+    return min(timeit.repeat(fn, number=repeats, repeat=3)) * 1e6 / repeats
+
+
+def main():
+    env = ProgramEnv(make_graft_env(), None, None, eval_cell)
+    sin = env.get("Sin")
+    arg = env.get("d")
+
+    def getfullargspec_each_time():
+        params = inspect.getfullargspec(sin.py_fn).args
+        fail_if_wrong_number_of_args("Sin", len(params[1:]), 1)
+        return sin.py_fn(env, arg)
+
+    def precomputed_arity():
+        fail_if_wrong_number_of_args("Sin", sin.arity, 1)
+        return sin.py_fn(env, arg)
+
+    adapter = CellCompiler().adapter("Sin", sin, 1)
+
+    def adapter_call():
+        return adapter(env, [arg])
+
+    [tree] = parse_cell(lex_cell("Sin(d)"))
+
+    def tree_walking():
+        return eval_cell(env, tree)
+
+    compiler = CellCompiler()
+    compiled_env = ProgramEnv(make_graft_env(), None, None, compiler)
+
+    def compiled():
+        return compiler(compiled_env, tree)
+
+    for name, fn in (
+        ("getfullargspec on every call", getfullargspec_each_time),
+        ("precomputed arity", precomputed_arity),
+        ("compiled adapter", adapter_call),
+        ("Sin(d) with eval_cell", tree_walking),
+        ("Sin(d) with CellCompiler", compiled),
+    ):
+        print("%-30s %6.2f us per call" % (name, _per_call_us(fn)))
+
+
+if __name__ == "__main__":
+    main()
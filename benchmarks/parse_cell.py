@@ -0,0 +1,45 @@
+"""
+Benchmark: how long does parse_cell take for a large generated program,
+and for one long expression?
+
+Run from the top of the source tree with:
+
+    python3 -m benchmarks.parse_cell
+"""
+
+import timeit
+
+from benchmarks.lex_cell import generated_program
+from graftlib.lex_cell import lex_cell
+from graftlib.parse_cell import parse_cell
+
+
+def main():
+    big = list(lex_cell(generated_program(5000)))
+    long_expression = list(lex_cell("x=" + "+".join(["d*2"] * 300)))
+
+    for name, tokens in (
+            ("large program", big),
+            ("long expression", long_expression),
+    ):
+        def parse():
+            for _ in parse_cell(tokens):
+                pass
+
+        try:
+            seconds = min(timeit.repeat(parse, number=1, repeat=5))
+        except RecursionError:
+            print("%-16s RecursionError" % (name + ":"))
+            continue
+        print(
+            "%-16s %8.2f ms (%d tokens, %.2f us each)" % (
+                name + ":",
+                seconds * 1e3,
+                len(tokens),
+                seconds * 1e6 / len(tokens),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: how long does the StrokeOptimiser take per stroke, and how
+much memory does it use to remember the strokes it has seen?
+
+Run from the top of the source tree with:
+
+    python3 -m benchmarks.stroke_optimiser
+"""
+
+import random
+import timeit
+
+from graftlib.eval_cell import eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.parse_cell import parse_cell
+from graftlib.strokeoptimiser import StrokeOptimiser
+
+
+steps = 5000
+max_forks = 20
+
+
+programs = [
+    "T(10,F) d+=f S() d+=1 r=f*3",  # Repeats itself: mostly elided
+    "d+=R()*360 S() z=R()*30 D()",  # Random: mostly new strokes
+]
+
+
+def main():
+    for program in programs:
+        trees = list(parse_cell(lex_cell(program)))
+        rand = random.Random(1).uniform
+        strokes = list(graftrun(trees, steps, rand, max_forks, eval_cell))
+        num = sum(len(par) for par in strokes)
+        optimiser = None
+
+        def run():
+            nonlocal optimiser
+            optimiser = StrokeOptimiser(iter(strokes))
+            for _ in optimiser:
+                pass
+
+        seconds = min(timeit.repeat(run, number=1, repeat=3))
+        print(program)
+        print("    %6.2f us per stroke" % (seconds * 1e6 / num))
+        print(
+            "    %6d strokes remembered in %d KiB" % (
+                len(optimiser.seen_strokes),
+                optimiser.memory_footprint() // 1024,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
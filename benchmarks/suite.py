@@ -0,0 +1,353 @@
+"""
+Benchmark suite: run the animations in animations/*.sh, the examples in
+README.md, and some stress tests, and report how fast they go.
+
+Run from the top of the source tree with:
+
+    python3 -m benchmarks.suite [--output=results.json]
+
+To store the results as the baseline that later runs are compared with:
+
+    python3 -m benchmarks.suite --save-baseline
+
+Each case runs once with each engine and mode in `engines` (the tree
+walker, the compiled engine with and without --optimise, --batch and
+--workers), and its steps/sec and strokes/sec are reported for each.
+Each case runs in a fresh process with a fixed random seed, so its peak
+memory use (RSS) is its own and runs are repeatable.  Any result more
+than 10% worse than benchmarks/baseline.json is reported as a
+regression, and the exit status is 1.  Drawing frames needs cairo -
+without it, frames/sec are not measured.
+"""
+
+from argparse import ArgumentParser
+from typing import Dict, List, Optional
+import glob
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shlex
+import sys
+import time
+import timeit
+
+import attr
+
+from graftlib import batchrun
+from graftlib.animation import Animation
+from graftlib.compile_cell import CellCompiler
+from graftlib.eval_cell import eval_cell
+from graftlib.gifwriter import GifWriter
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.optimise_cell import optimise_cell
+from graftlib.parse_cell import parse_cell
+from graftlib.strokeoptimiser import StrokeOptimiser
+from graftlib.videowriter import Y4mWriter
+
+try:
+    from graftlib.ui.frameui import FrameUi
+except ImportError:
+    FrameUi = None
+
+
+baseline_file = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# How much worse than the baseline a result can be before we complain
+regression_threshold = 0.1
+
+seed = 1
+
+# Steps to run for programs that would otherwise run forever
+default_frames = 200
+
+# How many frames to draw, at most, when measuring frames/sec
+max_render_frames = 100
+image_size = (200, 200)
+
+
+@attr.s
+class Engine:
+    """How to run a program: the options to ./graft that it stands for."""
+    make_eval_expr = attr.ib()
+    optimise: bool = attr.ib(False)
+    batch: bool = attr.ib(False)
+    workers: Optional[int] = attr.ib(None)
+
+
+# Engines and modes to measure steps/sec and strokes/sec with.  Frames
+# are drawn using tree.
+engines = {
+    "tree": Engine(lambda: eval_cell),
+    "compiled": Engine(CellCompiler),
+    "compiled+optimise": Engine(CellCompiler, optimise=True),
+    "batch": Engine(lambda: eval_cell, batch=True),
+    "workers": Engine(lambda: eval_cell, workers=2),
+}
+
+
+# Render backends: name -> (make writer given a file, group strokes?)
+backends = {
+    "gif": (lambda f: GifWriter(f, *image_size), False),
+    "gif-grouped": (lambda f: GifWriter(f, *image_size), True),
+    "y4m": (lambda f: Y4mWriter(f, *image_size), False),
+}
+
+
+# Metrics where smaller numbers are better.  For the rest, bigger is.
+smaller_is_better = {"lex_parse_ms", "peak_rss_kib"}
+
+
+@attr.s
+class Case:
+    name: str = attr.ib()
+    program: str = attr.ib()
+    frames: int = attr.ib(default_frames)
+    max_forks: int = attr.ib(20)
+    lookahead_steps: int = attr.ib(80)
+
+
+stress_cases = [
+    Case(
+        "stress-deep-forks",
+        "F() F() F() F() F() F() F() F() d+=R()*36 S()",
+        frames=50,
+        max_forks=256,
+    ),
+    Case("stress-many-strokes", "T(10000,S)", frames=10000),
+    Case(
+        "stress-array-for",
+        "m=[] T(2000,{Add(m,R()*360)}) For(m,{:(x) d=x S()})",
+        frames=2000,
+    ),
+    Case(
+        "stress-while",
+        "i=0 While({i<5000},{i+=1 d+=7 S()})",
+        frames=5000,
+    ),
+]
+
+
+def _case_from_argv(name: str, argv: List[str]) -> Case:
+    """Make a Case from the arguments to ./graft, ignoring unknown ones."""
+    parser = ArgumentParser()
+    parser.add_argument('--frames', type=int, default=-1)
+    parser.add_argument('--max-forks', type=int, default=20)
+    parser.add_argument('--lookahead-steps', type=int, default=80)
+    parser.add_argument('program')
+    args, _ = parser.parse_known_args(argv)
+    return Case(
+        name,
+        args.program,
+        default_frames if args.frames < 0 else args.frames,
+        args.max_forks,
+        args.lookahead_steps,
+    )
+
+
+def animation_cases() -> List[Case]:
+    ret = []
+    for filename in sorted(glob.glob("animations/*.sh")):
+        with open(filename) as f:
+            argv = [
+                arg for arg in shlex.split(f.read())
+                if arg.strip() not in ("", "./graft", "$@")
+            ]
+        ret.append(_case_from_argv(filename[:-len(".sh")], argv))
+    return ret
+
+
+def readme_cases() -> List[Case]:
+    ret = []
+    with open("README.md") as f:
+        for i, line in enumerate(f):
+            if line.startswith("./graft "):
+                argv = shlex.split(line, comments=True)[1:]
+                ret.append(_case_from_argv("README.md:%d" % (i + 1), argv))
+    return ret
+
+
+def _steps(case: Case, engine: Engine):
+    program = list(parse_cell(lex_cell(case.program)))
+    if engine.optimise:
+        program, _ = optimise_cell(program)
+    return graftrun(
+        program,
+        case.frames,
+        random.Random(seed).uniform,
+        case.max_forks,
+        engine.make_eval_expr(),
+        engine.batch,
+        engine.workers,
+    )
+
+
+def _available_engines() -> Dict[str, Engine]:
+    return {
+        name: engine
+        for name, engine in engines.items()
+        if not (engine.batch and batchrun.numpy is None)
+    }
+
+
+def _frames_per_sec(case: Case, make_writer, group_strokes) -> float:
+    frames = min(case.frames, max_render_frames)
+    opt = StrokeOptimiser(
+        _steps(attr.evolve(case, frames=frames), engines["tree"]))
+    animation = Animation(
+        opt, opt, min(frames, case.lookahead_steps), 200, 5)
+    writer = make_writer(io.BytesIO())
+    start = time.perf_counter()
+    FrameUi(animation, writer, image_size, group_strokes).run()
+    return frames / (time.perf_counter() - start)
+
+
+def run_case(case: Case) -> Dict:
+    """Run case and return its results. Called in a fresh process."""
+    ret = {}
+
+    def lex_parse():
+        list(parse_cell(lex_cell(case.program)))
+
+    seconds = min(timeit.repeat(lex_parse, number=100, repeat=5))
+    ret["lex_parse_ms"] = seconds * 1000 / 100
+
+    for name, engine in _available_engines().items():
+        steps = 0
+        strokes = 0
+        start = time.perf_counter()
+        for parallel_strokes in _steps(case, engine):
+            steps += 1
+            strokes += sum(1 for s in parallel_strokes if s is not None)
+        seconds = time.perf_counter() - start
+        ret["steps_per_sec." + name] = steps / seconds
+        ret["strokes_per_sec." + name] = strokes / seconds
+
+    if FrameUi is not None:
+        for name, (make_writer, group_strokes) in backends.items():
+            ret["frames_per_sec." + name] = _frames_per_sec(
+                case, make_writer, group_strokes)
+
+    # On Linux, ru_maxrss is in KiB
+    ret["peak_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return ret
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    """Return a description of every result worse than the baseline."""
+    ret = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = value / old - 1
+            if metric not in smaller_is_better:
+                change = -change
+            if change > regression_threshold:
+                ret.append(
+                    "%s %s: %.4g -> %.4g (%d%% worse)" %
+                    (name, metric, old, value, round(change * 100))
+                )
+    return ret
+
+
+def _print_result(name: str, metrics: Dict):
+    fps = ", ".join(
+        "%s %.1f" % (m[len("frames_per_sec."):], v)
+        for m, v in metrics.items()
+        if m.startswith("frames_per_sec.")
+    )
+    print(
+        "%-22s %7.2f ms lex+parse %6.1f MiB  frames/s: %s" % (
+            name,
+            metrics["lex_parse_ms"],
+            metrics["peak_rss_kib"] / 1024,
+            fps or "(no cairo)",
+        )
+    )
+    for engine in engines:
+        if "steps_per_sec." + engine in metrics:
+            print(
+                "    %-18s %9.0f steps/s %9.0f strokes/s" % (
+                    engine,
+                    metrics["steps_per_sec." + engine],
+                    metrics["strokes_per_sec." + engine],
+                )
+            )
+
+
+def _run_case_and_send(case: Case, conn):
+    conn.send(run_case(case))
+
+
+def _run_in_new_process(case: Case) -> Dict:
+    """
+    Run case in a fresh process, so we measure its own peak memory use.
+    Not in a multiprocessing.Pool, whose processes can't start the
+    processes that --workers needs.
+    """
+    context = multiprocessing.get_context("spawn")
+    conn, child_conn = context.Pipe()
+    process = context.Process(
+        target=_run_case_and_send, args=(case, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        return conn.recv()
+    finally:
+        process.join()
+
+
+def main(argv: List[str]) -> int:
+    parser = ArgumentParser(prog="python3 -m benchmarks.suite")
+    parser.add_argument(
+        '--output', help="Write the results to this JSON file.")
+    parser.add_argument(
+        '--baseline',
+        default=baseline_file,
+        help="Compare with the results in this JSON file.",
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action="store_true",
+        help="Store the results as the new baseline.",
+    )
+    parser.add_argument(
+        '--only', help="Only run cases whose names contain this.")
+    args = parser.parse_args(argv)
+
+    cases = animation_cases() + readme_cases() + stress_cases
+    if args.only:
+        cases = [case for case in cases if args.only in case.name]
+
+    results = {}
+    for case in cases:
+        metrics = _run_in_new_process(case)
+        _print_result(case.name, metrics)
+        results[case.name] = metrics
+
+    for filename in (args.output, args.save_baseline and args.baseline):
+        if filename:
+            with open(filename, "w") as f:
+                json.dump(results, f, indent=4, sort_keys=True)
+
+    baseline: Optional[Dict] = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if baseline is not None:
+        regressions = compare(results, baseline)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        if regressions:
+            return 1
+        print("No regressions compared with " + args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
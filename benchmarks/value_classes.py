@@ -0,0 +1,77 @@
+"""
+Benchmark: how much memory do the objects we make millions of (points,
+strokes, numbers and trees) take, and how long do they take to make and
+to read from?  Also, how fast does a typical program run?
+
+Run from the top of the source tree with:
+
+    python3 -m benchmarks.value_classes
+"""
+
+import random
+import timeit
+import tracemalloc
+
+from graftlib.eval_cell import eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.line import Line
+from graftlib.numbervalue import NumberValue
+from graftlib.parse_cell import FunctionCallTree, NumberTree, parse_cell
+from graftlib.pt import Pt
+
+
+count = 100000
+
+makers = {
+    "Pt": lambda i: Pt(i, i),
+    "Line": lambda i: Line(Pt(i, i), Pt(i, i)),
+    "NumberValue": lambda i: NumberValue(i),
+    "NumberTree": lambda i: NumberTree("1"),
+    "FunctionCallTree": lambda i: FunctionCallTree(None, []),
+}
+
+program = "d+=R()*30 T(3,{s*=1.01 S()}) F() z=x/10+2 D()"
+steps = 3000
+
+
+def bytes_each(make) -> float:
+    tracemalloc.start()
+    objs = [make(i) for i in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objs
+    return size / count
+
+
+def main():
+    for name, make in makers.items():
+        make_seconds = min(
+            timeit.repeat(lambda: make(1), number=count, repeat=5))
+        obj = make(1)
+        field = obj.__attrs_attrs__[0].name
+        read_seconds = min(
+            timeit.repeat(
+                lambda: getattr(obj, field), number=count, repeat=5))
+        print(
+            "%-17s %6.0f bytes each, %5.0f ns to make, %3.0f ns to read" % (
+                name,
+                bytes_each(make),
+                make_seconds * 1e9 / count,
+                read_seconds * 1e9 / count,
+            )
+        )
+
+    trees = list(parse_cell(lex_cell(program)))
+
+    def run():
+        rand = random.Random(1).uniform
+        for _ in graftrun(trees, steps, rand, 20, eval_cell):
+            pass
+
+    seconds = min(timeit.repeat(run, number=1, repeat=3))
+    print("%d steps of %s: %.0f ms" % (steps, program, seconds * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 from typing import Iterable, List, Union
 
 from graftlib.dot import Dot
-from graftlib.extents import Extents
+from graftlib.extents import Extents, WindowExtents
+from graftlib.frametracer import null_tracer
 from graftlib.line import Line
 from graftlib.pt import Pt
+from graftlib.strokegrid import StrokeGrid
 from graftlib.strokeoptimiser import Elided
 from graftlib.windowanimator import WindowAnimator
 
@@ -16,12 +18,18 @@ class Animation:
             lookahead_steps,
             max_strokes,
             dot_size,
+            tracer=null_tracer,
     ):
         self.strokes: List[Union[Line, Dot]] = []
+        self.num_deleted = 0  # How many strokes _prune has removed so far
         self.poss: List[Pt] = []
         self.extents = Extents()
+        self.stroke_extents = WindowExtents()
+        self.stroke_grid = StrokeGrid()
         self.window_animator = WindowAnimator(lookahead_steps)
-        self.commands = self.extents.train_on(commands, lookahead_steps)
+        self.tracer = tracer
+        with tracer.stage("extents"):
+            self.commands = self.extents.train_on(commands, lookahead_steps)
         self.delete_listener = delete_listener
         self.max_strokes = max_strokes
         self.dot_size = dot_size
@@ -30,10 +38,18 @@ class Animation:
         if len(self.strokes) > self.max_strokes:
             to_delete = self.strokes[:-self.max_strokes]
             self.strokes = self.strokes[-self.max_strokes:]
+            self.num_deleted += len(to_delete)
+            self.stroke_extents.remove_oldest(len(to_delete))
+            self.stroke_grid.remove_oldest(to_delete)
             for d in to_delete:
                 self.delete_listener.delete_stroke(d)
 
     def step(self):
+        self.tracer.next_frame()
+        with self.tracer.stage("step"):
+            return self._step()
+
+    def _step(self):
         try:
             parallel_commands = next(self.commands)
             if len(self.poss) < len(parallel_commands):
@@ -45,9 +61,13 @@ class Animation:
                 if type(command) == Line:
                     self.poss[i] = command.end
                     self.strokes.append(command)
+                    self.stroke_extents.add_cmd(command)
+                    self.stroke_grid.add(command)
                 elif type(command) == Dot:
                     self.poss[i] = command.pos
                     self.strokes.append(command)
+                    self.stroke_extents.add_cmd(command)
+                    self.stroke_grid.add(command)
                 elif type(command) == Elided:
                     if type(command.item) == Line:
                         self.poss[i] = command.item.end
@@ -60,21 +80,31 @@ class Animation:
         except StopIteration:
             return False
 
-    def _add_extents(self, stroke: Union[Line, Dot]):
-        if type(stroke) == Elided:
-            self._add_extents(stroke.item)
-        elif type(stroke) == Line:
-            self.extents.add(stroke.start)
-            self.extents.add(stroke.end)
-        else:  # Dot
-            self.extents.add(stroke.pos)
-
     def animate_window(self, win_w, win_h) -> (float, float, float):
-        ret = self.window_animator.animate(
-            self.extents,
-            (win_w, win_h)
+        with self.tracer.stage("animate_window"):
+            ret = self.window_animator.animate(
+                self.extents,
+                (win_w, win_h)
+            )
+            # The next frame moves towards the strokes we have now
+            self.extents = self.stroke_extents.extents()
+            return ret
+
+    def visible_strokes(
+            self, transform, win_w, win_h) -> List[Union[Line, Dot]]:
+        """
+        Return the strokes that can be seen (and perhaps a few near the
+        edges that can't) in a window of this size, when drawn with the
+        (x, y, scale) transform returned by animate_window.
+        """
+        x, y, scale = transform
+        # A couple of pixels more for antialiasing and thin lines, which
+        # are always drawn at least 1 pixel wide.
+        margin = 2.0 / scale
+        # Screen y goes down, but ours goes up
+        return self.stroke_grid.find(
+            -x / scale - margin,
+            (y - win_h) / scale - margin,
+            (win_w - x) / scale + margin,
+            y / scale + margin,
         )
-        self.extents.reset()
-        for stroke in self.strokes:
-            self._add_extents(stroke)
-        return ret
@@ -0,0 +1,349 @@
+from typing import Callable, Dict, List, Optional, Set
+import math
+
+import attr
+
+from graftlib.dot import Dot
+from graftlib.line import Line
+from graftlib.numbervalue import NumberValue
+from graftlib.parse_cell import (
+    AssignmentTree,
+    FunctionCallTree,
+    ModifyTree,
+    NegativeTree,
+    NumberTree,
+    OperationTree,
+    SymbolTree,
+)
+from graftlib.pt import Pt
+
+try:
+    import numpy
+except ImportError:  # numpy is only needed for batch mode
+    numpy = None
+
+
+# Don't bother batching fewer forks than this - it's quicker to run
+# them one by one.
+default_min_batch_size = 8
+
+
+class CannotBatch(Exception):
+    """
+    Raised when some of the forks in a batch turn out to be unsuitable
+    for running together, e.g. because one of them has a variable that
+    is not a number.  Raised before anything has been changed, so the
+    forks can be run one by one instead.
+    """
+
+
+def _divide(x, y):
+    if numpy.any(numpy.asarray(y) == 0):
+        raise CannotBatch()  # Let the interpreter report the error
+    return numpy.true_divide(x, y)
+
+
+def _bool(fn):
+    return lambda x, y: numpy.where(fn(x, y), 1.0, 0.0)
+
+
+def _vector_ops():
+    return {
+        "+": numpy.add,
+        "-": numpy.subtract,
+        "*": numpy.multiply,
+        "/": _divide,
+        ">": _bool(numpy.greater),
+        "<": _bool(numpy.less),
+        ">=": _bool(numpy.greater_equal),
+        "<=": _bool(numpy.less_equal),
+        "==": _bool(numpy.equal),
+    }
+
+
+def _vector_expr(expr, reads: Set[str]) -> Optional[Callable]:
+    """
+    Return a function that takes a dict of name->column and evaluates
+    expr for every fork at once, or None if expr can't be done that way.
+    Add any variable names expr uses to reads.
+    """
+    typ = type(expr)
+    if typ == NumberTree:
+        value = float(expr.value)
+        return lambda columns: value
+    elif typ == NumberValue and type(expr.value) in (int, float):
+        value = float(expr.value)
+        return lambda columns: value
+    elif typ == SymbolTree:
+        name = expr.value
+        reads.add(name)
+        return lambda columns: columns[name]
+    elif typ == NegativeTree:
+        value = _vector_expr(expr.value, reads)
+        if value is None:
+            return None
+        return lambda columns: numpy.negative(value(columns))
+    elif typ == OperationTree:
+        op = _vector_ops().get(expr.operation)
+        left = _vector_expr(expr.left, reads)
+        right = _vector_expr(expr.right, reads)
+        if op is None or left is None or right is None:
+            return None
+        return lambda columns: op(left(columns), right(columns))
+    else:
+        return None
+
+
+def _step(columns):
+    th = 2 * math.pi * (columns["d"] / 360.0)
+    s = columns["s"]
+    return (
+        columns["x"] + s * numpy.sin(th),
+        columns["y"] + s * numpy.cos(th),
+    )
+
+
+def _colors(columns):
+    return zip(
+        columns["r"].tolist(),
+        columns["g"].tolist(),
+        columns["b"].tolist(),
+        columns["a"].tolist(),
+    )
+
+
+def _move(columns, writes):
+    x, y = _step(columns)
+    writes["xprev"] = columns["x"]
+    writes["yprev"] = columns["y"]
+    writes["x"] = x
+    writes["y"] = y
+
+
+def _jump(columns, writes):
+    _move(columns, writes)
+
+
+def _step_and_draw(columns, writes):
+    _move(columns, writes)
+    return [
+        [Line(Pt(x0, y0), Pt(x1, y1), color=color, size=z)]
+        for x0, y0, x1, y1, color, z in zip(
+            columns["x"].tolist(),
+            columns["y"].tolist(),
+            writes["x"].tolist(),
+            writes["y"].tolist(),
+            _colors(columns),
+            columns["z"].tolist(),
+        )
+    ]
+
+
+def _dot(columns, _writes):
+    return [
+        [Dot(Pt(x, y), color, z)]
+        for x, y, color, z in zip(
+            columns["x"].tolist(),
+            columns["y"].tolist(),
+            _colors(columns),
+            columns["z"].tolist(),
+        )
+    ]
+
+
+def _line_to(columns, _writes):
+    return [
+        [Line(Pt(x0, y0), Pt(x1, y1), color=color, size=z)]
+        for x0, y0, x1, y1, color, z in zip(
+            columns["xprev"].tolist(),
+            columns["yprev"].tolist(),
+            columns["x"].tolist(),
+            columns["y"].tolist(),
+            _colors(columns),
+            columns["z"].tolist(),
+        )
+    ]
+
+
+_color_and_size = ("r", "g", "b", "a", "z")
+
+
+# Graft's natives that we can run as a batch:
+# name -> (variables read, function)
+_natives = {
+    "D": (("x", "y") + _color_and_size, _dot),
+    "J": (("d", "s", "x", "y"), _jump),
+    "L": (("xprev", "yprev", "x", "y") + _color_and_size, _line_to),
+    "S": (("d", "s", "x", "y") + _color_and_size, _step_and_draw),
+}
+
+
+@attr.s
+class BatchStatement:
+    """
+    A statement compiled to run for many forks at once.
+
+    reads are the names of variables it needs, which must all be numbers
+    in each fork's global Env.  natives are names of functions it calls,
+    which must not have been redefined by any fork.  run takes a dict
+    of name->column and a dict to fill with name->column of the
+    variables it changes, and returns a list of strokes for each fork,
+    or None if it draws nothing.
+    """
+
+    reads: Set[str] = attr.ib()
+    natives: Set[str] = attr.ib()
+    run = attr.ib()
+
+
+def _compile_native_call(statement: FunctionCallTree):
+    if type(statement.fn) != SymbolTree or statement.args:
+        return None
+    native = _natives.get(statement.fn.value)
+    if native is None:
+        return None
+    reads, fn = native
+    return BatchStatement(set(reads), {statement.fn.value}, fn)
+
+
+def _compile_set(statement, reads, value, combine):
+    name = statement.symbol.value
+
+    def run(columns, writes):
+        new_value = value(columns)
+        if combine is not None:
+            new_value = combine(columns[name], new_value)
+        # x and y are magic variables that remember their previous values
+        if name == "x":
+            writes["xprev"] = columns["x"]
+        elif name == "y":
+            writes["yprev"] = columns["y"]
+        writes[name] = new_value
+        return None
+
+    if combine is not None or name in ("x", "y"):
+        reads.add(name)
+    return BatchStatement(reads, set(), run)
+
+
+def compile_batch(statement) -> Optional[BatchStatement]:
+    """
+    Return a BatchStatement that does the same as statement (a top-level
+    statement from parse_cell), or None if it can't be batched.
+    """
+    typ = type(statement)
+    if typ == FunctionCallTree:
+        return _compile_native_call(statement)
+    elif typ in (AssignmentTree, ModifyTree):
+        if type(statement.symbol) != SymbolTree:
+            return None
+        reads = set()
+        value = _vector_expr(statement.value, reads)
+        if value is None:
+            return None
+        if typ == AssignmentTree:
+            return _compile_set(statement, reads, value, None)
+        combine = {
+            "+=": numpy.add,
+            "-=": numpy.subtract,
+            "*=": numpy.multiply,
+            "/=": _divide,
+        }.get(statement.operation)
+        if combine is None:
+            return None
+        return _compile_set(statement, reads, value, combine)
+    else:
+        return None
+
+
+def _columns(batch: BatchStatement, envs) -> Dict[str, object]:
+    items = [env.local_items() for env in envs]
+    ret = {}
+    for name in batch.reads:
+        try:
+            values = [i[name] for i in items]
+        except KeyError:
+            raise CannotBatch()  # Not defined yet, so we can't read it
+        if set(map(type, values)) != {NumberValue}:
+            raise CannotBatch()
+        ret[name] = numpy.array([v.value for v in values], dtype=float)
+    for name in batch.natives:
+        if any(name in i for i in items):
+            raise CannotBatch()  # Someone has replaced this function
+    return ret
+
+
+def run_batch(batch: BatchStatement, envs) -> List[Optional[List]]:
+    """
+    Run batch for each of the global Envs in envs, and return the list
+    of strokes each one drew (or None if it drew nothing).  Raises
+    CannotBatch without changing anything if these envs can't be batched.
+    """
+    columns = _columns(batch, envs)
+    writes = {}
+    strokes = batch.run(columns, writes)
+
+    n = len(envs)
+    for name, column in writes.items():
+        values = numpy.broadcast_to(column, (n,)).tolist()
+        for env, value in zip(envs, values):
+            env.set_new(name, NumberValue(value))
+
+    return [None] * n if strokes is None else strokes
+
+
+class BatchRunner:
+    """
+    Runs statements for groups of forks at once, using numpy to keep
+    their turtle variables in columns.  Only turtle natives (S(), J(),
+    D(), L()) and arithmetic assignments are batched - see compile_batch.
+    """
+
+    def __init__(self, min_batch_size: int = default_min_batch_size):
+        if numpy is None:
+            raise Exception(
+                "Running forks in batches requires numpy - please install it."
+            )
+        self.min_batch_size = min_batch_size
+        self._compiled = {}
+
+    def _compile(self, statement) -> Optional[BatchStatement]:
+        cached = self._compiled.get(id(statement))
+        if cached is None or cached[0] is not statement:
+            cached = (statement, compile_batch(statement))
+            self._compiled[id(statement)] = cached
+        return cached[1]
+
+    def run(self, programs) -> int:
+        """
+        programs is a list of (RunningProgram, queue).  For each group
+        of programs with empty queues that are about to run the same
+        statement, run the statement for all of them, and put what they
+        drew in their queues (None if they drew nothing).  Return how
+        many strokes (and Nones) we put in the queues.
+        Batched statements never fork or use random numbers, so it
+        doesn't matter that they run before the other programs.
+        """
+        queued = 0
+        groups = {}
+        for prog, queue in programs:
+            if not queue:
+                statement = prog.peek_statement()
+                groups.setdefault(id(statement), (statement, []))
+                groups[id(statement)][1].append((prog, queue))
+
+        for statement, members in groups.values():
+            if len(members) < self.min_batch_size:
+                continue
+            batch = self._compile(statement)
+            if batch is None:
+                continue
+            try:
+                results = run_batch(batch, [p.env.env for p, _ in members])
+            except CannotBatch:
+                continue
+            for (prog, queue), strokes in zip(members, results):
+                prog.skip_statement()
+                queue.extend(strokes if strokes else [None])
+                queued += len(queue)
+        return queued
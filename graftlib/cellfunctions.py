@@ -23,12 +23,12 @@ def until_endofloop(env, fn):
             yield y
 
 
-def for_(env, arr, fn):
-
+def for_items(env, arr):
+    """The items For(arr, fn) passes to fn, one by one."""
     if type(arr) == ArrayValue:
-        inp = arr.value
+        return arr.value
     elif type(arr) in (UserFunctionValue, NativeFunctionValue):
-        inp = until_endofloop(env, arr)
+        return until_endofloop(env, arr)
     else:
         raise Exception(
             "Unexpected first argument to For: expected an array or a " +
@@ -36,10 +36,12 @@ def for_(env, arr, fn):
             "%s." % arr
         )
 
+
+def for_(env, arr, fn):
     return ArrayValue(
         [
             env.eval_expr(env, FunctionCallTree(fn, [item]))
-            for item in inp
+            for item in for_items(env, arr)
         ]
     )
 
@@ -0,0 +1,442 @@
+import operator
+
+from graftlib.labeltree import LabelTree
+from graftlib.parse_cell import (
+    ArrayTree,
+    AssignmentTree,
+    FunctionCallTree,
+    FunctionDefTree,
+    ModifyTree,
+    NegativeTree,
+    NumberTree,
+    OperationTree,
+    StringTree,
+    SymbolTree,
+)
+
+from graftlib.eval_cell import (
+    ArrayValue,
+    NoneValue,
+    StringValue,
+    UserFunctionValue,
+    fail_if_wrong_number_of_args,
+)
+from graftlib.functions import turtle_slots
+from graftlib.nativefunctionvalue import NativeFunctionValue
+from graftlib.numbervalue import NumberValue
+from graftlib.resolve_cell import (
+    SlotTree,
+    resolve_body,
+    resolve_cell,
+    set_by_name,
+    slot_names,
+)
+
+
+def _bool(fn):
+    return lambda x, y: 1.0 if fn(x, y) else 0.0
+
+
+operations = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    ">": _bool(operator.gt),
+    "<": _bool(operator.lt),
+    ">=": _bool(operator.ge),
+    "<=": _bool(operator.le),
+    "==": _bool(operator.eq),
+}
+
+
+modify_operations = {
+    "+=": operator.add,
+    "-=": operator.sub,
+    "*=": operator.mul,
+    "/=": operator.truediv,
+}
+
+
+_value_types = (
+    ArrayValue,
+    NativeFunctionValue,
+    NoneValue,
+    NumberValue,
+    StringValue,
+    UserFunctionValue,
+)
+
+
+class CellCompiler:
+    """
+    An alternative to eval_cell that turns each tree into a Python
+    closure the first time it is seen, and runs the closure from then on.
+    Dispatching on the type of each tree, and on the operator strings
+    inside it, happens once at compile time instead of on every step.
+    Function parameters are found by position (see resolve_cell)
+    instead of by name, and so are the turtle variables in the global
+    SlotEnv, unless something hides them (see SlotEnv).  Arithmetic is
+    done on plain floats, which are only wrapped in a NumberValue when
+    the result is stored or passed on, and number literals become a
+    single shared NumberValue.  (Nothing changes a NumberValue once it
+    is made, so sharing them is safe.)
+
+    An instance is a drop-in eval_expr: call it with (env, expr).
+    Use one instance per running program - it caches the compiled
+    form of the program's statements and function bodies.
+    """
+
+    def __init__(self):
+        self._statements = {}
+        self._bodies = {}
+
+    def __call__(self, env, expr):
+        cached = self._statements.get(id(expr))
+        if cached is not None and cached[0] is expr:
+            return cached[1](env)
+        elif _is_source_tree(expr):
+            compiled = self.compile(resolve_cell(expr))
+            # Keep hold of expr so its id can't be reused by another tree
+            self._statements[id(expr)] = (expr, compiled)
+            return compiled(env)
+        elif type(expr) == FunctionCallTree:
+            # A call built by a native like T() - no need to compile it
+            args = [self(env, a) for a in expr.args]
+            return self.call(expr.fn, expr.fn, args, env)
+        else:
+            return expr
+
+    def compile(self, expr):
+        """Return a function that takes an env and evaluates expr in it."""
+        typ = type(expr)
+        if typ == NumberTree:
+            return _compile_constant(NumberValue(float(expr.value)))
+        elif typ in (NegativeTree, OperationTree):
+            return self._compile_boxed(expr)
+        elif typ == StringTree:
+            return _compile_constant(StringValue(expr.value))
+        elif typ == LabelTree:
+            return _compile_label()
+        elif typ == SymbolTree:
+            return _compile_symbol(expr)
+        elif typ == SlotTree:
+            return _compile_slot(expr)
+        elif typ == AssignmentTree:
+            return self._compile_assignment(expr)
+        elif typ == ModifyTree:
+            return self._compile_modify(expr)
+        elif typ == FunctionCallTree:
+            return self._compile_function_call(expr)
+        elif typ == FunctionDefTree:
+            return self._compile_function_def(expr)
+        elif typ == ArrayTree:
+            return self._compile_array(expr)
+        elif typ in _value_types:
+            return _compile_constant(expr)
+        else:
+            raise Exception("Unknown expression type: " + str(expr))
+
+    def compile_float(self, expr):
+        """
+        Return a function that takes an env and evaluates expr in it,
+        like compile, except that it returns the number inside the
+        resulting NumberValue.
+        """
+        typ = type(expr)
+        if typ == NumberTree:
+            return _compile_float_constant(float(expr.value))
+        elif typ == NumberValue:
+            return _compile_float_constant(expr.value)
+        elif typ == NegativeTree:
+            return self._compile_negative(expr)
+        elif typ == OperationTree:
+            return self._compile_operation(expr)
+        else:
+            boxed = self.compile(expr)
+
+            def unbox(env):
+                return boxed(env).value
+            return unbox
+
+    def compile_body(self, params, body):
+        """
+        Return (slot_names, run_body) for a function with the supplied
+        params and body.  run_body takes a SlotEnv holding the arguments,
+        evaluates each of the expressions in body in it, and returns the
+        last value.
+        """
+        cached = self._bodies.get(id(body))
+        if cached is not None and cached[0] is body:
+            return cached[1]
+        ret = self._compile_resolved_body(params, resolve_body(params, body))
+        self._bodies[id(body)] = (body, ret)
+        return ret
+
+    def _compile_resolved_body(self, params, body):
+        stmts = [self.compile(expr) for expr in body]
+
+        def run_body(env):
+            ret = NoneValue()
+            for stmt in stmts:
+                ret = stmt(env)
+            return ret
+
+        ret = (slot_names(params), run_body)
+        self._bodies[id(body)] = (body, ret)
+        return ret
+
+    def call(self, fn_expr, fn, args, env):
+        return self.adapter(fn_expr, fn, len(args))(env, args)
+
+    def adapter(self, fn_expr, fn, num_args):
+        """
+        Check that fn is a function that accepts num_args arguments,
+        and return a function taking (env, args) that calls it.
+        """
+        typ = type(fn)
+        if typ == UserFunctionValue:
+            fail_if_wrong_number_of_args(fn_expr, len(fn.params), num_args)
+            names, run_body = self.compile_body(fn.params, fn.body)
+            closure_env = fn.env
+
+            def call_user_function(env, args):
+                return run_body(env.make_call_env(closure_env, names, args))
+            return call_user_function
+        elif typ == NativeFunctionValue:
+            fail_if_wrong_number_of_args(fn_expr, fn.arity, num_args)
+            py_fn = fn.py_fn
+
+            def call_native_function(env, args):
+                return py_fn(env, *args)
+            return call_native_function
+        else:
+            raise Exception(
+                "Attempted to call something that is not a function: " +
+                "%s, which is %s" % (
+                    str(fn_expr),
+                    str(fn),
+                )
+            )
+
+    def _compile_boxed(self, expr):
+        value = self.compile_float(expr)
+
+        def box(env):
+            return NumberValue(value(env))
+        return box
+
+    def _compile_negative(self, expr: NegativeTree):
+        value = self.compile_float(expr.value)
+
+        def negative(env):
+            return -value(env)
+        return negative
+
+    def _compile_operation(self, expr: OperationTree):
+        if expr.operation not in operations:
+            raise Exception("Unknown operation: " + expr.operation)
+        op = operations[expr.operation]
+        left = self.compile_float(expr.left)
+        right = self.compile_float(expr.right)
+
+        def operation(env):
+            return op(left(env), right(env))
+        return operation
+
+    def _compile_assignment(self, expr: AssignmentTree):
+        if type(expr.symbol) == SlotTree:
+            return self._compile_slot_assignment(expr)
+        var_name = expr.symbol.value
+        value = self.compile(expr.value)
+        idx = _global_slot(var_name)
+
+        if idx is not None:
+            def global_assignment(env):
+                val = value(env)
+                globals_ = env.globals
+                if globals_ is None:
+                    env.set(var_name, val)
+                else:
+                    globals_.set_slot(idx, val)
+                return val
+            return global_assignment
+
+        def assignment(env):
+            val = value(env)
+            env.set(var_name, val)
+            return val
+        return assignment
+
+    def _compile_slot_assignment(self, expr: AssignmentTree):
+        depth = expr.symbol.depth
+        slot = expr.symbol.slot
+        value = self.compile(expr.value)
+
+        def slot_assignment(env):
+            val = value(env)
+            env.frame(depth).set_slot(slot, val)
+            return val
+        return slot_assignment
+
+    def _compile_modify(self, expr: ModifyTree):
+        if expr.operation not in modify_operations:
+            raise Exception("Unknown modify operation: " + expr.operation)
+        op = modify_operations[expr.operation]
+        value = self.compile_float(expr.value)
+
+        if type(expr.symbol) == SlotTree:
+            depth = expr.symbol.depth
+            slot = expr.symbol.slot
+
+            def slot_modify(env):
+                val = value(env)
+                frame = env.frame(depth)
+                new_val = NumberValue(op(frame.slots[slot].value, val))
+                frame.set_slot(slot, new_val)
+                return new_val
+            return slot_modify
+
+        var_name = expr.symbol.value
+        idx = _global_slot(var_name)
+
+        if idx is not None:
+            def global_modify(env):
+                val = value(env)
+                globals_ = env.globals
+                if globals_ is None:
+                    new_val = NumberValue(op(env.get(var_name).value, val))
+                    env.set(var_name, new_val)
+                else:
+                    new_val = NumberValue(op(globals_.slots[idx].value, val))
+                    globals_.set_slot(idx, new_val)
+                return new_val
+            return global_modify
+
+        def modify(env):
+            val = value(env)
+            new_val = NumberValue(op(env.get(var_name).value, val))
+            env.set(var_name, new_val)
+            return new_val
+        return modify
+
+    def _compile_function_call(self, expr: FunctionCallTree):
+        fn = self.compile(expr.fn)
+        fn_expr = expr.fn
+        if type(fn_expr) == SlotTree:
+            # Error messages should show the code as it was written
+            fn_expr = SymbolTree(fn_expr.value)
+        args = [self.compile(a) for a in expr.args]
+        num_args = len(args)
+        adapter = self.adapter
+
+        # The function we called last time, and its adapter.  Usually
+        # the same function is called from here every time, so we only
+        # need to check it and make its adapter once.
+        last = [None, None]
+
+        def function_call(env):
+            fn_value = fn(env)
+            if fn_value is not last[0]:
+                last[1] = adapter(fn_expr, fn_value, num_args)
+                last[0] = fn_value
+            return last[1](env, [a(env) for a in args])
+        return function_call
+
+    def _compile_function_def(self, expr: FunctionDefTree):
+        params = expr.params
+        body = expr.body
+        # body was resolved along with the rest of the statement
+        self._compile_resolved_body(params, body)
+
+        def function_def(env):
+            return UserFunctionValue(params, body, env.make_child())
+        return function_def
+
+    def _compile_array(self, expr: ArrayTree):
+        items = [self.compile(x) for x in expr.value]
+
+        def array(env):
+            return ArrayValue([item(env) for item in items])
+        return array
+
+
+def _is_source_tree(expr):
+    """
+    True if expr came from parsing a program, rather than being a
+    value, or a call built at runtime by a native function (e.g. T()).
+    Only these are worth remembering in the cache.
+    """
+    typ = type(expr)
+    if typ in _value_types:
+        return False
+    elif typ == FunctionCallTree:
+        return type(expr.fn) not in _value_types
+    else:
+        return True
+
+
+def _compile_constant(value):
+    def constant(_env):
+        return value
+    return constant
+
+
+def _compile_float_constant(value: float):
+    def float_constant(_env):
+        return value
+    return float_constant
+
+
+def _compile_label():
+    def label(_env):
+        raise Exception(
+            "You cannot (yet?) define labels inside functions.")
+    return label
+
+
+def _global_slot(name):
+    """
+    The index in the global SlotEnv's slots of name, if name is a turtle
+    variable that may be set there directly (see set_by_name).
+    """
+    if name in set_by_name:
+        return None
+    return turtle_slots.get(name)
+
+
+def _compile_symbol(expr: SymbolTree):
+    name = expr.value
+    idx = turtle_slots.get(name)
+
+    if idx is not None:
+        def global_symbol(env):
+            globals_ = env.globals
+            ret = env.get(name) if globals_ is None else globals_.slots[idx]
+            if ret is None:
+                raise Exception("Unknown symbol '%s'." % name)
+            else:
+                return ret
+        return global_symbol
+
+    def symbol(env):
+        ret = env.get(name)
+        if ret is None:
+            raise Exception("Unknown symbol '%s'." % name)
+        else:
+            return ret
+    return symbol
+
+
+def _compile_slot(expr: SlotTree):
+    name = expr.value
+    depth = expr.depth
+    slot = expr.slot
+
+    def slot_(env):
+        ret = env.frame(depth).slots[slot]
+        if ret is None:
+            raise Exception("Unknown symbol '%s'." % name)
+        else:
+            return ret
+    return slot_
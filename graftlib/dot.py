@@ -5,7 +5,7 @@ import attr
 from graftlib.pt import Pt
 
 
-@attr.s(cmp=True, frozen=True)
+@attr.s(cmp=True, frozen=True, slots=True)
 class Dot():
     pos: Pt = attr.ib()
     color: Tuple = attr.ib(default=(0.0, 0.0, 0.0, 100.0))
@@ -1,6 +1,10 @@
 from graftlib.numbervalue import NumberValue
 
 
+# Returned by _find when a name is not defined anywhere
+_not_found = object()
+
+
 class Env:
     def __init__(
         self,
@@ -25,41 +29,124 @@ class Env:
             self.stderr = parent.stderr
         self._items = {}
 
+        # True if _items may be shared with a clone, so must be
+        # copied before we change it.
+        self._shared = False
+
+        # True if nothing may change in this Env any more
+        self._sealed = False
+
+        # The SlotEnv holding the program's globals (see SlotEnv), if
+        # nothing between here and there hides any of its slots.
+        self.globals = None if parent is None else parent.globals
+
     def parent(self):
         return self._parent
 
     def clone(self):
-        parent = None if self._parent is None else self._parent.clone()
-        ret = Env(
-            parent=parent,
-            stdin=self.stdin,
-            stdout=self.stdout,
-            stderr=self.stderr,
-        )
-        for k, v in self._items.items():
-            ret.set(k, v)
+        """
+        Return a copy of this Env and its parents.  The copy shares
+        its values with the original until one of them changes a value,
+        so cloning costs almost nothing, however much is in here.
+        """
+        if self._sealed:
+            return self
+        elif self._parent is None:
+            ret = Env(
+                stdin=self.stdin,
+                stdout=self.stdout,
+                stderr=self.stderr,
+            )
+        else:
+            ret = Env(parent=self._parent.clone())
+            if self.globals is None:
+                ret.globals = None
+        self._share_items_with(ret)
         return ret
 
+    def _share_items_with(self, other):
+        other._items = self._items
+        other._shared = True
+        self._shared = True
+
+    def _unshare(self):
+        self._items = dict(self._items)
+        self._shared = False
+
+    def seal(self):
+        """
+        Prevent any more changes to this Env, so it can be shared
+        between programs.  Setting a name from a child Env defines it
+        in the child, hiding our value for that name.
+        """
+        self._sealed = True
+
     def make_child(self):
         return Env(parent=self)
 
+    def make_call_env(self, closure_env, slot_names=None, slots=None):
+        """
+        Return a new Env to run a function whose closure is closure_env,
+        called from this Env.  If slot_names is supplied, return a
+        SlotEnv holding slots.
+        """
+        if slot_names is None:
+            return closure_env.make_child()
+        else:
+            return closure_env.make_slot_child(slot_names, slots)
+
+    def make_slot_child(self, slot_names, slots):
+        return SlotEnv(self, slot_names, slots)
+
+    def frame(self, depth):
+        """
+        Return the Env depth levels above this one, where 0 means
+        this Env itself.
+        """
+        ret = self
+        for _ in range(depth):
+            ret = ret._parent
+        return ret
+
     def get(self, name):
+        ret = self._find(name)
+        if ret is _not_found:
+            # Unknown names are 0, and become globals from now on.
+            ret = NumberValue(0.0)
+            outermost = self._outermost_unsealed()
+            if outermost is not None:
+                outermost.set_new(name, ret)
+        return ret
+
+    def _find(self, name):
         if name in self._items:
             return self._items[name]
         elif self._parent is not None:
-            return self._parent.get(name)
+            return self._parent._find(name)
         else:
-            self._items[name] = NumberValue(0.0)
-            return self._items[name]
+            return _not_found
+
+    def _outermost_unsealed(self):
+        if self._sealed:
+            return None
+        ret = self
+        while ret._parent is not None and not ret._parent._sealed:
+            ret = ret._parent
+        return ret
 
     def _try_update(self, name, value):
         """
         Return true if we found this name in ourselves
         or a parent, and updated it its value to the
         value supplier.
-        Return false if this name was not known yet.
+        Return false if this name was not known yet,
+        or is only known in a sealed Env.
         """
-        if name in self._items:
+        if self._sealed:
+            return False
+        elif name in self._items:
+            if self._shared:
+                self._unshare()
             self._items[name] = value
             return True
         elif self._parent is None:
@@ -73,7 +160,13 @@ class Env:
             self.set_new(name, value)
 
     def set_new(self, name, value):
+        if self._sealed:
+            raise Exception("Can't change %s in a sealed Env." % name)
+        if self._shared:
+            self._unshare()
         self._items[name] = value
+        if self.globals is not None and self.globals.has_slot(name):
+            self.globals = None  # We hide one of the global slots
 
     def contains(self, name):
         return name in self._items
@@ -83,7 +176,102 @@ class Env:
 
     def __str__(self):
         ret = ""
-        for k, v in self._items.items():
+        for k, v in self.local_items().items():
             ret += "%s=%s\n" % (k, v)
         ret += ".\n" + str(self._parent)
         return ret
+
+
+class SlotEnv(Env):
+    """
+    An Env whose names are partly known in advance (e.g. the parameters
+    of a function), and are stored in the list slots instead of in a
+    dict.  Code that knows a name's index (see resolve_cell) can read
+    and write slots directly, without looking anything up by name.
+    Looking names up works exactly as it does for Env.
+
+    A SlotEnv made with is_globals=True holds a program's globals.  Every
+    Env inside it has it as its globals attribute, so code can find a
+    global's slot without searching for it, unless that Env or one of
+    those in between hides the global with a name of its own, in which
+    case globals is None, and names must be looked up as normal.
+    """
+
+    def __init__(self, parent, slot_names, slots, is_globals=False):
+        """
+        slot_names maps each known name to its index in slots, and may
+        be shared between many SlotEnvs.
+        """
+        super().__init__(parent=parent)
+        self._slot_names = slot_names
+        self.slots = slots
+        self._slots_shared = False
+        self._is_globals = is_globals
+        if is_globals:
+            self.globals = self
+        elif self.globals is not None:
+            if any(self.globals.has_slot(name) for name in slot_names):
+                self.globals = None
+
+    def clone(self):
+        ret = SlotEnv(
+            self._parent.clone(),
+            self._slot_names,
+            self.slots,
+            self._is_globals,
+        )
+        if self.globals is None:
+            ret.globals = None
+        ret._slots_shared = self._slots_shared = True
+        self._share_items_with(ret)
+        return ret
+
+    def has_slot(self, name):
+        return name in self._slot_names
+
+    def get_slot(self, idx):
+        return self.slots[idx]
+
+    def set_slot(self, idx, value):
+        """
+        Change the value in slots[idx].  Always use this instead of
+        assigning to slots directly, because slots may be shared
+        with a clone.
+        """
+        if self._slots_shared:
+            self.slots = list(self.slots)
+            self._slots_shared = False
+        self.slots[idx] = value
+
+    def _find(self, name):
+        idx = self._slot_names.get(name)
+        if idx is not None:
+            return self.slots[idx]
+        elif name in self._items:
+            return self._items[name]
+        elif self._parent is not None:
+            return self._parent._find(name)
+        else:
+            return _not_found
+
+    def _try_update(self, name, value):
+        idx = self._slot_names.get(name)
+        if idx is not None:
+            self.set_slot(idx, value)
+            return True
+        return super()._try_update(name, value)
+
+    def set_new(self, name, value):
+        idx = self._slot_names.get(name)
+        if idx is not None:
+            self.set_slot(idx, value)
+        else:
+            super().set_new(name, value)
+
+    def contains(self, name):
+        return name in self._slot_names or super().contains(name)
+
+    def local_items(self):
+        ret = {k: self.slots[i] for k, i in self._slot_names.items()}
+        ret.update(self._items)
+        return ret
@@ -1,4 +1,3 @@
-import inspect
 from typing import List
 import attr
 
@@ -21,22 +20,22 @@ from graftlib.nativefunctionvalue import NativeFunctionValue
 from graftlib.numbervalue import NumberValue
 
 
-@attr.s
+@attr.s(slots=True)
 class NoneValue:
     pass
 
 
-@attr.s
+@attr.s(slots=True)
 class ArrayValue:
     value: List = attr.ib()
 
 
-@attr.s
+@attr.s(slots=True)
 class StringValue:
     value: str = attr.ib()
 
 
-@attr.s
+@attr.s(slots=True)
 class UserFunctionValue:
     params: List = attr.ib()
     body: List = attr.ib()
@@ -93,12 +92,12 @@ def _modify(expr: ModifyTree, env):
     return env.get(var_name)
 
 
-def fail_if_wrong_number_of_args(fn_name, params, args):
-    if len(params) != len(args):
+def fail_if_wrong_number_of_args(fn_name, num_params, num_args):
+    if num_params != num_args:
         raise Exception((
             "%d arguments passed to function %s, but it " +
             "requires %d arguments."
-        ) % (len(args), fn_name, len(params)))
+        ) % (num_args, fn_name, num_params))
 
 
 def _function_call(expr, env):
@@ -107,14 +106,13 @@ def _function_call(expr, env):
     typ = type(fn)
 
     if typ == UserFunctionValue:
-        fail_if_wrong_number_of_args(expr.fn, fn.params, args)
-        new_env = fn.env.make_child()
+        fail_if_wrong_number_of_args(expr.fn, len(fn.params), len(args))
+        new_env = env.make_call_env(fn.env)
         for p, a in zip(fn.params, args):
             new_env.set_new(p.value, a)
         return eval_cell_list(fn.body, new_env)
     elif typ == NativeFunctionValue:
-        params = inspect.getfullargspec(fn.py_fn).args
-        fail_if_wrong_number_of_args(expr.fn, params[1:], args)
+        fail_if_wrong_number_of_args(expr.fn, fn.arity, len(args))
         return fn.py_fn(env, *args)
     else:
         raise Exception(
@@ -1,3 +1,4 @@
+from collections import deque
 from typing import Iterable, List, Union
 import itertools
 import attr
@@ -62,12 +63,85 @@ class Extents:
         )
 
     def add(self, pt: Pt):
+        # Not elif: the first point after reset() is both min and max
         if pt.x < self._x_min:
             self._x_min = pt.x
-        elif pt.x > self._x_max:
+        if pt.x > self._x_max:
             self._x_max = pt.x
 
         if pt.y < self._y_min:
             self._y_min = pt.y
-        elif pt.y > self._y_max:
+        if pt.y > self._y_max:
             self._y_max = pt.y
+
+
+@attr.s
+class _WindowMin:
+    """
+    The smallest value (or, if sign is -1, the largest) in a window of
+    values that are added at the back and removed from the front.
+
+    Values that can never be the smallest again are dropped as soon as
+    a smaller one arrives, so each value is added and dropped only once.
+    """
+    sign: int = attr.ib()
+    _items: deque = attr.ib(attr.Factory(deque), init=False)
+
+    def push(self, index: int, value: float):
+        value *= self.sign
+        items = self._items
+        while items and items[-1][1] >= value:
+            items.pop()
+        items.append((index, value))
+
+    def value(self, first_index: int, default: float) -> float:
+        items = self._items
+        while items and items[0][0] < first_index:
+            items.popleft()
+        return items[0][1] * self.sign if items else default
+
+
+@attr.s
+class WindowExtents:
+    """
+    The extents of the strokes in a window that strokes are added to
+    at the back and removed from at the front, like Animation.strokes,
+    kept up to date as they come and go instead of worked out again
+    from all the strokes every time.
+    """
+    _first: int = attr.ib(0, init=False)  # Oldest stroke still here
+    _next: int = attr.ib(0, init=False)  # Index of the next stroke added
+    _x_min: _WindowMin = attr.ib(attr.Factory(lambda: _WindowMin(1)))
+    _x_max: _WindowMin = attr.ib(attr.Factory(lambda: _WindowMin(-1)))
+    _y_min: _WindowMin = attr.ib(attr.Factory(lambda: _WindowMin(1)))
+    _y_max: _WindowMin = attr.ib(attr.Factory(lambda: _WindowMin(-1)))
+
+    def add_cmd(self, cmd):
+        if type(cmd) == Elided:
+            self.add_cmd(cmd.item)
+            return
+
+        if type(cmd) == Line:
+            self._add(cmd.start)
+            self._add(cmd.end)
+        else:  # Dot
+            self._add(cmd.pos)
+        self._next += 1
+
+    def _add(self, pt: Pt):
+        self._x_min.push(self._next, pt.x)
+        self._x_max.push(self._next, pt.x)
+        self._y_min.push(self._next, pt.y)
+        self._y_max.push(self._next, pt.y)
+
+    def remove_oldest(self, num: int):
+        self._first += num
+
+    def extents(self) -> Extents:
+        """The extents of the strokes in the window right now."""
+        ret = Extents()
+        ret._x_min = self._x_min.value(self._first, ret._x_min)
+        ret._x_max = self._x_max.value(self._first, ret._x_max)
+        ret._y_min = self._y_min.value(self._first, ret._y_min)
+        ret._y_max = self._y_max.value(self._first, ret._y_max)
+        return ret
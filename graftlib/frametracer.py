@@ -0,0 +1,133 @@
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, List, Optional, TextIO
+import json
+import time
+
+
+# How many frames to average over when working out frames per second
+fps_frames = 20
+
+
+class FrameTracer:
+    """
+    Times each stage (running the program, drawing, encoding ...) of
+    every frame of an animation.
+
+    If file is given, every stage is written to it as it finishes, as
+    Chrome trace events (see chrome://tracing or ui.perfetto.dev), so
+    nested stages show up inside the ones that called them.
+
+    last_frame holds how long each stage of the last finished frame took
+    in seconds, not including the stages inside it, for showing on
+    screen.
+    """
+
+    def __init__(self, file: Optional[TextIO] = None):
+        self.file = file
+        self.frame = 0
+        self.last_frame: Dict[str, float] = {}
+        self._this_frame: Dict[str, float] = {}
+        self._frame_starts = deque(maxlen=fps_frames)
+        self._start = time.perf_counter()
+
+        # For each stage running now, the time spent in stages inside it
+        self._inner_times: List[float] = []
+
+        if file is not None:
+            file.write("[\n")
+
+    def next_frame(self):
+        """Call when a new frame starts."""
+        self._frame_starts.append(time.perf_counter())
+        self.last_frame = self._this_frame
+        self._this_frame = {}
+        self.frame += 1
+
+    def fps(self) -> float:
+        """Frames per second, over the last few frames."""
+        starts = self._frame_starts
+        if len(starts) < 2:
+            return 0.0
+        return (len(starts) - 1) / (starts[-1] - starts[0])
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the code in this with block as the stage called name."""
+        self._inner_times.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self_time = elapsed - self._inner_times.pop()
+            if self._inner_times:
+                self._inner_times[-1] += elapsed
+            self._this_frame[name] = (
+                self._this_frame.get(name, 0.0) + self_time)
+            if self.file is not None:
+                self._write_event(name, start, elapsed)
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterable:
+        """Iterate over iterable, timing each step as the stage name."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _write_event(self, name: str, start: float, elapsed: float):
+        event = {
+            "name": name,
+            "ph": "X",  # A "complete" event, with a duration
+            "ts": (start - self._start) * 1_000_000,
+            "dur": elapsed * 1_000_000,
+            "pid": 1,
+            "tid": 1,
+            "args": {"frame": self.frame},
+        }
+        self.file.write(json.dumps(event) + ",\n")
+
+    def close(self):
+        """Finish writing the trace file, if we have one."""
+        if self.file is not None:
+            self.file.write(
+                json.dumps(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": 1,
+                        "tid": 1,
+                        "args": {"name": "graft"},
+                    }
+                ) + "\n]\n"
+            )
+            self.file.close()
+            self.file = None
+
+
+class NullTracer:
+    """A FrameTracer that does nothing, for when we are not tracing."""
+
+    last_frame: Dict[str, float] = {}
+
+    def next_frame(self):
+        pass
+
+    def fps(self) -> float:
+        return 0.0
+
+    def stage(self, _name: str):
+        return nullcontext()
+
+    def iterate(self, _name: str, iterable: Iterable) -> Iterable:
+        return iterable
+
+    def close(self):
+        pass
+
+
+null_tracer = NullTracer()
@@ -9,10 +9,47 @@ from graftlib.numbervalue import NumberValue
 from graftlib.pt import Pt
 
 
-def _calc_step(env):
-    th = theta(env)
-    s = step_size(env)
-    old_pos = pos(env)
+# The turtle variables live in the slots of the program's global
+# SlotEnv (see make_graft_env), in this order, so natives can read and
+# write them by index.  xprev and yprev are not among them, because
+# they don't exist until something moves, and moving inside a function
+# creates them there.
+turtle_names = ("x", "y", "d", "s", "r", "g", "b", "a", "z")
+turtle_slots = {name: i for i, name in enumerate(turtle_names)}
+
+_x, _y, _d, _s, _r, _g, _b, _a, _z = range(len(turtle_names))
+
+
+class _TurtleByName:
+    """
+    Stands in for the global SlotEnv when the turtle variables can't be
+    found by index, e.g. because a function parameter is called x, by
+    looking them up by name instead.
+    """
+
+    def __init__(self, env):
+        self._env = env
+
+    def get_slot(self, idx):
+        return self._env.get(turtle_names[idx])
+
+    def set_slot(self, idx, value):
+        self._env.set(turtle_names[idx], value)
+
+
+def turtle(env):
+    """
+    Return something whose get_slot and set_slot methods read and write
+    the turtle variables visible from env (a ProgramEnv) by index.
+    """
+    ret = env.globals
+    return _TurtleByName(env.env) if ret is None else ret
+
+
+def _calc_step(t):
+    th = 2 * math.pi * (t.get_slot(_d).value / 360.0)
+    s = t.get_slot(_s).value
+    old_pos = Pt(t.get_slot(_x).value, t.get_slot(_y).value)
     new_pos = Pt(
         old_pos.x + s * math.sin(th),
         old_pos.y + s * math.cos(th),
@@ -20,43 +57,63 @@ def _calc_step(env):
     return old_pos, new_pos
 
 
+def _set_pos(env, t, pos: Pt):
+    env.env.set("xprev", t.get_slot(_x))
+    env.env.set("yprev", t.get_slot(_y))
+    t.set_slot(_x, NumberValue(pos.x))
+    t.set_slot(_y, NumberValue(pos.y))
+
+
+def _color(t) -> Tuple[float, float, float, float]:
+    return (
+        t.get_slot(_r).value,
+        t.get_slot(_g).value,
+        t.get_slot(_b).value,
+        t.get_slot(_a).value,
+    )
+
+
 def step(env):
-    old_pos, new_pos = _calc_step(env)
-    set_pos(env, new_pos)
+    t = turtle(env)
+    old_pos, new_pos = _calc_step(t)
+    _set_pos(env, t, new_pos)
     env.stroke(
         Line(
             old_pos,
             new_pos,
-            color=color(env),
-            size=brush_size(env)
+            color=_color(t),
+            size=t.get_slot(_z).value
         )
     )
 
 
 def dot(env):
+    t = turtle(env)
     env.stroke(
         Dot(
-            pos(env),
-            color(env),
-            brush_size(env)
+            Pt(t.get_slot(_x).value, t.get_slot(_y).value),
+            _color(t),
+            t.get_slot(_z).value
         )
     )
 
 
 def line_to(env):
+    t = turtle(env)
     env.stroke(
         Line(
-            prev_pos(env),
-            pos(env),
-            color=color(env),
-            size=brush_size(env),
+            Pt(env.env.get("xprev").value, env.env.get("yprev").value),
+            Pt(t.get_slot(_x).value, t.get_slot(_y).value),
+            color=_color(t),
+            size=t.get_slot(_z).value,
         )
     )
 
 
 def jump(env):
-    _, new_pos = _calc_step(env)
-    set_pos(env, new_pos)
+    t = turtle(env)
+    _, new_pos = _calc_step(t)
+    _set_pos(env, t, new_pos)
 
 
 def random(env):
@@ -67,42 +124,5 @@ def fork(env):
     return env.fork_callback.__call__()
 
 
-def theta(self) -> float:
-    """Angle we are facing in radians"""
-    return 2 * math.pi * (self.env.get("d").value / 360.0)
-
-
-def prev_pos(self) -> Pt:
-    return Pt(self.env.get("xprev").value, self.env.get("yprev").value)
-
-
-def pos(self) -> Pt:
-    return Pt(self.env.get("x").value, self.env.get("y").value)
-
-
-def set_pos(self, pos: Pt):
-    self.env.set("xprev", self.env.get("x"))
-    self.env.set("yprev", self.env.get("y"))
-    self.env.set("x", NumberValue(pos.x))
-    self.env.set("y", NumberValue(pos.y))
-
-
-def step_size(self) -> float:
-    return self.env.get("s").value
-
-
-def color(self) -> Tuple[float, float, float, float]:
-    return (
-        self.env.get("r").value,
-        self.env.get("g").value,
-        self.env.get("b").value,
-        self.env.get("a").value,
-    )
-
-
-def brush_size(self) -> float:
-    return self.env.get("z").value
-
-
 def set_fork_id(self, new_id):
     self.env.set("f", NumberValue(new_id))
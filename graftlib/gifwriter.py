@@ -0,0 +1,235 @@
+from typing import BinaryIO, List
+import struct
+
+from graftlib.videowriter import packed_pixels
+
+
+# Graft's colours are mixed from r, g and b in 0-100, usually in steps
+# of 10 or 20 or so, and drawn on white.  So our palette is every mix of
+# 6 levels (0, 20, 40 ... 100) of each, plus extra greys for the soft
+# edges of lines drawn in black or grey.  Colours between the levels are
+# dithered, so they don't come out in bands.
+_levels = 6
+_num_greys = 256 - _levels ** 3
+
+
+def _make_palette() -> List[int]:
+    ret = []
+    for r in range(_levels):
+        for g in range(_levels):
+            for b in range(_levels):
+                ret.append(
+                    (
+                        (r * 255 // (_levels - 1)) << 16 |
+                        (g * 255 // (_levels - 1)) << 8 |
+                        (b * 255 // (_levels - 1))
+                    )
+                )
+    for i in range(1, _num_greys + 1):
+        grey = round(i * 255 / (_num_greys + 1))
+        ret.append(grey << 16 | grey << 8 | grey)
+    return ret
+
+
+palette = _make_palette()
+
+
+# Ordered dithering: how far towards the next level up a colour must be
+# to use it (in sixteenths), at each position in a 4x4 tile of pixels.
+_bayer = [
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+]
+_tile = len(_bayer)
+
+
+def _level(c: int, threshold: float) -> int:
+    return min(int(c * (_levels - 1) / 255 + threshold), _levels - 1)
+
+
+def _grey_index(c: int) -> int:
+    greys = [
+        (i, rgb & 0xff)
+        for i, rgb in enumerate(palette)
+        if rgb >> 16 == rgb & 0xff == (rgb >> 8) & 0xff
+    ]
+    return min(greys, key=lambda ig: abs(ig[1] - c))[0]
+
+
+class _PaletteIndices(dict):
+    """
+    Maps a 0xAARRGGBB pixel to its index in palette, remembering it.
+    Greys use the nearest grey.  Other colours are rounded up to the
+    next level if they are more than threshold (0-1) of the way to it.
+    """
+
+    def __init__(self, threshold: float):
+        super().__init__()
+        self.threshold = threshold
+
+    def __missing__(self, pixel: int) -> int:
+        r = (pixel >> 16) & 0xff
+        g = (pixel >> 8) & 0xff
+        b = pixel & 0xff
+        if r == g == b:
+            ret = _grey_index(r)
+        else:
+            t = self.threshold
+            ret = (
+                (_level(r, t) * _levels + _level(g, t)) * _levels +
+                _level(b, t)
+            )
+        self[pixel] = ret
+        return ret
+
+
+def lzw_encode(indices: bytes, min_code_size: int = 8) -> bytes:
+    """Compress indices using the variable-length LZW that GIF uses."""
+    clear = 1 << min_code_size
+    end = clear + 1
+    out = bytearray()
+
+    def reset():
+        return {}, end + 1, min_code_size + 1
+
+    table, next_code, code_size = reset()
+    bits = clear
+    num_bits = code_size
+
+    prefix = indices[0]
+    for index in indices[1:]:
+        key = prefix << 8 | index
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        bits |= prefix << num_bits
+        num_bits += code_size
+        while num_bits >= 8:
+            out.append(bits & 0xff)
+            bits >>= 8
+            num_bits -= 8
+
+        if next_code < 4096:
+            table[key] = next_code
+            if next_code == 1 << code_size:
+                code_size += 1
+            next_code += 1
+        else:
+            bits |= clear << num_bits
+            num_bits += code_size
+            table, next_code, code_size = reset()
+        prefix = index
+
+    for code in (prefix, end):
+        bits |= code << num_bits
+        num_bits += code_size
+        if code == prefix and next_code == 1 << code_size < 4096:
+            code_size += 1
+    while num_bits > 0:
+        out.append(bits & 0xff)
+        bits >>= 8
+        num_bits -= 8
+    return bytes(out)
+
+
+def _sub_blocks(data: bytes) -> bytes:
+    ret = bytearray()
+    for i in range(0, len(data), 255):
+        block = data[i:i + 255]
+        ret.append(len(block))
+        ret.extend(block)
+    ret.append(0)
+    return bytes(ret)
+
+
+class GifWriter:
+    """
+    Writes an animated GIF to file one frame at a time, from the ARGB32
+    pixel data that cairo draws into, so nothing has to be kept in
+    memory or on disk until the end.
+
+    Only the rows that changed since the previous frame are written.
+    delay is the time each frame is shown for, in hundredths of a second.
+    """
+
+    def __init__(self, file: BinaryIO, width: int, height: int, delay=5):
+        self.file = file
+        self.width = width
+        self.height = height
+        self.delay = delay
+        self._indices = [
+            [_PaletteIndices((t + 0.5) / _tile ** 2) for t in row]
+            for row in _bayer
+        ]
+        self._previous = None
+
+        file.write(b"GIF89a")
+        # Global colour table of 256 colours
+        file.write(struct.pack("<HHBBB", width, height, 0xf7, 0, 0))
+        for rgb in palette:
+            file.write(bytes((rgb >> 16, (rgb >> 8) & 0xff, rgb & 0xff)))
+        # Loop forever
+        file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def add_frame(self, data, stride: int):
+        """
+        Add a frame, given the pixel data of a cairo ImageSurface with
+        FORMAT_ARGB32 and the same size as this GIF, and its stride.
+        """
+        w = self.width
+        pixels = memoryview(
+            packed_pixels(data, w, self.height, stride)).cast("I")
+        indices = bytearray(len(pixels))
+        for y in range(self.height):
+            start = y * w
+            end = start + w
+            for x, lookup in enumerate(self._indices[y % _tile]):
+                indices[start + x:end:_tile] = bytes(
+                    map(lookup.__getitem__, pixels[start + x:end:_tile]))
+        indices = bytes(indices)
+
+        top, bottom = self._changed_rows(indices)
+        self._previous = indices
+        self._write_image(
+            top,
+            bottom - top,
+            indices[top * w:bottom * w],
+        )
+
+    def _changed_rows(self, indices: bytes):
+        """Return the range of rows that differ from the previous frame."""
+        w = self.width
+        h = self.height
+        prev = self._previous
+        if prev is None:
+            return 0, h
+
+        def same(y):
+            return indices[y * w:(y + 1) * w] == prev[y * w:(y + 1) * w]
+
+        top = 0
+        while top < h and same(top):
+            top += 1
+        if top == h:
+            return 0, 1  # Nothing changed - rewrite one row to keep time
+        bottom = h
+        while same(bottom - 1):
+            bottom -= 1
+        return top, bottom
+
+    def _write_image(self, top: int, height: int, indices: bytes):
+        # Graphic control extension: don't dispose of the previous frame,
+        # so we only need to draw what changed.
+        self.file.write(
+            struct.pack("<BBBBHBB", 0x21, 0xf9, 4, 1 << 2, self.delay, 0, 0))
+        self.file.write(
+            struct.pack("<BHHHHB", 0x2c, 0, top, self.width, height, 0))
+        self.file.write(b"\x08")
+        self.file.write(_sub_blocks(lzw_encode(indices)))
+
+    def close(self):
+        self.file.write(b"\x3b")
@@ -1,8 +1,10 @@
-from typing import Iterable, List, Optional
+from collections import deque
+from typing import Deque, Iterable, List, Optional
 
 import attr
 
 from graftlib import functions
+from graftlib.batchrun import BatchRunner
 from graftlib.dot import Dot
 from graftlib.labeltree import LabelTree
 from graftlib.line import Line
@@ -37,11 +39,21 @@ class RunningProgram:
     def set_label(self):
         self.label = self.pc
 
-    def next(self) -> List:
+    def peek_statement(self):
+        """The statement that next() will run."""
+        if self.pc >= len(self.program):
+            return self.program[self.label]
+        return self.program[self.pc]
+
+    def skip_statement(self):
+        """Move on as if next() had run the statement it was about to."""
         if self.pc >= len(self.program):
             self.pc = self.label
-        statement = self.program[self.pc]
         self.pc += 1
+
+    def next(self) -> List:
+        statement = self.peek_statement()
+        self.skip_statement()
         self.statement(statement)
         return self.env.clear_strokes()
 
@@ -53,12 +65,15 @@ class RunningProgram:
             self.eval_expr(self.env, statement)
 
     def fork(self):
+        # The program is never modified, so the fork can share it.
+        # Clone only the Env inside our ProgramEnv, because the fork
+        # wraps it in a ProgramEnv of its own.
         return self.fork_callback.__call__(
             RunningProgram(
-                list(self.program),
+                self.program,
                 self.rand,
                 self.fork_callback,
-                self.env.clone(),
+                self.env.env.clone(),
                 self.eval_expr,
                 self.pc,
                 self.label,
@@ -66,15 +81,48 @@ class RunningProgram:
         )
 
 
-def empty(queue: List) -> bool:
+def empty(queue) -> bool:
     return len(queue) == 0
 
 
+def evict_oldest(programs: Deque, num: int) -> List:
+    """Drop the num forks that were created first, and return them."""
+    return [programs.popleft() for _ in range(num)]
+
+
+def evict_newest(programs: Deque, num: int) -> List:
+    """
+    Drop the num forks that were created last, and return them.
+    Once we are full, this means new forks never get to run.
+    """
+    return [programs.pop() for _ in range(num)]
+
+
+@attr.s
+class SchedulerStats:
+    """
+    Counts of what MultipleRunningPrograms has done: how many forks
+    it has dropped, the most strokes any fork has had waiting, and how
+    many strokes are waiting now, in all forks.
+    """
+    evictions: int = attr.ib(default=0)
+    max_queue_depth: int = attr.ib(default=0)
+    queued: int = attr.ib(default=0)
+
+
 class MultipleRunningPrograms:
-    def __init__(self, program: List, rand, max_forks: int, eval_expr):
-        # programs is a list of (RunningProgram, queue)
-        # where queue is a list of commands already returned by that program,
-        # waiting to be returned.
+    def __init__(
+            self,
+            program: List,
+            rand,
+            max_forks: int,
+            eval_expr,
+            batch: bool = False,
+            evict=evict_oldest,
+    ):
+        # programs is a deque of (RunningProgram, queue)
+        # where queue is a deque of commands already returned by that
+        # program, waiting to be returned.
         initial_program = RunningProgram(
             program,
             rand,
@@ -82,10 +130,13 @@ class MultipleRunningPrograms:
             make_graft_env(),
             eval_expr,
         )
-        self.programs = [(initial_program, [])]
+        self.programs: Deque = deque([(initial_program, deque())])
         self.max_forks = max_forks
+        self.evict = evict
         self.new_programs = []
         self._fork_id_counter = 0
+        self.batch_runner = BatchRunner() if batch else None
+        self.stats = SchedulerStats()
 
     def next_fork_id(self):
         self._fork_id_counter += 1
@@ -94,30 +145,44 @@ class MultipleRunningPrograms:
     def next(self):
         # Ensure each queue has at least 1 thing in it
 
+        stats = self.stats
+        if self.batch_runner is not None:
+            stats.queued += self.batch_runner.run(self.programs)
+
         for prog, queue in self.programs:
             if empty(queue):
                 queue.extend(prog.next())
+                stats.queued += len(queue)
+                if len(queue) > stats.max_queue_depth:
+                    stats.max_queue_depth = len(queue)
             if empty(queue):
                 queue.append(None)
+                stats.queued += 1
 
         ret = []
         for prog, queue in self.programs:
             # Note: return a reference to env.  In eval_debug we
             # will copy it if needed.
-            ret.append((queue.pop(0), prog.env))
+            ret.append((queue.popleft(), prog.env))
+        stats.queued -= len(ret)
 
         self.programs.extend(self.new_programs)
         self.new_programs = []
         if len(self.programs) > self.max_forks:
-            self.programs = self.programs[
-                len(self.programs) - self.max_forks:
-            ]
+            evicted = self.evict(
+                self.programs, len(self.programs) - self.max_forks)
+            stats.evictions += len(evicted)
+            stats.queued -= sum(len(queue) for _, queue in evicted)
 
         return ret
 
+    def queued(self) -> int:
+        """How many strokes are waiting to be returned, in all forks."""
+        return self.stats.queued
+
     def fork(self, cloned_running_program: RunningProgram):
         functions.set_fork_id(cloned_running_program.env, self.next_fork_id())
-        self.new_programs.append((cloned_running_program, []))
+        self.new_programs.append((cloned_running_program, deque()))
 
 
 @attr.s
@@ -147,11 +212,37 @@ class FramesCounter:
             raise StopIteration()
 
 
-def _run_program(program: Iterable, rand, max_forks, eval_expr) -> Iterable:
-    progs = MultipleRunningPrograms(list(program), rand, max_forks, eval_expr)
-    while True:
-        # Run a line of code, and get back the animation frame(s) that result
-        yield progs.next()
+def _run_program(
+        program: Iterable,
+        rand,
+        max_forks,
+        eval_expr,
+        batch=False,
+        workers=None,
+        programs_listener=None,
+        evict=evict_oldest,
+) -> Iterable:
+    if workers is None:
+        progs = MultipleRunningPrograms(
+            list(program), rand, max_forks, eval_expr, batch, evict)
+        if programs_listener is not None:
+            programs_listener(progs)
+    else:
+        # Imported here because shardrun uses RunningProgram
+        from graftlib.shardrun import ShardedRunningPrograms
+        if evict is not evict_oldest:
+            raise Exception("Workers can only evict the oldest forks.")
+        seed = int(rand(0, 2 ** 32))
+        progs = ShardedRunningPrograms(
+            list(program), seed, max_forks, eval_expr, workers, batch)
+    try:
+        while True:
+            # Run a line of code, and get back the animation frame(s)
+            # that result
+            yield progs.next()
+    finally:
+        if workers is not None:
+            progs.close()
 
 
 def copy_envs(parallel_commands):
@@ -183,14 +274,36 @@ def graftrun(
     n: Optional[int],
     rand,
     max_forks,
-    eval_expr
+    eval_expr,
+    batch=False,
+    workers=None,
+    programs_listener=None,
+    evict=evict_oldest,
 ) -> Iterable:
     """
     Run the supplied program for n steps, or forever if n is None.
+    If batch is True, forks that are at the same point in the program
+    run simple statements together (see batchrun), which needs numpy.
+    If workers is a number, forks run in that many worker processes,
+    each with its own random numbers (see shardrun).
+    If programs_listener is supplied, and workers is not, it is called
+    with the MultipleRunningPrograms running the forks before they start.
+    When there are more than max_forks forks, evict chooses which to
+    drop (see evict_oldest and evict_newest).
     """
 
     frames_counter = FramesCounter(n)
-    for cmds_envs in _run_program(program, rand, max_forks, eval_expr):
+    cmds_envs_iter = _run_program(
+        program,
+        rand,
+        max_forks,
+        eval_expr,
+        batch,
+        workers,
+        programs_listener,
+        evict,
+    )
+    for cmds_envs in cmds_envs_iter:
         commands = [x[0] for x in cmds_envs]
         if any(commands):
             yield commands
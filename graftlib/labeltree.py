@@ -1,6 +1,9 @@
+from typing import Optional
 import attr
 
+from graftlib.lex_cell import source_pos
 
-@attr.s
+
+@attr.s(slots=True)
 class LabelTree:
-    pass
+    pos: Optional[int] = source_pos()
@@ -1,216 +1,216 @@
+from typing import Optional
 import re
 import attr
 
-from graftlib.peekablestream import PeekableStream
 
+def source_pos():
+    """
+    An attribute holding where a token or tree starts in the program,
+    counting characters from 0, or None if it wasn't made from source
+    code.  It is ignored when comparing.
+    """
+    return attr.ib(default=None, cmp=False, repr=False, kw_only=True)
 
-@attr.s
+
+@attr.s(slots=True)
 class AssignmentToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return "="
 
 
-@attr.s
+@attr.s(slots=True)
 class EndArrayToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return "]"
 
 
-@attr.s
+@attr.s(slots=True)
 class EndFunctionDefToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return "}"
 
 
-@attr.s
+@attr.s(slots=True)
 class EndParamListToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return ")"
 
 
-@attr.s
+@attr.s(slots=True)
 class LabelToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return "^"
 
 
-@attr.s
+@attr.s(slots=True)
 class ListSeparatorToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return ","
 
 
-@attr.s
+@attr.s(slots=True)
 class ModifyToken:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
 
     def code(self):
         return self.value
 
 
-@attr.s
+@attr.s(slots=True)
 class NumberToken:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
 
     def code(self):
         return self.value
 
 
-@attr.s
+@attr.s(slots=True)
 class OperatorToken:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
 
     def code(self):
         return self.value
 
 
-@attr.s
+@attr.s(slots=True)
 class ParamListPreludeToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return ":"
 
 
-@attr.s
+@attr.s(slots=True)
 class StartArrayToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return "["
 
 
-@attr.s
+@attr.s(slots=True)
 class StartFunctionDefToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return "{"
 
 
-@attr.s
+@attr.s(slots=True)
 class StartParamListToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return "("
 
 
-@attr.s
+@attr.s(slots=True)
 class StatementSeparatorToken:
+    pos: Optional[int] = source_pos()
+
     @staticmethod
     def code():
         return " "
 
 
-@attr.s
+@attr.s(slots=True)
 class StringToken:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
 
     def code(self):
         return '"%s"' % self.value
 
 
-@attr.s
+@attr.s(slots=True)
 class SymbolToken:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
 
     def code(self):
         return self.value
 
 
-def _scan(first_char, chars, allowed):
-    ret = first_char
-    p = chars.next
-    while p is not None and re.match(allowed, p):
-        ret += chars.move_next()
-        p = chars.next
-    return ret
-
-
-def _scan_string(delim, chars):
-    ret = ""
-    while chars.next != delim:
-        c = chars.move_next()
-        if c is None:
-            raise Exception("A string ran off the end of the program.")
-        ret += c
-    chars.move_next()
-    return ret
-
-
-def _is_whitespace(c):
-    if c is None:
-        return False
-    else:
-        return c in " \n"
+# Every token, or a character that can't start one, in one regular
+# expression, so lex_cell can find them all in a single pass.
+_token_regex = re.compile(
+    r"""
+    (?P<space>[ \n]+)
+    | (?P<number>[.0-9]+)
+    | (?P<symbol>[_a-zA-Z][_a-zA-Z0-9]*)
+    | (?P<modify>[-+*/]=)
+    | (?P<operator>==|[<>]=|[-+*/<>])
+    | (?P<string>"[^"]*"|'[^']*')
+    | (?P<punctuation>[(){}\[\],:=^])
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+_punctuation = {
+    "(": StartParamListToken,
+    ")": EndParamListToken,
+    "{": StartFunctionDefToken,
+    "}": EndFunctionDefToken,
+    "[": StartArrayToken,
+    "]": EndArrayToken,
+    ",": ListSeparatorToken,
+    ":": ParamListPreludeToken,
+    "=": AssignmentToken,
+    "^": LabelToken,
+}
 
 
 def lex_cell(chars_iter):
-    chars = PeekableStream(chars_iter)
-
-    while True:
-        if _is_whitespace(chars.next):
-            chars.move_next()
-            yield StatementSeparatorToken()
-            while _is_whitespace(chars.next):
-                chars.move_next()
-
-        if chars.next is None:
-            break
-
-        c = chars.move_next()
-
-        if c == "(":
-            yield StartParamListToken()
-        elif c == ")":
-            yield EndParamListToken()
-        elif c == "{":
-            yield StartFunctionDefToken()
-        elif c == "}":
-            yield EndFunctionDefToken()
-        elif c == "[":
-            yield StartArrayToken()
-        elif c == "]":
-            yield EndArrayToken()
-        elif c == ",":
-            yield ListSeparatorToken()
-        elif c == ":":
-            yield ParamListPreludeToken()
-        elif c == "=":
-            nc = chars.next
-            if nc == "=":
-                chars.move_next()
-                yield OperatorToken(c + nc)
-            else:
-                yield AssignmentToken()
-        elif c == "^":
-            yield LabelToken()
-
-        elif c in "+-*/<>":
-            nc = chars.next
-            if nc == "=":
-                chars.move_next()
-                if c in "+-*/":
-                    yield ModifyToken(c + nc)
-                else:
-                    yield OperatorToken(c + nc)
-            else:
-                yield OperatorToken(c)
-
-        elif c in ("'", '"'):
-            yield StringToken(_scan_string(c, chars))
-
-        elif re.match("[.0-9]", c):
-            yield NumberToken(_scan(c, chars, "[.0-9]"))
-
-        elif re.match("[_a-zA-Z]", c):
-            yield SymbolToken(_scan(c, chars, "[_a-zA-Z0-9]"))
-
-        elif c == "\t":
+    source = chars_iter if type(chars_iter) == str else "".join(chars_iter)
+
+    for match in _token_regex.finditer(source):
+        kind = match.lastgroup
+        pos = match.start()
+        text = match.group()
+        if kind == "space":
+            yield StatementSeparatorToken(pos=pos)
+        elif kind == "symbol":
+            yield SymbolToken(text, pos=pos)
+        elif kind == "punctuation":
+            yield _punctuation[text](pos=pos)
+        elif kind == "number":
+            yield NumberToken(text, pos=pos)
+        elif kind == "operator":
+            yield OperatorToken(text, pos=pos)
+        elif kind == "modify":
+            yield ModifyToken(text, pos=pos)
+        elif kind == "string":
+            yield StringToken(text[1:-1], pos=pos)
+        elif text in ("'", '"'):
+            raise Exception("A string ran off the end of the program.")
+        elif text == "\t":
             raise Exception("Tab characters are not allowed in Graft.")
-
         else:
-            raise Exception("Unrecognised character: '" + c + "'.")
+            raise Exception("Unrecognised character: '" + text + "'.")
@@ -5,7 +5,7 @@ import attr
 from graftlib.pt import Pt
 
 
-@attr.s(cmp=True, frozen=True)
+@attr.s(cmp=True, frozen=True, slots=True)
 class Line():
     start: Pt = attr.ib()
     end: Pt = attr.ib()
@@ -1,19 +1,32 @@
 from typing import Optional, Tuple
 from argparse import ArgumentParser
+import tracemalloc
 
 from graftlib.animation import Animation
+from graftlib.compile_cell import CellCompiler
 from graftlib.env import Env
 from graftlib.eval_cell import eval_cell
 from graftlib.eval_v1 import eval_v1
-from graftlib.graftrun import graftrun
+from graftlib.frametracer import FrameTracer, null_tracer
+from graftlib.graftrun import evict_newest, evict_oldest, graftrun
 from graftlib.lex_cell import lex_cell
 from graftlib.lex_v1 import lex_v1
+from graftlib.memreport import MemoryReporter
+from graftlib.optimise_cell import optimise_cell
 from graftlib.strokeoptimiser import StrokeOptimiser
+from graftlib.videowriter import Y4mWriter
 from graftlib.parse_cell import parse_cell
 from graftlib.parse_v1 import parse_v1
+from graftlib.profile_cell import CellProfiler
 from graftlib.world import World
 from graftlib.ui.gtk3ui import Gtk3Ui
 from graftlib.ui.gifui import GifUi
+from graftlib.ui.pipelineui import frame_ui
+from graftlib.ui.videoui import VideoUi
+
+
+# Which forks to drop when there are more than --max-forks, by --evict
+evict_policies = {"oldest": evict_oldest, "newest": evict_newest}
 
 
 # How many strokes we are allowed before we start deleting old ones.
@@ -44,6 +57,8 @@ def main_gif(
         filename: str,
         world: World,
         image_size: Tuple[int, int],
+        group_strokes: bool = False,
+        render_workers: Optional[int] = None,
 ) -> int:
     if frames is None:
         world.stderr.write(
@@ -52,11 +67,70 @@ def main_gif(
         )
         return 3
 
-    return GifUi(animation, filename, world, image_size).run()
+    return GifUi(
+        animation,
+        filename,
+        image_size,
+        group_strokes,
+        render_workers,
+    ).run()
+
+
+def main_video(
+        animation: Animation,
+        frames: Optional[int],
+        filename: str,
+        world: World,
+        image_size: Tuple[int, int],
+        group_strokes: bool = False,
+        render_workers: Optional[int] = None,
+) -> int:
+    if frames is None:
+        world.stderr.write(
+            "You must supply a --frames=n argument to use --video.\n")
+        return 3
+
+    return VideoUi(
+        animation,
+        filename,
+        image_size,
+        group_strokes,
+        render_workers,
+        world.stderr,
+    ).run()
 
 
-def main_gtk3(animation: Animation, image_size: Tuple[int, int]) -> int:
-    return Gtk3Ui(animation, image_size).run()
+def main_raw_frames(
+        animation: Animation,
+        filename: str,
+        world: World,
+        image_size: Tuple[int, int],
+        group_strokes: bool = False,
+        render_workers: Optional[int] = None,
+) -> int:
+    if filename == "-":
+        # stdout is normally text, so write to the bytes underneath it
+        out = getattr(world.stdout, "buffer", world.stdout)
+        writer = Y4mWriter(out, *image_size)
+        frame_ui(
+            animation, writer, image_size, group_strokes, render_workers
+        ).run()
+    else:
+        with open(filename, "wb") as f:
+            writer = Y4mWriter(f, *image_size)
+            frame_ui(
+                animation, writer, image_size, group_strokes, render_workers
+            ).run()
+    return 0
+
+
+def main_gtk3(
+        animation: Animation,
+        image_size: Tuple[int, int],
+        group_strokes: bool = False,
+        hud: bool = False,
+) -> int:
+    return Gtk3Ui(animation, image_size, group_strokes, hud).run()
 
 
 def make_animation(
@@ -64,16 +138,31 @@ def make_animation(
         frames: Optional[int],
         lookahead_steps: int,
         max_strokes: int,
+        tracer=null_tracer,
+        mem_reporter: Optional[MemoryReporter] = None,
 ):
     """
     Given the values from evaluating a program, return an iterator that
     optimises it, yielding actual strokes to draw on the screen, limited to the
     number of frames supplied, and using the random number generator supplied.
     """
-    opt = StrokeOptimiser(program_values)
+    opt = StrokeOptimiser(tracer.iterate("run", program_values))
+    commands = tracer.iterate("optimise", opt)
+    if mem_reporter is not None:
+        commands = mem_reporter.iterate(commands)
     frames = lookahead_steps if frames is None else frames
     lookahead = min(frames, lookahead_steps)
-    return Animation(opt, opt, lookahead, max_strokes, dot_size)
+    ret = Animation(
+        commands,
+        opt,
+        lookahead,
+        max_strokes,
+        dot_size,
+        tracer,
+    )
+    if mem_reporter is not None:
+        mem_reporter.watch(ret, opt)
+    return ret
 
 
 def main(world: World) -> int:
@@ -98,6 +187,43 @@ def main(world: World) -> int:
             "(Requires --frames=n where n > 0.)"
         ),
     )
+    argparser.add_argument(
+        '--video',
+        metavar="VIDEO_FILENAME",
+        help=(
+            "Make a video (e.g. .mp4 or .webm) instead of displaying on " +
+            "screen.  (Requires ffmpeg, and --frames=n where n > 0.)"
+        ),
+    )
+    argparser.add_argument(
+        '--raw-frames',
+        metavar="Y4M_FILENAME",
+        help=(
+            "Write the frames as an uncompressed y4m video to this file, " +
+            "or to standard output if it is -, e.g. to pipe into a video " +
+            "encoder or player."
+        ),
+    )
+    argparser.add_argument(
+        '--group-strokes',
+        action="store_true",
+        help=(
+            "Draw all the lines of the same colour and size at once, " +
+            "which is much faster with lots of strokes, but changes how " +
+            "overlapping see-through lines look."
+        ),
+    )
+    argparser.add_argument(
+        '--render-workers',
+        metavar="N",
+        type=int,
+        help=(
+            "Draw the frames of --gif, --video or --raw-frames in N " +
+            "worker processes, to use several CPU cores.  Each frame " +
+            "is drawn from scratch, so pixels may differ slightly from " +
+            "the default, which draws only the new strokes each frame."
+        ),
+    )
     argparser.add_argument(
         '--width',
         default=default_width,
@@ -116,6 +242,17 @@ def main(world: World) -> int:
         type=int,
         help="The number of forked lines that can run in parallel.",
     )
+    argparser.add_argument(
+        '--evict',
+        default="oldest",
+        choices=sorted(evict_policies),
+        help=(
+            "Which forked lines to stop when there are more than " +
+            "--max-forks: the oldest, or the newest (which means new " +
+            "forks never run once we are full).  (Only oldest can be " +
+            "used with --workers.)"
+        ),
+    )
     argparser.add_argument(
         '--max-strokes',
         default=default_max_strokes,
@@ -139,6 +276,94 @@ def main(world: World) -> int:
             "see SYNTAX_V1.md in the source repository."
         ),
     )
+    argparser.add_argument(
+        '--engine',
+        choices=["tree", "compiled"],
+        default="tree",
+        help=(
+            "Choose how cell syntax programs are run - tree walks the " +
+            "parsed program on every step, whereas compiled turns it " +
+            "into Python closures once and runs those, which is faster."
+        ),
+    )
+    argparser.add_argument(
+        '--legacy-operators',
+        action="store_true",
+        help=(
+            "Parse cell syntax operators the way older versions of graft " +
+            "did: with no precedence, and everything to the right of an " +
+            "operator as its right-hand side, so 2*3+4 is 14, not 10."
+        ),
+    )
+    argparser.add_argument(
+        '--optimise',
+        action="store_true",
+        help=(
+            "Simplify cell syntax programs before running them, e.g. by " +
+            "working out sums of constant numbers once, and running " +
+            "the bodies of small functions (including those passed to " +
+            "T() and For()) instead of calling them, and print how " +
+            "many parts of the program were changed."
+        ),
+    )
+    argparser.add_argument(
+        '--batch',
+        action="store_true",
+        help=(
+            "Run simple statements (like S() or d+=10) for all the forks " +
+            "that have reached them at once, which is faster when there " +
+            "are lots of forks.  (Requires numpy.)"
+        ),
+    )
+    argparser.add_argument(
+        '--workers',
+        metavar="N",
+        type=int,
+        help=(
+            "Run forks in N worker processes, to use several CPU cores.  " +
+            "Each fork gets its own random numbers, so the animation " +
+            "is the same for any N, but differs from running without " +
+            "--workers."
+        ),
+    )
+    argparser.add_argument(
+        '--profile',
+        action="store_true",
+        help=(
+            "Time each statement and function of a cell syntax program, " +
+            "and print how long each took when the animation ends.  " +
+            "(Can't be used with --workers.)"
+        ),
+    )
+    argparser.add_argument(
+        '--trace',
+        metavar="TRACE_FILENAME",
+        help=(
+            "Write how long each stage of drawing each frame took to " +
+            "this file, in Chrome's trace event format (open it in " +
+            "chrome://tracing or https://ui.perfetto.dev)."
+        ),
+    )
+    argparser.add_argument(
+        '--hud',
+        action="store_true",
+        help=(
+            "When displaying on screen, show the frames per second and " +
+            "how long each stage of drawing the last frame took."
+        ),
+    )
+    argparser.add_argument(
+        '--mem-report',
+        metavar="EVERY_N_STEPS",
+        type=int,
+        help=(
+            "Every N steps, print how much memory is in use, where it " +
+            "was allocated, and how much the forks (in total and the " +
+            "largest few), the strokes and any arrays are holding " +
+            "onto.  (Slow.  Can't be used with " +
+            "--workers.)"
+        ),
+    )
     argparser.add_argument(
         'program',
         help=(
@@ -151,32 +376,117 @@ def main(world: World) -> int:
 
     frames = None if args.frames < 0 else args.frames
 
+    if args.workers and args.evict != "oldest":
+        world.stderr.write("You can't use --evict=%s with --workers.\n" %
+                           args.evict)
+        return 3
+
+    mem_reporter = None
+    if args.mem_report:
+        if args.workers:
+            world.stderr.write("You can't use --mem-report with --workers.\n")
+            return 3
+        # Start early, so we see what the program itself allocates
+        tracemalloc.start()
+        mem_reporter = MemoryReporter(args.mem_report, world.stderr)
+
     if args.syntax == "v1":
         lex = lex_v1
         parse = parse_v1
         eval_expr = eval_v1
     else:
         lex = lex_cell
-        parse = parse_cell
-        eval_expr = eval_cell
+
+        def parse(tokens):
+            return parse_cell(tokens, args.legacy_operators)
+
+        eval_expr = CellCompiler() if args.engine == "compiled" else eval_cell
+
+    program = parse(lex(args.program))
+    if args.optimise and args.syntax == "cell":
+        program, rewrites = optimise_cell(program)
+        world.stderr.write("Optimiser rewrote %d nodes.\n" % rewrites)
+
+    profiler = None
+    if args.profile and args.syntax == "cell":
+        if args.workers:
+            world.stderr.write("You can't use --profile with --workers.\n")
+            return 3
+        profiler = CellProfiler(args.program)
+        program = profiler.instrument(program)
+        eval_expr = profiler.wrap(eval_expr)
 
     program_values = graftrun(
-        parse(lex(args.program)),
+        program,
         frames,
         world.random.uniform,
         args.max_forks,
         eval_expr,
+        args.batch,
+        args.workers,
+        mem_reporter and mem_reporter.watch_programs,
+        evict_policies[args.evict],
     )
 
+    if args.trace:
+        tracer = FrameTracer(open(args.trace, "w"))
+    elif args.hud:
+        tracer = FrameTracer()
+    else:
+        tracer = null_tracer
+
     animation = make_animation(
         program_values,
         frames,
         args.lookahead_steps,
-        args.max_strokes
+        args.max_strokes,
+        tracer,
+        mem_reporter,
     )
-    image_size = (args.width, args.height)
 
+    try:
+        ret = _main_ui(args, world, animation, frames)
+    finally:
+        tracer.close()
+    if mem_reporter is not None:
+        mem_reporter.report()
+    if profiler is not None:
+        world.stderr.write(profiler.report())
+    return ret
+
+
+def _main_ui(args, world: World, animation: Animation, frames) -> int:
+    image_size = (args.width, args.height)
+    group_strokes = args.group_strokes
+    render_workers = args.render_workers
     if args.gif:
-        return main_gif(animation, frames, args.gif, world, image_size)
+        return main_gif(
+            animation,
+            frames,
+            args.gif,
+            world,
+            image_size,
+            group_strokes,
+            render_workers,
+        )
+    elif args.video:
+        return main_video(
+            animation,
+            frames,
+            args.video,
+            world,
+            image_size,
+            group_strokes,
+            render_workers,
+        )
+    elif args.raw_frames:
+        return main_raw_frames(
+            animation,
+            args.raw_frames,
+            world,
+            image_size,
+            group_strokes,
+            render_workers,
+        )
     else:
-        return main_gtk3(animation, image_size)
+        return main_gtk3(animation, image_size, group_strokes, args.hud)
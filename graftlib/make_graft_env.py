@@ -1,11 +1,12 @@
+import functools
 import math
 
 from graftlib import cellfunctions
 from graftlib import cellstdlib
 from graftlib import functions
-from graftlib.env import Env
+from graftlib.env import Env, SlotEnv
 from graftlib.endofloopvalue import EndOfLoopValue
-from graftlib.eval_cell import eval_cell_list
+from graftlib.eval_cell import UserFunctionValue, eval_cell_list
 from graftlib.lex_cell import lex_cell
 from graftlib.nativefunctionvalue import NativeFunctionValue
 from graftlib.numbervalue import NumberValue
@@ -68,6 +69,15 @@ def add_cell_symbols(env: Env):
     exec_cell(cellstdlib.cellstdlib, env)
 
 
+def _add_graft_natives(env: Env):
+    env.set("D", NativeFunctionValue(functions.dot))
+    env.set("F", NativeFunctionValue(functions.fork))
+    env.set("J", NativeFunctionValue(functions.jump))
+    env.set("L", NativeFunctionValue(functions.line_to))
+    env.set("R", NativeFunctionValue(functions.random))
+    env.set("S", NativeFunctionValue(functions.step))
+
+
 def _add_graft_symbols(env: Env):
     env.set("f", NumberValue(0))      # Fork ID
     env.set("x", NumberValue(0.0))    # x coord
@@ -79,19 +89,41 @@ def _add_graft_symbols(env: Env):
     env.set("b", NumberValue(0.0))    # blue  0-100 (and 0 to -100)
     env.set("a", NumberValue(100.0))  # alpha 0-100 (and 0 to -100)
     env.set("z", NumberValue(5.0))    # brush size
-    env.set("D", NativeFunctionValue(functions.dot))
-    env.set("F", NativeFunctionValue(functions.fork))
-    env.set("J", NativeFunctionValue(functions.jump))
-    env.set("L", NativeFunctionValue(functions.line_to))
-    env.set("R", NativeFunctionValue(functions.random))
-    env.set("S", NativeFunctionValue(functions.step))
 
 
-def make_graft_env() -> Env:
-    """Create an environment with all the default Graft values"""
+@functools.lru_cache(maxsize=None)
+def builtins_env() -> Env:
+    """
+    Return a sealed environment holding the native functions and the
+    Cell standard library.  It is only created once, and is shared
+    by every program and fork, so it must never change.
+    """
 
     ret = Env()
     add_cell_symbols(ret)
+    _add_graft_natives(ret)
+
+    # The standard library's closures must not change either
+    for value in ret.local_items().values():
+        if type(value) == UserFunctionValue:
+            value.env.seal()
+
+    ret.seal()
+    return ret
+
+
+def make_graft_env() -> Env:
+    """
+    Create an environment with all the default Graft values.  The turtle
+    variables are kept in slots, where natives like S() find them.
+    """
+
+    ret = SlotEnv(
+        builtins_env(),
+        functions.turtle_slots,
+        [None] * len(functions.turtle_names),
+        is_globals=True,
+    )
     _add_graft_symbols(ret)
 
     return ret
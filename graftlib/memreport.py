@@ -0,0 +1,193 @@
+from typing import Iterable, List, Set
+import heapq
+import sys
+import tracemalloc
+
+import attr
+
+from graftlib.eval_cell import ArrayValue, UserFunctionValue
+from graftlib.make_graft_env import builtins_env
+
+
+# How many of the places that allocated the most memory to show
+top_allocations = 5
+
+# How many of the forks holding the most memory to show
+top_forks = 5
+
+
+@attr.s
+class ForkMemory:
+    """What one fork is holding onto."""
+    frames: int = attr.ib(0)  # How many Envs, not counting the builtins
+    names: int = attr.ib(0)  # How many names are defined in them
+    env_bytes: int = attr.ib(0)  # Roughly how big the Envs are
+    waiting: int = attr.ib(0)  # Strokes waiting to be returned
+
+
+@attr.s
+class ArrayCounts:
+    arrays: int = attr.ib(0)
+    elements: int = attr.ib(0)
+
+
+def fork_memory(env, queue) -> ForkMemory:
+    """Measure the Envs of a fork, whose env is a ProgramEnv or an Env."""
+    ret = ForkMemory(waiting=len(queue))
+    builtins = builtins_env()
+    env = env.frame(0)
+    while env is not None and env is not builtins:
+        items = env.local_items()
+        ret.frames += 1
+        ret.names += len(items)
+        ret.env_bytes += sys.getsizeof(env) + sys.getsizeof(items)
+        env = env.parent()
+    return ret
+
+
+def count_arrays(envs: Iterable) -> ArrayCounts:
+    """
+    Count the ArrayValues that can be reached from envs, including
+    arrays inside arrays and inside the closures of functions, and
+    how many elements they hold.  Arrays shared by several forks are
+    only counted once.
+    """
+    ret = ArrayCounts()
+    seen: Set[int] = set()
+    to_visit: List = [env.frame(0) for env in envs]
+    builtins = builtins_env()
+    while to_visit:
+        obj = to_visit.pop()
+        if id(obj) in seen or obj is None or obj is builtins:
+            continue
+        seen.add(id(obj))
+        typ = type(obj)
+        if typ == ArrayValue:
+            ret.arrays += 1
+            ret.elements += len(obj.value)
+            to_visit.extend(obj.value)
+        elif typ == UserFunctionValue:
+            to_visit.append(obj.env.frame(0))
+        elif hasattr(obj, "local_items"):  # An Env
+            to_visit.extend(obj.local_items().values())
+            to_visit.append(obj.parent())
+    return ret
+
+
+class MemoryReporter:
+    """
+    Every every_n steps of the program, writes to out how much memory
+    Python has allocated (using tracemalloc, which must be started as
+    early as possible), and where, along with how much each part of
+    graft is holding onto: the strokes in the Animation, the strokes
+    the StrokeOptimiser remembers, the Envs of all the forks and of
+    the largest few, the strokes waiting in their queues, and the
+    elements of arrays.
+    """
+
+    def __init__(self, every_n: int, out):
+        self.every_n = every_n
+        self.out = out
+        self.steps = 0
+        self.programs = None  # A MultipleRunningPrograms
+        self.animation = None
+        self.optimiser = None
+
+    def watch_programs(self, programs):
+        """Pass this as graftrun's programs_listener."""
+        self.programs = programs
+
+    def watch(self, animation, optimiser):
+        self.animation = animation
+        self.optimiser = optimiser
+
+    def iterate(self, commands: Iterable) -> Iterable:
+        """Iterate over commands, reporting every every_n steps."""
+        for parallel_commands in commands:
+            self.steps += 1
+            if self.steps % self.every_n == 0:
+                self.report()
+            yield parallel_commands
+
+    def report(self):
+        self.out.write(self.describe())
+
+    def describe(self) -> str:
+        lines = ["--- Memory after %d steps ---" % self.steps]
+        if tracemalloc.is_tracing():
+            lines += self._describe_tracemalloc()
+        if self.animation is not None:
+            lines.append(
+                "animation: %d strokes, %d positions" % (
+                    len(self.animation.strokes),
+                    len(self.animation.poss),
+                )
+            )
+        if self.optimiser is not None:
+            lines.append(
+                "stroke optimiser: %d seen strokes, %s" % (
+                    len(self.optimiser.seen_strokes),
+                    _kib(self.optimiser.memory_footprint()),
+                )
+            )
+        if self.programs is not None:
+            lines += self._describe_programs()
+        return "\n".join(lines) + "\n"
+
+    def _describe_tracemalloc(self) -> List[str]:
+        current, peak = tracemalloc.get_traced_memory()
+        ret = ["allocated: %s now, %s peak" % (_kib(current), _kib(peak))]
+        stats = tracemalloc.take_snapshot().statistics("lineno")
+        for stat in stats[:top_allocations]:
+            frame = stat.traceback[0]
+            ret.append(
+                "  %s in %d blocks: %s:%d" % (
+                    _kib(stat.size), stat.count, frame.filename, frame.lineno)
+            )
+        return ret
+
+    def _describe_programs(self) -> List[str]:
+        programs = self.programs.programs
+        stats = self.programs.stats
+        ret = [
+            "forks: %d running, %d evicted so far, " % (
+                len(programs), stats.evictions) +
+            "%d strokes waiting (at most %d in one fork)" % (
+                self.programs.queued(), stats.max_queue_depth)
+        ]
+        forks = [
+            (i, fork_memory(prog.env, queue))
+            for i, (prog, queue) in enumerate(programs)
+        ]
+        ret.append(
+            "  all forks: %d frames, %d names, %s of envs, %d waiting" % (
+                sum(fork.frames for _, fork in forks),
+                sum(fork.names for _, fork in forks),
+                _kib(sum(fork.env_bytes for _, fork in forks)),
+                sum(fork.waiting for _, fork in forks),
+            )
+        )
+        largest = heapq.nlargest(
+            top_forks, forks, key=lambda i_fork: i_fork[1].env_bytes)
+        if largest:
+            ret.append("  fork  frames  names    envs  waiting")
+        for i, fork in largest:
+            ret.append(
+                "  %4d  %6d  %5d  %6s  %7d" % (
+                    i,
+                    fork.frames,
+                    fork.names,
+                    _kib(fork.env_bytes),
+                    fork.waiting,
+                )
+            )
+        arrays = count_arrays(prog.env for prog, _ in programs)
+        ret.append(
+            "arrays: %d, holding %d elements" % (
+                arrays.arrays, arrays.elements)
+        )
+        return ret
+
+
+def _kib(num_bytes: int) -> str:
+    return "%.1fK" % (num_bytes / 1024)
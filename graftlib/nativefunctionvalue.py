@@ -1,6 +1,13 @@
+import inspect
 import attr
 
 
-@attr.s
+@attr.s(slots=True)
 class NativeFunctionValue:
     py_fn = attr.ib()
+    arity: int = attr.ib(init=False)
+
+    def __attrs_post_init__(self) -> None:
+        # Work this out once, here, because it is slow.  The first
+        # argument of py_fn is the env, which Cell code does not pass.
+        self.arity = len(inspect.getfullargspec(self.py_fn).args) - 1
@@ -1,6 +1,6 @@
 import attr
 
 
-@attr.s
+@attr.s(slots=True)
 class NumberValue:
     value: float = attr.ib()
@@ -0,0 +1,407 @@
+from typing import Dict, List, Optional
+import attr
+
+from graftlib.cellfunctions import for_items
+from graftlib.compile_cell import operations
+from graftlib.eval_cell import ArrayValue, NoneValue, StringValue
+from graftlib.labeltree import LabelTree
+from graftlib.nativefunctionvalue import NativeFunctionValue
+from graftlib.numbervalue import NumberValue
+from graftlib.parse_cell import (
+    ArrayTree,
+    AssignmentTree,
+    FunctionCallTree,
+    FunctionDefTree,
+    ModifyTree,
+    NegativeTree,
+    NumberTree,
+    OperationTree,
+    StringTree,
+    SymbolTree,
+)
+
+
+# Trees that may create variables in the Env they run in (assigning to
+# a name that isn't defined yet defines it there), capture it, or can't
+# run in a function.  A function containing any of these must run in
+# its own Env.
+_defines_names = (AssignmentTree, FunctionDefTree, LabelTree)
+
+# Trees that may create or change variables in the Env they run in.
+# A function with parameters containing any of these must run in its
+# own Env, because it might change a parameter.
+_changes_env = _defines_names + (ModifyTree,)
+
+
+def _children(expr) -> List:
+    typ = type(expr)
+    if typ == NegativeTree:
+        return [expr.value]
+    elif typ == OperationTree:
+        return [expr.left, expr.right]
+    elif typ in (AssignmentTree, ModifyTree):
+        return [expr.value]
+    elif typ == FunctionCallTree:
+        return [expr.fn] + expr.args
+    elif typ == FunctionDefTree:
+        return expr.body
+    elif typ == ArrayTree:
+        return expr.value
+    else:
+        return []
+
+
+def _contains(expr, types) -> bool:
+    return (
+        type(expr) in types or
+        any(_contains(child, types) for child in _children(expr))
+    )
+
+
+def _count_bindings(expr, counts: Dict[str, int]):
+    """
+    Add to counts how many times each name is assigned to, modified,
+    or used as a parameter in expr.
+    """
+    typ = type(expr)
+    names = []
+    if typ in (AssignmentTree, ModifyTree):
+        if type(expr.symbol) == SymbolTree:
+            names = [expr.symbol.value]
+    elif typ == FunctionDefTree:
+        names = [p.value for p in expr.params]
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    for child in _children(expr):
+        _count_bindings(child, counts)
+
+
+def _uses_name(expr, name: str) -> bool:
+    return (
+        (type(expr) == SymbolTree and expr.value == name) or
+        any(_uses_name(child, name) for child in _children(expr))
+    )
+
+
+def _runs_in_caller_env(fn: FunctionDefTree) -> bool:
+    """
+    True if running the body of fn where it is called does the same as
+    calling it: it has no parameters and can't define any names.
+    """
+    return (
+        not fn.params and
+        not any(_contains(stmt, _defines_names) for stmt in fn.body)
+    )
+
+
+def _run_body(env, body: List):
+    ret = NoneValue()
+    for stmt in body:
+        ret = env.eval_expr(env, stmt)
+    return ret
+
+
+def _inline_times(body: List, own_env: bool) -> NativeFunctionValue:
+    """
+    A native doing what T(reps, fn) does when fn is a function with no
+    parameters and this body, without calling fn: it runs the body reps
+    times in the Env it is called from, or, if own_env, in a new child
+    of it each time.
+    """
+
+    def times(env, reps):
+        ret = None
+        for _ in range(int(reps.value)):
+            ret = _run_body(env.make_child() if own_env else env, body)
+        return ret
+    return NativeFunctionValue(times)
+
+
+def _inline_for(param: str, body: List) -> NativeFunctionValue:
+    """
+    A native doing what For(arr, fn) does when fn is a function with one
+    parameter called param and this body, without calling fn.
+    """
+
+    def for_(env, arr):
+        ret = []
+        for item in for_items(env, arr):
+            item_env = env.make_child()
+            item_env.set_new(param, item)
+            ret.append(_run_body(item_env, body))
+        return ArrayValue(ret)
+    return NativeFunctionValue(for_)
+
+
+def _substitute(expr, values):
+    """
+    Replace symbols named in values with their values.  Only used on
+    trees that can't define or change any variables.
+    """
+    typ = type(expr)
+    if typ == SymbolTree:
+        return values.get(expr.value, expr)
+    elif typ == NegativeTree:
+        return NegativeTree(_substitute(expr.value, values), pos=expr.pos)
+    elif typ == OperationTree:
+        return OperationTree(
+            expr.operation,
+            _substitute(expr.left, values),
+            _substitute(expr.right, values),
+            pos=expr.pos,
+        )
+    elif typ == FunctionCallTree:
+        return FunctionCallTree(
+            _substitute(expr.fn, values),
+            [_substitute(a, values) for a in expr.args],
+            pos=expr.pos,
+        )
+    elif typ == ArrayTree:
+        return ArrayTree(
+            [_substitute(x, values) for x in expr.value], pos=expr.pos)
+    else:
+        return expr
+
+
+@attr.s
+class CellOptimiser:
+    """
+    Rewrite trees from parse_cell into trees that do the same thing,
+    but are quicker to evaluate:
+
+    - number and string literals become the values they evaluate to,
+    - arithmetic on constants is done once, here,
+    - calls to small functions are replaced by the functions' bodies,
+      if that can't change what the program does.  The functions can
+      be written where they are called, or be assigned to a name once,
+      at the top level, and never changed,
+    - T() and For() of such functions (while T and For are still the
+      builtins) become natives that run the body without calling it.
+
+    rewrites counts how many trees we have replaced.
+    """
+
+    rewrites: int = attr.ib(0, init=False)
+
+    # How many times each name is assigned, modified or used as a
+    # parameter anywhere in the program.
+    _bindings: Dict[str, int] = attr.ib(factory=dict, init=False)
+
+    # Functions assigned once at the top level to a name that is never
+    # changed, which can be used by statements after the assignment.
+    # Only if the program never forks: a fork's copy of a function
+    # still looks up names in the Env of the program that defined it.
+    _named: Dict[str, FunctionDefTree] = attr.ib(factory=dict, init=False)
+
+    # True while the code we are optimising sees the same names as the
+    # top level, i.e. it is not inside a function that has parameters
+    # or might define names.
+    _sees_top_level: bool = attr.ib(True, init=False)
+
+    def optimise_program(self, exprs) -> List:
+        exprs = list(exprs)
+        for expr in exprs:
+            _count_bindings(expr, self._bindings)
+        forks = any(_uses_name(expr, "F") for expr in exprs)
+        ret = []
+        for expr in exprs:
+            expr = self.optimise(expr)
+            if (
+                not forks and
+                type(expr) == AssignmentTree and
+                type(expr.value) == FunctionDefTree and
+                type(expr.symbol) == SymbolTree and
+                self._bindings[expr.symbol.value] == 1
+            ):
+                self._named[expr.symbol.value] = expr.value
+            ret.append(expr)
+        return ret
+
+    def optimise_all(self, exprs) -> List:
+        return [self.optimise(expr) for expr in exprs]
+
+    def optimise(self, expr):
+        typ = type(expr)
+        if typ == NumberTree:
+            return self._rewritten(NumberValue(float(expr.value)))
+        elif typ == StringTree:
+            return self._rewritten(StringValue(expr.value))
+        elif typ == NegativeTree:
+            return self._negative(
+                NegativeTree(self.optimise(expr.value), pos=expr.pos))
+        elif typ == OperationTree:
+            return self._operation(
+                OperationTree(
+                    expr.operation,
+                    self.optimise(expr.left),
+                    self.optimise(expr.right),
+                    pos=expr.pos,
+                )
+            )
+        elif typ == AssignmentTree:
+            return AssignmentTree(
+                expr.symbol, self.optimise(expr.value), pos=expr.pos)
+        elif typ == ModifyTree:
+            return ModifyTree(
+                expr.operation,
+                expr.symbol,
+                self.optimise(expr.value),
+                pos=expr.pos,
+            )
+        elif typ == FunctionCallTree:
+            return self._function_call(
+                FunctionCallTree(
+                    self.optimise(expr.fn),
+                    self.optimise_all(expr.args),
+                    pos=expr.pos,
+                )
+            )
+        elif typ == FunctionDefTree:
+            return self._function_def(expr)
+        elif typ == ArrayTree:
+            return ArrayTree(self.optimise_all(expr.value), pos=expr.pos)
+        else:
+            return expr
+
+    def _rewritten(self, expr):
+        self.rewrites += 1
+        return expr
+
+    def _negative(self, expr: NegativeTree):
+        if type(expr.value) == NumberValue:
+            return self._rewritten(NumberValue(-expr.value.value))
+        else:
+            return expr
+
+    def _operation(self, expr: OperationTree):
+        if (
+            type(expr.left) == NumberValue and
+            type(expr.right) == NumberValue and
+            expr.operation in operations
+        ):
+            try:
+                value = operations[expr.operation](
+                    expr.left.value, expr.right.value)
+            except ArithmeticError:
+                return expr  # Leave it to fail when it runs
+            return self._rewritten(NumberValue(value))
+        else:
+            return expr
+
+    def _function_def(self, expr: FunctionDefTree):
+        sees_top_level = self._sees_top_level
+        self._sees_top_level = sees_top_level and _runs_in_caller_env(expr)
+        body = self._body(expr.body)
+        self._sees_top_level = sees_top_level
+        return FunctionDefTree(expr.params, body, pos=expr.pos)
+
+    def _function(self, expr) -> Optional[FunctionDefTree]:
+        """The function expr evaluates to, if we know what it is."""
+        if type(expr) == FunctionDefTree:
+            return expr
+        elif type(expr) == SymbolTree and self._sees_top_level:
+            return self._named.get(expr.value)
+        else:
+            return None
+
+    def _inlinable(self, expr: FunctionCallTree) -> bool:
+        fn = expr.fn
+        if len(expr.args) != len(fn.params):
+            return False
+        elif not fn.params:
+            return _runs_in_caller_env(fn)
+        elif any(_contains(stmt, _changes_env) for stmt in fn.body):
+            return False
+        else:
+            # Natives can see parameters (e.g. a parameter called d
+            # changes the direction S() steps in), so only substitute
+            # them if there are no calls, and only with constants.
+            return (
+                all(
+                    type(a) in (NumberValue, StringValue) for a in expr.args
+                ) and
+                not any(
+                    _contains(stmt, (FunctionCallTree,)) for stmt in fn.body
+                )
+            )
+
+    def _inlinable_call(self, expr) -> Optional[FunctionCallTree]:
+        """
+        If expr is a call we can replace with the body of the function
+        it calls, return it with the function written out in full.
+        """
+        if type(expr) != FunctionCallTree:
+            return None
+        fn = self._function(expr.fn)
+        if fn is None:
+            return None
+        call = FunctionCallTree(fn, expr.args)
+        return call if self._inlinable(call) else None
+
+    def _inlined_body(self, expr: FunctionCallTree) -> List:
+        if not expr.fn.params:
+            return list(expr.fn.body)  # Already optimised
+        values = {p.value: a for p, a in zip(expr.fn.params, expr.args)}
+        return [
+            self.optimise(_substitute(stmt, values)) for stmt in expr.fn.body
+        ]
+
+    def _loop(self, expr: FunctionCallTree):
+        """
+        If expr is T(reps, fn) or For(arr, fn) and we know what fn is,
+        return a call to a native that runs its body without calling
+        it, otherwise None.
+        """
+        if (
+            type(expr.fn) != SymbolTree or
+            expr.fn.value not in ("T", "For") or
+            expr.fn.value in self._bindings or
+            len(expr.args) != 2
+        ):
+            return None
+        fn = self._function(expr.args[1])
+        if fn is None:
+            return None
+        elif expr.fn.value == "T" and not fn.params:
+            native = _inline_times(fn.body, not _runs_in_caller_env(fn))
+        elif expr.fn.value == "For" and len(fn.params) == 1:
+            native = _inline_for(fn.params[0].value, fn.body)
+        else:
+            return None
+        return self._rewritten(
+            FunctionCallTree(native, [expr.args[0]], pos=expr.pos))
+
+    def _function_call(self, expr: FunctionCallTree):
+        loop = self._loop(expr)
+        if loop is not None:
+            return loop
+        call = self._inlinable_call(expr)
+        if call is None or len(call.fn.body) > 1:
+            return expr
+        body = self._inlined_body(call)
+        return self._rewritten(body[0] if body else NoneValue())
+
+    def _body(self, body: List) -> List:
+        """
+        Optimise the body of a function.  Here we can replace a call to
+        a function with several statements by all of those statements.
+        """
+        ret = []
+        for stmt in body:
+            stmt = self.optimise(stmt)
+            call = self._inlinable_call(stmt)
+            if call is not None:
+                ret.extend(self._inlined_body(call) or [NoneValue()])
+                self.rewrites += 1
+            else:
+                ret.append(stmt)
+        return ret
+
+
+def optimise_cell(exprs) -> (List, int):
+    """
+    Optimise the trees exprs from parse_cell (see CellOptimiser),
+    and return the new trees and how many trees we replaced.
+    """
+    optimiser = CellOptimiser()
+    return (optimiser.optimise_program(exprs), optimiser.rewrites)
@@ -1,7 +1,6 @@
-from typing import List
+from typing import List, Optional
 import attr
 
-from graftlib.peekablestream import PeekableStream
 from graftlib.labeltree import LabelTree
 from graftlib.lex_cell import (
     AssignmentToken,
@@ -20,113 +19,250 @@ from graftlib.lex_cell import (
     StatementSeparatorToken,
     StringToken,
     SymbolToken,
+    source_pos,
 )
 
 
-@attr.s
+@attr.s(slots=True)
 class ArrayTree:
     value: List = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class AssignmentTree:
     symbol = attr.ib()
     value = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class ModifyTree:
     operation: str = attr.ib()
     symbol = attr.ib()
     value = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class NegativeTree:
     value = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class NumberTree:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class FunctionCallTree:
     fn = attr.ib()
     args: List = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class FunctionDefTree:
     params: List = attr.ib()
     body: List = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class OperationTree:
     operation: str = attr.ib()
     left = attr.ib()
     right = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class StringTree:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
 
 
-@attr.s
+@attr.s(slots=True)
 class SymbolTree:
     value: str = attr.ib()
+    pos: Optional[int] = source_pos()
+
+
+def _pos(prev, tok) -> Optional[int]:
+    """Where an expression starting with prev (if any) then tok starts."""
+    return tok.pos if prev is None else prev.pos
+
+
+# How tightly each operator holds onto the expressions either side of it:
+# 2*3+4<x is ((2*3)+4)<x.  Operators with the same binding are grouped
+# from the left: 8-4-2 is (8-4)-2.
+_binding = {
+    "==": 10,
+    "<": 10,
+    ">": 10,
+    "<=": 10,
+    ">=": 10,
+    "+": 20,
+    "-": 20,
+    "*": 30,
+    "/": 30,
+}
+
+# An operator with nothing on its left, e.g. -3
+_prefix_binding = 40
+
+# Assignments and modifications hold onto everything to their right
+_assignment_binding = 0
+
+
+@attr.s(slots=True)
+class _Pending:
+    """An operator (or assignment) waiting for its right-hand side."""
+    binding: int = attr.ib()
+    tok = attr.ib()
+    left = attr.ib()
+
+    def apply(self, right):
+        typ = type(self.tok)
+        if typ == AssignmentToken:
+            return AssignmentTree(self.left, right, pos=self.left.pos)
+        elif typ == ModifyToken:
+            return ModifyTree(
+                self.tok.value, self.left, right, pos=self.left.pos)
+        elif self.left is None and self.tok.value == "-":
+            return NegativeTree(right, pos=self.tok.pos)
+        else:
+            return OperationTree(
+                self.tok.value,
+                self.left,
+                right,
+                pos=_pos(self.left, self.tok),
+            )
+
+
+# What a _Frame turns its list of expressions into when it ends
+_CALL = 0
+_ARRAY = 1
+_PARAMS = 2
+_BODY = 3
+_TOP = 4
+
+
+@attr.s(slots=True)
+class _Frame:
+    """
+    A list of expressions we are part way through, separated by sep and
+    ended by end, e.g. the arguments of a function call.  When it ends,
+    it becomes a tree depending on kind, made with fn (the function
+    being called), params and tok (the token that started it).
+    """
+    kind: int = attr.ib()
+    sep = attr.ib()
+    end = attr.ib()
+    tok = attr.ib(None)
+    fn = attr.ib(None)
+    params: List = attr.ib(None)
+    items: List = attr.ib(attr.Factory(list))
+
+    # The expression we are part way through: the last complete value,
+    # and the operators before it that are waiting for a right-hand side
+    prev = attr.ib(None)
+    pending: List[_Pending] = attr.ib(attr.Factory(list))
 
 
 class _Parser:
-    def __init__(self, tokens, stop_at):
-        self.tokens = tokens
-        self.stop_at = stop_at
+    """
+    Parses a whole program in one loop over its tokens, keeping the
+    lists (argument lists, arrays, function bodies) we are inside on a
+    stack, so deep nesting and long expressions don't use up Python's
+    stack.
+
+    If legacy_operators is True, operators have no precedence, and
+    everything to the right of an operator is its right-hand side, so
+    2*3+4 is 2*(3+4), as in older versions of Graft.
+    """
 
-    def next_expression(self, prev):
-        tok = self.tokens.next
+    def __init__(self, legacy_operators: bool):
+        self.legacy_operators = legacy_operators
+        self.top = _Frame(_TOP, StatementSeparatorToken, None)
+        self.frames: List[_Frame] = [self.top]
 
-        if tok is None:
-            return prev
+        # True just after a {, where a : may start a parameter list
+        self.function_start: Optional[_Frame] = None
 
+    def statements(self, tokens):
+        top = self.top
+        tokens = iter(tokens)
+        tok = next(tokens, None)
+        while tok is not None:
+            # Lex one token ahead, so lexing errors come first, as they
+            # always have.
+            next_tok = next(tokens, None)
+            self.token(tok)
+            if top.items:
+                yield from top.items
+                top.items.clear()
+            tok = next_tok
+
+        if self.function_start is not None:
+            # The program ended just after a { or {:
+            self._function_start(None, type(None))
+        if len(self.frames) > 1:
+            raise Exception(
+                "Hit end of file - expected '%s'." % (
+                    self.frames[-1].end.code()))
+        self._end_item(top)
+        yield from top.items
+
+    def token(self, tok):
         typ = type(tok)
-        if typ in self.stop_at:
-            return prev
-        self.tokens.move_next()
-        if typ == NumberToken and prev is None:
-            return self.next_expression(NumberTree(tok.value))
-        elif typ == StringToken and prev is None:
-            return self.next_expression(StringTree(tok.value))
-        elif typ == SymbolToken and prev is None:
-            return self.next_expression(SymbolTree(tok.value))
-        elif typ == OperatorToken:
-            nxt = self.next_expression(None)
-            if prev is None and tok.value == "-":
-                return self.next_expression(NegativeTree(nxt))
-            return self.next_expression(OperationTree(tok.value, prev, nxt))
-        elif typ == LabelToken:
-            return self.next_expression(LabelTree())
+        if self.function_start is not None:
+            if self._function_start(tok, typ):
+                return
+        frame = self.frames[-1]
+        if typ == frame.sep:
+            self._end_item(frame)
+        elif typ == frame.end:
+            self._end_item(frame)
+            self._end_frame()
+        else:
+            self._expression_token(frame, tok, typ)
+
+    def _expression_token(self, frame: _Frame, tok, typ):
+        prev = frame.prev
+        if typ == SymbolToken and prev is None:
+            frame.prev = SymbolTree(tok.value, pos=tok.pos)
         elif typ == StartParamListToken:
-            args = self.multiple_expressions(
-                ListSeparatorToken, EndParamListToken)
-            return self.next_expression(FunctionCallTree(prev, args))
-        elif typ == StartFunctionDefToken:
-            params = self.parameters_list()
-            body = self.multiple_expressions(
-                StatementSeparatorToken, EndFunctionDefToken)
-            return self.next_expression(FunctionDefTree(params, body))
-        elif typ == StartArrayToken:
-            contents = self.multiple_expressions(
-                ListSeparatorToken, EndArrayToken)
-            return self.next_expression(ArrayTree(contents))
+            self.frames.append(
+                _Frame(
+                    _CALL,
+                    ListSeparatorToken,
+                    EndParamListToken,
+                    tok,
+                    prev,
+                )
+            )
+        elif typ == NumberToken and prev is None:
+            frame.prev = NumberTree(tok.value, pos=tok.pos)
+        elif typ == OperatorToken:
+            if prev is None:
+                binding = _prefix_binding
+            else:
+                binding = _binding[tok.value]
+                if not self.legacy_operators:
+                    self._reduce(frame, binding)
+            frame.pending.append(_Pending(binding, tok, frame.prev))
+            frame.prev = None
+        elif typ == StatementSeparatorToken:
+            pass  # Ignore whitespace anywhere it wasn't expected
         elif typ == AssignmentToken:
             if type(prev) != SymbolTree:
                 raise Exception(
                     "You can't assign to anything except a symbol.")
-            nxt = self.next_expression(None)
-            return self.next_expression(AssignmentTree(prev, nxt))
+            frame.pending.append(_Pending(_assignment_binding, tok, prev))
+            frame.prev = None
         elif typ == ModifyToken:
             if type(prev) != SymbolTree:
                 raise Exception(
@@ -134,61 +270,87 @@ class _Parser:
                         tok.code()
                     )
                 )
-            nxt = self.next_expression(None)
-            return self.next_expression(ModifyTree(tok.value, prev, nxt))
-        elif typ == StatementSeparatorToken:
-            # Ignore whitespace anywhere it wasn't expected
-            return self.next_expression(prev)
+            frame.pending.append(_Pending(_assignment_binding, tok, prev))
+            frame.prev = None
+        elif typ == StringToken and prev is None:
+            frame.prev = StringTree(tok.value, pos=tok.pos)
+        elif typ == StartFunctionDefToken:
+            self.function_start = _Frame(
+                _BODY, StatementSeparatorToken, EndFunctionDefToken, tok)
+        elif typ == StartArrayToken:
+            self.frames.append(
+                _Frame(_ARRAY, ListSeparatorToken, EndArrayToken, tok))
+        elif typ == LabelToken:
+            frame.prev = LabelTree(pos=tok.pos)
         else:
             raise Exception("Unexpected token: " + str(tok.code()))
 
-    def parameters_list(self):
-        if type(self.tokens.next) != ParamListPreludeToken:
-            return []  # If there's no colon, this function takes no args
-        self.tokens.move_next()
-        typ = type(self.tokens.next)
+    def _function_start(self, tok, typ) -> bool:
+        """
+        Start the function whose { we just saw, given the token after
+        it, and return True if we used that token up.
+        """
+        body = self.function_start
+        if typ == ParamListPreludeToken and body.params is None:
+            # Wait for the (, then read the parameters, then the body
+            body.params = []
+            return True
+        self.function_start = None
+        if body.params is None:
+            # If there's no colon, this function takes no args
+            body.params = []
+            self.frames.append(body)
+            return False
         if typ != StartParamListToken:
             raise Exception("':' must be followed by '(' in a function.")
-        self.tokens.move_next()
-        ret = self.multiple_expressions(ListSeparatorToken, EndParamListToken)
-        for param in ret:
-            if type(param) != SymbolTree:
-                raise Exception(
-                    "Only symbols are allowed in function parameter lists." +
-                    " I found: " + str(param) + "."
-                )
-        return ret
-
-    def multiple_expressions(self, sep, end):
-        ret = []
-        self.fail_if_at_end(end)
-        typ = type(self.tokens.next)
-        if typ == end:
-            self.tokens.move_next()
-        else:
-            arg_parser = _Parser(self.tokens, (sep, end))
-            while typ != end:
-                p = arg_parser.next_expression(None)
-                if p is not None:
-                    ret.append(p)
-                typ = type(self.tokens.next)
-                self.fail_if_at_end(end)
-                self.tokens.move_next()
-        return ret
-
-    def fail_if_at_end(self, expected):
-        if self.tokens.next is None:
-            raise Exception(
-                "Hit end of file - expected '%s'." % (expected.code()))
-
-
-def parse_cell(tokens_iterator):
-    parser = _Parser(
-        PeekableStream(tokens_iterator),
-        (StatementSeparatorToken,)
-    )
-    while parser.tokens.next is not None:
-        p = parser.next_expression(None)
-        if p is not None:
-            yield p
-        parser.tokens.move_next()
+        self.frames.append(body)
+        self.frames.append(
+            _Frame(_PARAMS, ListSeparatorToken, EndParamListToken, tok))
+        return True
+
+    def _reduce(self, frame: _Frame, binding: int):
+        """
+        Give the operators waiting in frame that hold on at least as
+        tightly as binding the value we have, as their right-hand side.
+        """
+        pending = frame.pending
+        while pending and pending[-1].binding >= binding:
+            frame.prev = pending.pop().apply(frame.prev)
+
+    def _end_item(self, frame: _Frame):
+        if frame.pending:
+            self._reduce(frame, _assignment_binding)
+        if frame.prev is not None:
+            frame.items.append(frame.prev)
+            frame.prev = None
+
+    def _end_frame(self):
+        frame = self.frames.pop()
+        kind = frame.kind
+        tok = frame.tok
+        if kind == _CALL:
+            tree = FunctionCallTree(
+                frame.fn, frame.items, pos=_pos(frame.fn, tok))
+        elif kind == _ARRAY:
+            tree = ArrayTree(frame.items, pos=tok.pos)
+        elif kind == _PARAMS:
+            for param in frame.items:
+                if type(param) != SymbolTree:
+                    raise Exception(
+                        "Only symbols are allowed in function parameter " +
+                        "lists. I found: " + str(param) + "."
+                    )
+            # Now read the body of the function
+            self.frames[-1].params = frame.items
+            return
+        else:  # _BODY
+            tree = FunctionDefTree(frame.params, frame.items, pos=tok.pos)
+        self.frames[-1].prev = tree
+
+
+def parse_cell(tokens_iterator, legacy_operators: bool = False):
+    """
+    Turn tokens from lex_cell into trees, one per statement.
+    See _Parser for legacy_operators.
+    """
+    return _Parser(legacy_operators).statements(tokens_iterator)
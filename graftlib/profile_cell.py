@@ -0,0 +1,258 @@
+from typing import Dict, List, Optional, Tuple
+import time
+import attr
+
+from graftlib.eval_cell import (
+    UserFunctionValue,
+    fail_if_wrong_number_of_args,
+)
+from graftlib.labeltree import LabelTree
+from graftlib.make_graft_env import builtins_env
+from graftlib.nativefunctionvalue import NativeFunctionValue
+from graftlib.parse_cell import (
+    ArrayTree,
+    AssignmentTree,
+    FunctionCallTree,
+    FunctionDefTree,
+    ModifyTree,
+    NegativeTree,
+    OperationTree,
+)
+
+
+# What we are timing: ("statement", pos), ("function", pos) for a
+# function defined in the program, ("function", name) for one in the
+# standard library, or ("native", name).
+Key = Tuple[str, object]
+
+
+@attr.s
+class ProfileEntry:
+    calls: int = attr.ib(0)
+    cumulative: float = attr.ib(0.0)  # Seconds, including callees
+    self_time: float = attr.ib(0.0)  # Seconds, not including callees
+    running: int = attr.ib(0)  # How many calls are running (recursion)
+
+
+def _native(py_fn, arity: int) -> NativeFunctionValue:
+    """A NativeFunctionValue for py_fn(env, *args) taking arity args."""
+    ret = NativeFunctionValue(py_fn)
+    ret.arity = arity
+    return ret
+
+
+class CellProfiler:
+    """
+    Records how many times each top-level statement, function defined
+    in the program, standard library function and native function is
+    run, and how long it takes, both including (cumulative) and not
+    including (self) the time spent in the functions it calls.
+
+    instrument() rewrites the program so every function call reports to
+    us, and wrap() wraps the eval_expr (eval_cell or a CellCompiler) so
+    top-level statements and calls made by natives like T() do too.
+    Functions stay as they are, so they behave (and fail) exactly as
+    they do when we are not profiling: we recognise the ones defined in
+    the program by their params, and call instrumented copies of the
+    standard library ones, so the calls they make report to us too.
+    Nothing changes when we are not profiling.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.entries: Dict[Key, ProfileEntry] = {}
+        self._statements: Dict[int, Key] = {}
+        # id(params) -> (params, key) of each function we instrumented
+        self._functions: Dict[int, Tuple[List, Key]] = {}
+        # id(fn) -> (fn, instrumented copy) of standard library functions
+        self._library: Dict[int, Tuple[UserFunctionValue, ...]] = {}
+        self._inner = None
+        self._names = {
+            id(v): k for k, v in builtins_env().local_items().items()}
+
+        # For each call running now, the time spent in its callees
+        self._callee_times: List[float] = []
+
+    def instrument(self, program: List) -> List:
+        """Return a copy of program that tells us when it runs things."""
+        ret = [self._instrument(statement) for statement in program]
+        for statement in ret:
+            if type(statement) != LabelTree:
+                key = ("statement", statement.pos)
+                self._statements[id(statement)] = key
+        return ret
+
+    def wrap(self, eval_expr):
+        """Return an eval_expr that runs eval_expr while profiling."""
+        self._inner = eval_expr
+
+        def profiled_eval_expr(env, expr):
+            key = self._statements.get(id(expr))
+            if key is not None:
+                return self._time(key, eval_expr, env, expr)
+            elif (
+                type(expr) == FunctionCallTree and
+                type(expr.fn) in (NativeFunctionValue, UserFunctionValue)
+            ):
+                # A call made by a native like T() or For()
+                args = [eval_expr(env, a) for a in expr.args]
+                return self._call(env, expr.fn, args, expr.fn)
+            else:
+                return eval_expr(env, expr)
+        return profiled_eval_expr
+
+    def _instrument(self, expr, library_name: Optional[str] = None):
+        """
+        Rewrite expr's calls so they tell us about themselves.  Functions
+        defined in it are timed under library_name, or where they are in
+        the program if it is None.
+        """
+
+        def instrument(e):
+            return self._instrument(e, library_name)
+
+        typ = type(expr)
+        if typ == NegativeTree:
+            return NegativeTree(instrument(expr.value), pos=expr.pos)
+        elif typ == OperationTree:
+            return OperationTree(
+                expr.operation,
+                instrument(expr.left),
+                instrument(expr.right),
+                pos=expr.pos,
+            )
+        elif typ == AssignmentTree:
+            return AssignmentTree(
+                expr.symbol, instrument(expr.value), pos=expr.pos)
+        elif typ == ModifyTree:
+            return ModifyTree(
+                expr.operation,
+                expr.symbol,
+                instrument(expr.value),
+                pos=expr.pos,
+            )
+        elif typ == FunctionCallTree:
+            # fn(args) becomes call(fn, args), which times the call
+            fn_expr = expr.fn
+
+            def call(env, fn, *args):
+                return self._call(env, fn, args, fn_expr)
+
+            return FunctionCallTree(
+                _native(call, len(expr.args) + 1),
+                [instrument(fn_expr)] +
+                [instrument(a) for a in expr.args],
+                pos=expr.pos,
+            )
+        elif typ == FunctionDefTree:
+            # Its own copy of params, so we know its calls by them
+            params = list(expr.params)
+            if library_name is None:
+                key = ("function", expr.pos)
+            else:
+                key = ("function", library_name)
+            self._functions[id(params)] = (params, key)
+            return FunctionDefTree(
+                params,
+                [instrument(e) for e in expr.body],
+                pos=expr.pos,
+            )
+        elif typ == ArrayTree:
+            return ArrayTree(
+                [instrument(x) for x in expr.value], pos=expr.pos)
+        else:
+            return expr
+
+    def _instrumented(
+        self,
+        fn: UserFunctionValue,
+    ) -> Tuple[Key, UserFunctionValue]:
+        """The key to time fn under, and the function to call for it."""
+        defined = self._functions.get(id(fn.params))
+        if defined is not None and defined[0] is fn.params:
+            return (defined[1], fn)
+        copied = self._library.get(id(fn))
+        if copied is None or copied[0] is not fn:
+            # Not instrumented yet, e.g. While()
+            body = [self._instrument(e, "(standard library)") for e in fn.body]
+            copied = (fn, UserFunctionValue(fn.params, body, fn.env))
+            self._library[id(fn)] = copied
+        name = self._names.get(id(fn), "(standard library)")
+        return (("function", name), copied[1])
+
+    def _call(self, env, fn, args, fn_expr):
+        typ = type(fn)
+        if typ == NativeFunctionValue:
+            fail_if_wrong_number_of_args(fn_expr, fn.arity, len(args))
+            key = ("native", self._names.get(id(fn), "(unnamed)"))
+            return self._time(key, fn.py_fn, env, *args)
+        elif typ == UserFunctionValue:
+            fail_if_wrong_number_of_args(fn_expr, len(fn.params), len(args))
+            key, fn = self._instrumented(fn)
+            return self._time(
+                key, self._inner, env, FunctionCallTree(fn, list(args)))
+        else:
+            raise Exception(
+                "Attempted to call something that is not a function: " +
+                "%s, which is %s" % (
+                    str(fn_expr),
+                    str(fn),
+                )
+            )
+
+    def _time(self, key: Key, fn, *args):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = ProfileEntry()
+            self.entries[key] = entry
+        entry.calls += 1
+        entry.running += 1
+        self._callee_times.append(0.0)
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            entry.running -= 1
+            if entry.running == 0:
+                entry.cumulative += elapsed
+            entry.self_time += elapsed - self._callee_times.pop()
+            if self._callee_times:
+                self._callee_times[-1] += elapsed
+
+    def describe(self, key: Key) -> str:
+        kind, where = key
+        if type(where) == str:
+            return "%s %s" % (kind, where)
+        return "%s at %s  %s" % (
+            kind, self._line_col(where), self._code(where))
+
+    def _line_col(self, pos: Optional[int]) -> str:
+        if pos is None:
+            return "?"
+        line = self.source.count("\n", 0, pos) + 1
+        col = pos - (self.source.rfind("\n", 0, pos) + 1) + 1
+        return "%d:%d" % (line, col)
+
+    def _code(self, pos: Optional[int], max_length=30) -> str:
+        if pos is None:
+            return ""
+        code = self.source[pos:].split("\n")[0]
+        if len(code) > max_length:
+            code = code[:max_length - 3] + "..."
+        return code
+
+    def report(self) -> str:
+        """A table of everything we timed, the slowest (self time) first."""
+        lines = ["   calls  cumulative(s)  self(s)  what"]
+        for key, entry in sorted(
+                self.entries.items(), key=lambda ke: -ke[1].self_time):
+            lines.append(
+                "%8d %14.3f %8.3f  %s" % (
+                    entry.calls,
+                    entry.cumulative,
+                    entry.self_time,
+                    self.describe(key),
+                )
+            )
+        return "\n".join(lines) + "\n"
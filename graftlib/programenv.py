@@ -18,6 +18,10 @@ class ProgramEnv:
     eval_expr = attr.ib()
     _strokes = attr.ib(default=attr.Factory(list))
 
+    @property
+    def globals(self):
+        return self.env.globals
+
     def parent(self):
         return self.env.parent()
 
@@ -38,6 +42,35 @@ class ProgramEnv:
             self._strokes,
         )
 
+    def make_slot_child(self, slot_names, slots):
+        return ProgramEnv(
+            self.env.make_slot_child(slot_names, slots),
+            self.rand,
+            self.fork_callback,
+            self.eval_expr,
+            self._strokes,
+        )
+
+    def make_call_env(self, closure_env, slot_names=None, slots=None):
+        """
+        Names are looked up in the function's closure, but the random
+        number generator, fork_callback and strokes belong to whoever
+        is calling the function.  This matters when a function was
+        defined somewhere else, e.g. in the shared builtins, or by the
+        program we were forked from.
+        """
+        return ProgramEnv(
+            self.env.make_call_env(
+                closure_env.frame(0), slot_names, slots),
+            self.rand,
+            self.fork_callback,
+            self.eval_expr,
+            self._strokes,
+        )
+
+    def frame(self, depth):
+        return self.env.frame(depth)
+
     def stroke(self, st):
         self._strokes.append(st)
 
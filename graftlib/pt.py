@@ -1,7 +1,7 @@
 import attr
 
 
-@attr.s(cmp=True, frozen=True)
+@attr.s(cmp=True, frozen=True, slots=True)
 class Pt:
     x: float = attr.ib()
     y: float = attr.ib()
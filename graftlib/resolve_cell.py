@@ -0,0 +1,118 @@
+from typing import Dict, List, Tuple
+import attr
+
+from graftlib.parse_cell import (
+    ArrayTree,
+    AssignmentTree,
+    FunctionCallTree,
+    FunctionDefTree,
+    ModifyTree,
+    NegativeTree,
+    OperationTree,
+    SymbolTree,
+)
+
+
+# Calling a function makes two new Envs: one when the function is
+# defined (to hold its closure), and one when it is called (to hold
+# its arguments).  So each enclosing function is this many Envs up.
+frames_per_function = 2
+
+
+# ProgramEnv remembers the previous values of these when they are set,
+# so we must always set them by name, even if they are parameters.
+set_by_name = ("x", "y")
+
+
+@attr.s(slots=True)
+class SlotTree:
+    """
+    A symbol that resolve_cell found in the parameter list of an
+    enclosing function.  Its value is in slots[slot] of the SlotEnv
+    that is depth levels above the Env we are running in.
+    """
+    value: str = attr.ib()
+    depth: int = attr.ib()
+    slot: int = attr.ib()
+
+
+def slot_names(params: List[SymbolTree]) -> Dict[str, int]:
+    """Map each parameter name to its index in the argument list."""
+    return {p.value: i for i, p in enumerate(params)}
+
+
+def _lookup(name: str, scopes: Tuple[Dict[str, int], ...]):
+    for i, scope in enumerate(scopes):
+        if name in scope:
+            return SlotTree(name, i * frames_per_function, scope[name])
+    return None
+
+
+def _resolve_target(symbol, scopes):
+    if type(symbol) == SymbolTree and symbol.value not in set_by_name:
+        return _resolve(symbol, scopes)
+    else:
+        return symbol
+
+
+def _resolve(expr, scopes):
+    typ = type(expr)
+    if typ == SymbolTree:
+        ret = _lookup(expr.value, scopes)
+        return expr if ret is None else ret
+    elif typ == NegativeTree:
+        return NegativeTree(_resolve(expr.value, scopes))
+    elif typ == OperationTree:
+        return OperationTree(
+            expr.operation,
+            _resolve(expr.left, scopes),
+            _resolve(expr.right, scopes),
+        )
+    elif typ == AssignmentTree:
+        return AssignmentTree(
+            _resolve_target(expr.symbol, scopes),
+            _resolve(expr.value, scopes),
+        )
+    elif typ == ModifyTree:
+        return ModifyTree(
+            expr.operation,
+            _resolve_target(expr.symbol, scopes),
+            _resolve(expr.value, scopes),
+        )
+    elif typ == FunctionCallTree:
+        return FunctionCallTree(
+            _resolve(expr.fn, scopes),
+            [_resolve(a, scopes) for a in expr.args],
+        )
+    elif typ == FunctionDefTree:
+        return FunctionDefTree(
+            expr.params,
+            _resolve_body(expr.params, expr.body, scopes),
+        )
+    elif typ == ArrayTree:
+        return ArrayTree([_resolve(x, scopes) for x in expr.value])
+    else:
+        return expr
+
+
+def _resolve_body(params, body, scopes):
+    inner_scopes = (slot_names(params),) + scopes
+    return [_resolve(expr, inner_scopes) for expr in body]
+
+
+def resolve_cell(expr):
+    """
+    Return a copy of expr (a tree from parse_cell) where every
+    SymbolTree that refers to a parameter of a function defined inside
+    expr has been replaced by a SlotTree saying where to find it.
+    All other symbols are left alone, to be looked up by name.
+    """
+    return _resolve(expr, ())
+
+
+def resolve_body(params: List[SymbolTree], body: List) -> List:
+    """
+    Like resolve_cell, but for the body of a function with the supplied
+    parameters, so those are resolved too.
+    """
+    return _resolve_body(params, body, ())
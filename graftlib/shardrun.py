@@ -0,0 +1,459 @@
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, Union
+import functools
+import io
+import multiprocessing
+import pickle
+import random
+
+import attr
+
+from graftlib import functions
+from graftlib.batchrun import BatchRunner
+from graftlib.eval_cell import ArrayValue, UserFunctionValue
+from graftlib.graftrun import RunningProgram, empty
+from graftlib.make_graft_env import builtins_env, make_graft_env
+from graftlib.programenv import ProgramEnv
+
+
+# How many steps a worker runs for each message we send it, unless one
+# of its forks forks sooner.
+default_block_steps = 32
+
+
+def fork_rand(seed: int, fork_id: int):
+    """
+    The random number generator for the fork with this id.  Each fork
+    has its own, so what a fork draws doesn't depend on how the forks
+    are spread across processes, or on what the other forks do.
+    """
+    return random.Random("%d:%d" % (seed, fork_id)).uniform
+
+
+def builtin(name: str):
+    """Look up a builtin by name, or return the builtins Env if name=''."""
+    if name == "":
+        return builtins_env()
+    else:
+        return builtins_env().local_items()[name]
+
+
+@functools.lru_cache(maxsize=None)
+def _builtin_names() -> Dict[int, str]:
+    ret = {id(v): k for k, v in builtins_env().local_items().items()}
+    ret[id(builtins_env())] = ""
+    return ret
+
+
+def _plain_env(env):
+    return env
+
+
+# The dump of each function body this process has sent or received, by
+# id, and each body by its dump.  Every copy of a function that arrives
+# shares one body object, so CellCompiler compiles it only once.
+_body_dumps: Dict[int, Tuple[List, bytes]] = {}
+_bodies: Dict[bytes, List] = {}
+
+
+def _dump_body(body: List) -> bytes:
+    cached = _body_dumps.get(id(body))
+    if cached is None or cached[0] is not body:
+        f = io.BytesIO()
+        _Pickler(f).dump(body)
+        cached = (body, f.getvalue())
+        _body_dumps[id(body)] = cached
+        _bodies.setdefault(cached[1], body)
+    return cached[1]
+
+
+def _function(params: List, body_dump: bytes, env) -> UserFunctionValue:
+    body = _bodies.get(body_dump)
+    if body is None:
+        body = pickle.loads(body_dump)
+        _bodies[body_dump] = body
+        _body_dumps[id(body)] = (body, body_dump)
+    return UserFunctionValue(params, body, env)
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Pickles an Env, referring to the builtins by name, because every
+    process already has them (and some of them can't be pickled).
+
+    The closures of functions are pickled as their plain Env, without
+    the ProgramEnv around it, whose fork_callback would drag in every
+    other fork.  Whoever calls a function supplies those anyway (see
+    ProgramEnv.make_call_env).  Function bodies are shared by every
+    copy of a function that arrives in a process (see _function).
+    """
+
+    def __init__(self, file):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._builtin_names = _builtin_names()
+
+    def reducer_override(self, obj):
+        if type(obj) == ProgramEnv:
+            return (_plain_env, (obj.env,))
+        name = self._builtin_names.get(id(obj))
+        if name is not None:
+            return (builtin, (name,))
+        elif type(obj) == UserFunctionValue:
+            return (_function, (obj.params, _dump_body(obj.body), obj.env))
+        else:
+            return NotImplemented
+
+
+def _shares_values(env) -> bool:
+    """
+    True if env holds values that a fork shares with the program it was
+    forked from, and that can change (functions, whose closures point
+    at the original program's Env, and arrays), so copying it by
+    pickling changes what it does.
+    """
+    return any(
+        type(value) in (ArrayValue, UserFunctionValue)
+        for value in env.local_items().values()
+    )
+
+
+def dump_fork(pc: int, label: int, env) -> bytes:
+    f = io.BytesIO()
+    _Pickler(f).dump((pc, label, env))
+    return f.getvalue()
+
+
+def load_fork(data: bytes) -> Tuple:
+    return pickle.loads(data)
+
+
+class Shard:
+    """
+    The forks that one worker process is running, kept in the same
+    order as they appear in the full list of forks.
+    """
+
+    def __init__(self, program: List, eval_expr, seed: int, batch: bool):
+        self.program = program
+        self.eval_expr = eval_expr
+        self.seed = seed
+        self.batch_runner = BatchRunner() if batch else None
+        self.programs = deque()  # of (RunningProgram, queue)
+        self._children = []  # list of (parent index, RunningProgram)
+        self._held = []  # new forks waiting to be given a fork id
+        self._current = None
+
+    def give(self, indices: List[int]) -> List[bytes]:
+        """
+        Return dump_fork() of each of the new forks we are holding at
+        these indices, so another Shard can adopt them.
+        """
+        return [
+            dump_fork(child.pc, child.label, child.env.env)
+            for child in (self._held[i] for i in indices)
+        ]
+
+    def run_block(
+            self,
+            num_evicted: int,
+            adopted: List[Tuple[int, Union[int, bytes]]],
+            max_steps: int,
+    ) -> Tuple[List[List], List[int]]:
+        """
+        Forget our oldest num_evicted forks, and take on the forks in
+        adopted, which is a list of (fork id, fork), where fork is the
+        index of one of the new forks we are holding, or dump_fork() of
+        a fork from another Shard.  Drop any new forks not adopted.
+
+        Then run each fork for up to max_steps steps, stopping after
+        any step in which a fork forks, because new forks can't run
+        until they have been given fork ids.  Return what each fork drew
+        at each step, and the index of the parent of each new fork,
+        which we hold until we are told to adopt it or give it away.
+        """
+        for _ in range(num_evicted):
+            self.programs.popleft()
+        for fork_id, fork in adopted:
+            if type(fork) == int:
+                child = self._held[fork]
+                pc, label, env = child.pc, child.label, child.env.env
+                if _shares_values(env):
+                    # Copy it as if it had come from another Shard, so
+                    # it doesn't matter which of us runs it.
+                    pc, label, env = load_fork(dump_fork(pc, label, env))
+            else:
+                pc, label, env = load_fork(fork)
+            prog = RunningProgram(
+                self.program,
+                fork_rand(self.seed, fork_id),
+                self.fork,
+                env,
+                self.eval_expr,
+                pc,
+                label,
+            )
+            functions.set_fork_id(prog.env, fork_id)
+            self.programs.append((prog, deque()))
+
+        steps = []
+        while len(steps) < max_steps and not self._children:
+            steps.append(self._step())
+
+        self._held = [child for _, child in self._children]
+        parents = [parent for parent, _ in self._children]
+        self._children = []
+        return steps, parents
+
+    def _step(self) -> List:
+        if self.batch_runner is not None:
+            self.batch_runner.run(self.programs)
+
+        strokes = []
+        for i, (prog, queue) in enumerate(self.programs):
+            if empty(queue):
+                self._current = i
+                queue.extend(prog.next())
+            if empty(queue):
+                queue.append(None)
+            strokes.append(queue.popleft())
+        return strokes
+
+    def fork(self, cloned_running_program):
+        self._children.append((self._current, cloned_running_program))
+
+
+def _work(conn, program, eval_expr, seed, batch):
+    """
+    Run a Shard, calling the method named in each request we are sent
+    with the arguments that follow it, and sending back what it returns.
+    If the program fails, send back the exception instead, and stop.
+    """
+    shard = Shard(program, eval_expr, seed, batch)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        try:
+            reply = getattr(shard, request[0])(*request[1:])
+        except Exception as e:
+            try:
+                conn.send(e)
+            except Exception:  # e can't be pickled
+                conn.send(Exception(str(e)))
+            break
+        conn.send(reply)
+
+
+@attr.s
+class _Worker:
+    """What ShardedRunningPrograms knows about one worker process."""
+
+    conn = attr.ib()
+    process = attr.ib()
+
+    # How many of our forks it is running, how many forks it holds
+    # (including those we have dropped, but not told it about yet), and
+    # how many of those we have dropped.
+    size: int = attr.ib(default=0)
+    held: int = attr.ib(default=0)
+    evicted: int = attr.ib(default=0)
+
+    # Steps it has run that we have not returned yet: for each step,
+    # what each of the forks it held drew.  It has run every step up to
+    # the last one in here, or up to the last one we returned if this is
+    # empty.
+    steps: Deque = attr.ib(attr.Factory(deque))
+
+    # The index of the parent of each new fork it made in the last step
+    # it ran, which it is holding until we tell it what to do with them.
+    parents: List[int] = attr.ib(attr.Factory(list))
+
+    # (fork id, fork) for each fork it must adopt when it next runs,
+    # where fork is the index of a new fork it is holding, dump_fork()
+    # of a fork, or (worker index, index) of a new fork held by another
+    # worker, which must give it to us first.
+    adopted: Deque = attr.ib(attr.Factory(deque))
+
+
+class ShardedRunningPrograms:
+    """
+    Like MultipleRunningPrograms, but spreads the forks across several
+    worker processes, which each run a Shard.
+
+    Every fork gets its own random number generator (see fork_rand),
+    and fork ids, the order of strokes, and which forks are dropped
+    when there are more than max_forks are all the same as if one
+    process ran everything, so the output doesn't depend on how many
+    workers there are.
+
+    Each worker runs up to block_steps steps for each message we send
+    it, without waiting for the others, except that it must stop after
+    any step in which one of its forks forks, until every worker has
+    got that far, because fork ids depend on the forks made by all the
+    workers.  New forks stay in the worker that made them, unless
+    another worker that has got exactly as far has fewer forks.
+    """
+
+    def __init__(
+            self,
+            program: List,
+            seed: int,
+            max_forks: int,
+            eval_expr,
+            num_workers: int,
+            batch: bool = False,
+            block_steps: int = default_block_steps,
+    ):
+        self.max_forks = max_forks
+        self.block_steps = block_steps
+        self._fork_id_counter = 0
+
+        self._workers: List[_Worker] = []
+        for _ in range(num_workers):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_work,
+                args=(worker_conn, program, eval_expr, seed, batch),
+                daemon=True,
+            )
+            process.start()
+            worker_conn.close()  # So we notice if the worker dies
+            self._workers.append(_Worker(conn, process))
+
+        # Which worker is running each fork, oldest first
+        self.placements = deque()
+
+        self._place(0, 0, dump_fork(0, 0, make_graft_env()))
+
+    def next_fork_id(self):
+        self._fork_id_counter += 1
+        return self._fork_id_counter
+
+    def _place(self, worker: int, fork_id: int, fork):
+        self._workers[worker].size += 1
+        self._workers[worker].adopted.append((fork_id, fork))
+        self.placements.append(worker)
+
+    def next(self) -> List[Tuple[object, Optional[object]]]:
+        workers = self._workers
+        if any(w.size > 0 and not w.steps for w in workers):
+            self._run_blocks()
+
+        # Put the strokes and new forks back into the order they would
+        # have had if one process had run everything.  Each worker's
+        # results start with the forks we have dropped since it ran.
+        ret = []
+        children = []
+        positions = [w.evicted for w in workers]
+        new_forks = [
+            bisect_left(w.parents, w.evicted) if len(w.steps) == 1 else None
+            for w in workers
+        ]
+        for worker in self.placements:
+            w = workers[worker]
+            n = positions[worker]
+            ret.append((w.steps[0][n], None))
+            positions[worker] += 1
+            i = new_forks[worker]
+            while i is not None and i < len(w.parents) and w.parents[i] == n:
+                children.append((worker, i))
+                i += 1
+            new_forks[worker] = i
+        for w in workers:
+            if w.steps:
+                w.steps.popleft()
+
+        for worker, i in children:
+            self._place(
+                self._new_home(worker), self.next_fork_id(), (worker, i))
+
+        self._evict(len(self.placements) - self.max_forks)
+
+        return ret
+
+    def _new_home(self, worker: int) -> int:
+        """
+        Choose which worker will run a new fork made by worker: the one
+        with the fewest forks that has got as far as it has.
+        """
+        ready = [
+            i for i, w in enumerate(self._workers)
+            if not w.steps or w.size == 0
+        ]
+        return min(ready, key=lambda i: (self._workers[i].size, i != worker))
+
+    def _evict(self, num: int):
+        """Drop the oldest num forks."""
+        for _ in range(max(0, num)):
+            w = self._workers[self.placements.popleft()]
+            w.size -= 1
+            if w.evicted < w.held:
+                w.evicted += 1
+            else:
+                # Not sent to the worker yet, so just don't send it
+                w.adopted.popleft()
+            if w.size == 0:
+                w.steps.clear()  # The steps of forks we have dropped
+
+    def _run_blocks(self):
+        """
+        Ask each worker that has nothing left that we haven't returned
+        to adopt its new forks, and run a block of steps.
+        """
+        workers = self._workers
+
+        # New forks moving to another worker must be collected first
+        wanted = {}
+        for w in workers:
+            for _, fork in w.adopted:
+                if type(fork) == tuple and workers[fork[0]] is not w:
+                    wanted.setdefault(fork[0], []).append(fork[1])
+        given = {}
+        for worker, indices in wanted.items():
+            workers[worker].conn.send(("give", indices))
+        for worker, indices in wanted.items():
+            data = _receive(workers[worker].conn)
+            given.update(((worker, i), d) for i, d in zip(indices, data))
+
+        running = [w for w in workers if w.size > 0 and not w.steps]
+        for w in running:
+            adopted = [
+                (fork_id, _fork_to_send(w, fork, workers, given))
+                for fork_id, fork in w.adopted
+            ]
+            w.conn.send(("run_block", w.evicted, adopted, self.block_steps))
+            w.held += len(adopted) - w.evicted
+            w.evicted = 0
+            w.adopted = deque()
+        for w in running:
+            steps, w.parents = _receive(w.conn)
+            w.steps.extend(steps)
+
+    def close(self):
+        """Stop the workers, including any that have already stopped."""
+        for w in self._workers:
+            try:
+                w.conn.send(None)
+            except OSError:  # The worker has gone
+                pass
+            w.conn.close()
+        for w in self._workers:
+            w.process.join()
+
+
+def _fork_to_send(w: _Worker, fork, workers: List[_Worker], given: Dict):
+    if type(fork) == tuple:
+        if workers[fork[0]] is w:
+            return fork[1]  # One of its own new forks
+        else:
+            return given[fork]
+    else:
+        return fork
+
+
+def _receive(conn):
+    reply = conn.recv()
+    if isinstance(reply, Exception):
+        raise reply
+    return reply
@@ -0,0 +1,131 @@
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Tuple, Union
+import math
+import attr
+
+from graftlib.dot import Dot
+from graftlib.line import Line
+
+
+# The side of each square of the grid, in the same units as the strokes.
+# Graft's steps are 10 long by default, so most strokes touch 1-4 cells.
+default_cell_size = 50.0
+
+# Strokes that would be in more cells than this are kept in a separate
+# list that is always searched, so one huge line doesn't fill the grid.
+max_cells_per_stroke = 16
+
+
+Cell = Tuple[int, int]
+
+
+def _bounds(stroke: Union[Dot, Line]) -> Tuple[float, float, float, float]:
+    """
+    Return (left, bottom, right, top) of a stroke, with room around it
+    for its thickness: a line is abs(size) * 0.3 thick and a dot is
+    abs(size) / 2, so abs(size) is enough for either.
+    """
+    r = abs(stroke.size)
+    if type(stroke) == Line:
+        x1, y1 = stroke.start.x, stroke.start.y
+        x2, y2 = stroke.end.x, stroke.end.y
+        return (
+            min(x1, x2) - r,
+            min(y1, y2) - r,
+            max(x1, x2) + r,
+            max(y1, y2) + r,
+        )
+    else:  # Dot
+        x, y = stroke.pos.x, stroke.pos.y
+        return (x - r, y - r, x + r, y + r)
+
+
+@attr.s
+class StrokeGrid:
+    """
+    A uniform grid over the strokes of an Animation, so we can quickly
+    find the ones inside a rectangle, e.g. the part of the drawing we
+    can see.  Like Animation.strokes, strokes are added at the back and
+    removed from the front, and are found in the order they were added.
+    """
+    cell_size: float = attr.ib(default_cell_size)
+
+    # Each cell holds (index, stroke) for every stroke touching it,
+    # oldest first.  index counts strokes ever added.
+    _cells: Dict[Cell, Deque] = attr.ib(attr.Factory(dict), init=False)
+    _big: Deque = attr.ib(attr.Factory(deque), init=False)
+    _next: int = attr.ib(0, init=False)
+
+    def _cell_range(self, left, bottom, right, top):
+        s = self.cell_size
+        return (
+            math.floor(left / s),
+            math.floor(bottom / s),
+            math.floor(right / s),
+            math.floor(top / s),
+        )
+
+    def _cells_of(self, stroke) -> Iterator[Cell]:
+        """The cells stroke is in, or nothing if it is a big stroke."""
+        x1, y1, x2, y2 = self._cell_range(*_bounds(stroke))
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > max_cells_per_stroke:
+            return
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                yield (cx, cy)
+
+    def add(self, stroke: Union[Dot, Line]):
+        item = (self._next, stroke)
+        self._next += 1
+        big = True
+        for cell in self._cells_of(stroke):
+            big = False
+            items = self._cells.get(cell)
+            if items is None:
+                self._cells[cell] = deque((item,))
+            else:
+                items.append(item)
+        if big:
+            self._big.append(item)
+
+    def remove_oldest(self, strokes: List[Union[Dot, Line]]):
+        """
+        Remove these strokes, which must be the oldest ones we have,
+        oldest first.
+        """
+        for stroke in strokes:
+            big = True
+            for cell in self._cells_of(stroke):
+                big = False
+                items = self._cells[cell]
+                items.popleft()
+                if not items:
+                    del self._cells[cell]
+            if big:
+                self._big.popleft()
+
+    def find(
+            self,
+            left: float,
+            bottom: float,
+            right: float,
+            top: float,
+    ) -> List[Union[Dot, Line]]:
+        """
+        Return the strokes that might be inside this rectangle, oldest
+        first.  Some strokes near the rectangle may be included too.
+        """
+        x1, y1, x2, y2 = self._cell_range(left, bottom, right, top)
+        found = dict(self._big)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > len(self._cells):
+            # Fewer cells have strokes in than we would look at
+            for (cx, cy), items in self._cells.items():
+                if x1 <= cx <= x2 and y1 <= cy <= y2:
+                    found.update(items)
+        else:
+            for cx in range(x1, x2 + 1):
+                for cy in range(y1, y2 + 1):
+                    items = self._cells.get((cx, cy))
+                    if items is not None:
+                        found.update(items)
+        return [found[i] for i in sorted(found)]
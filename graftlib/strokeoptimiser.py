@@ -1,16 +1,82 @@
-from typing import List, Set, Union
+from functools import lru_cache
+from typing import Dict, List, Tuple, Union
+import sys
 import attr
 
 from graftlib.dot import Dot
 from graftlib.line import Line
-from graftlib.round_ import round_stroke
+from graftlib.pt import Pt
 
 
-@attr.s
+@attr.s(slots=True)
 class Elided:
     item: Union[Line, Dot] = attr.ib()
 
 
+# A stroke rounded to 1 decimal place, as whole numbers of tenths:
+# (x, y, style) for a Dot or (x1, y1, x2, y2, style) for a Line, where
+# style packs the colour and size together into one number.
+StrokeKey = Tuple[int, ...]
+
+
+def _tenths(x: float) -> int:
+    return round(x * 10.0)
+
+
+def _modulo_1000(t: int) -> int:
+    """Bring tenths within (-1000, 1000], i.e. a value within (-100, 100]"""
+    ret = ((t + 1000) % 2000) - 1000
+    return 1000 if ret == -1000 else ret
+
+
+@lru_cache(maxsize=1024)
+def _style(color: Tuple[float, float, float, float], size: float) -> int:
+    ret = 0
+    for x in color + (size,):
+        ret = ret << 11 | (_modulo_1000(_tenths(x)) + 999)
+    return ret
+
+
+def _unstyle(style: int):
+    values = []
+    for _ in range(5):
+        values.append(((style & 0x7ff) - 999) / 10.0)
+        style >>= 11
+    size, a, b, g, r = values
+    return (r, g, b, a), size
+
+
+def stroke_key(stroke: Union[Dot, Line]) -> StrokeKey:
+    if type(stroke) == Line:
+        return (
+            _tenths(stroke.start.x),
+            _tenths(stroke.start.y),
+            _tenths(stroke.end.x),
+            _tenths(stroke.end.y),
+            _style(stroke.color, stroke.size),
+        )
+    else:  # Dot
+        return (
+            _tenths(stroke.pos.x),
+            _tenths(stroke.pos.y),
+            _style(stroke.color, stroke.size),
+        )
+
+
+def _key_stroke(key: StrokeKey) -> Union[Dot, Line]:
+    """Make the rounded stroke that this key stands for."""
+    color, size = _unstyle(key[-1])
+    if len(key) == 5:
+        return Line(
+            Pt(key[0] / 10.0, key[1] / 10.0),
+            Pt(key[2] / 10.0, key[3] / 10.0),
+            color=color,
+            size=size,
+        )
+    else:
+        return Dot(Pt(key[0] / 10.0, key[1] / 10.0), color=color, size=size)
+
+
 @attr.s
 class StrokeOptimiser:
     """
@@ -18,12 +84,15 @@ class StrokeOptimiser:
     unique after rounding to 1 decimal place.
     For any stroke we are removing because they repeat a previous
     stroke, we emit an Elided instead.
+
+    We remember the strokes we have seen by a small key of whole numbers,
+    so we only make a rounded stroke the first time we see each one.
     """
 
     strokes: List[Union[Dot, Line]] = attr.ib()
 
-    seen_strokes: Set[Union[Dot, Line]] = (
-        attr.ib(attr.Factory(set), init=False)
+    seen_strokes: Dict[StrokeKey, Union[Dot, Line]] = (
+        attr.ib(attr.Factory(dict), init=False)
     )
 
     def __iter__(self):
@@ -36,11 +105,13 @@ class StrokeOptimiser:
     def _elide_if_seen(self, stroke: Union[Dot, Line]):
         if stroke is None:
             return stroke
-        st = round_stroke(stroke)
-        if st in self.seen_strokes:
+        key = stroke_key(stroke)
+        st = self.seen_strokes.get(key)
+        if st is not None:
             return Elided(st)
         else:
-            self.seen_strokes.add(st)
+            st = _key_stroke(key)
+            self.seen_strokes[key] = st
             return st
 
     def delete_stroke(self, stroke: Union[Dot, Line]):
@@ -48,4 +119,15 @@ class StrokeOptimiser:
         Forget that this stroke has been drawn, so if we draw it
         again, it won't be elided.
         """
-        self.seen_strokes.remove(stroke)
+        del self.seen_strokes[stroke_key(stroke)]
+
+    def memory_footprint(self) -> int:
+        """
+        Roughly how many bytes we are using to remember the strokes we
+        have seen, not counting the strokes themselves, which are
+        kept by whoever is drawing them.
+        """
+        ret = sys.getsizeof(self.seen_strokes)
+        for key in self.seen_strokes:
+            ret += sys.getsizeof(key) + sum(map(sys.getsizeof, key))
+        return ret
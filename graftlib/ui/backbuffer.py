@@ -0,0 +1,223 @@
+from collections import deque
+from typing import Optional, Tuple
+import math
+
+import cairo
+
+from graftlib.animation import Animation
+from graftlib.line import Line
+from graftlib.ui.cairo_draw import (
+    calc_line_size,
+    divide_by_100,
+    draw_positions,
+    draw_strokes,
+)
+
+
+# If the view moves or zooms by less than this many pixels, keep
+# drawing new strokes where the old view would put them.
+max_drift_pixels = 0.25
+
+
+# A rectangle in pixels: (x, y, width, height)
+Rect = Tuple[int, int, int, int]
+
+
+def _union(r1: Optional[Tuple], r2: Optional[Tuple]) -> Optional[Tuple]:
+    if r1 is None:
+        return r2
+    elif r2 is None:
+        return r1
+    else:
+        return (
+            min(r1[0], r2[0]),
+            min(r1[1], r2[1]),
+            max(r1[2], r2[2]),
+            max(r1[3], r2[3]),
+        )
+
+
+def _stroke_bounds(stroke, transform) -> Tuple[float, float, float, float]:
+    """Return (left, top, right, bottom) in pixels of a Line or Dot."""
+    x, y, scale = transform
+    if type(stroke) == Line:
+        pts = (stroke.start, stroke.end)
+        # Round line caps stick out by half the width of the line
+        r = calc_line_size(stroke.size, scale) * scale / 2
+    else:  # Dot
+        pts = (stroke.pos,)
+        r = abs(stroke.size) * scale / 2
+    xs = [x + p.x * scale for p in pts]
+    ys = [y - p.y * scale for p in pts]
+    # One more pixel for antialiasing
+    return (min(xs) - r - 1, min(ys) - r - 1, max(xs) + r + 1, max(ys) + r + 1)
+
+
+def _positions_bounds(animation: Animation, transform):
+    x, y, scale = transform
+    r = animation.dot_size * scale + 1
+    ret = None
+    for p in animation.poss:
+        px = x + p.x * scale
+        py = y - p.y * scale
+        ret = _union(ret, (px - r, py - r, px + r, py + r))
+    return ret
+
+
+class BackBuffer:
+    """
+    An off-screen surface holding the strokes of an Animation.  Each
+    frame we only draw the strokes added since the last frame onto it,
+    unless the view has moved, or a stroke we drew has been deleted, in
+    which case we draw everything again.  The dots showing where each
+    fork is are drawn on top when we paint, and are not kept.
+
+    If batched is True, strokes are drawn in groups of the same colour
+    and size (see draw_strokes_batched).
+    """
+
+    def __init__(self, batched: bool = False):
+        self.batched = batched
+        self.surface: Optional[cairo.ImageSurface] = None
+
+        # The (x, y, scale) the strokes on the surface were drawn with
+        self.transform: Optional[Tuple[float, float, float]] = None
+
+        self.full_redraws = 0
+
+        # The strokes on the surface, oldest first
+        self._drawn = deque()
+
+        # How many strokes animation had deleted when we last looked,
+        # and how many it had ever added that are on the surface.
+        self._num_deleted = 0
+        self._num_added = 0
+
+        self._positions = None
+
+    def update(self, animation: Animation, win_w: int, win_h: int) -> Rect:
+        """
+        Move on to the next frame of animation, drawing what we need to
+        onto the surface, and return the rectangle that has changed.
+        """
+        transform = animation.animate_window(win_w, win_h)
+        deleted_visible = self._forget_deleted(animation, win_w, win_h)
+        if (
+            deleted_visible or
+            self.surface is None or
+            self.surface.get_width() != win_w or
+            self.surface.get_height() != win_h or
+            self._moved(transform, win_w, win_h)
+        ):
+            self._redraw(animation, transform, win_w, win_h)
+            changed = (0, 0, win_w, win_h)
+        else:
+            changed = self._draw_new(animation)
+
+        positions = _positions_bounds(animation, self.transform)
+        changed = _union(changed, _union(self._positions, positions))
+        self._positions = positions
+
+        if changed is None:
+            return (0, 0, 0, 0)
+        left = max(0, math.floor(changed[0]))
+        top = max(0, math.floor(changed[1]))
+        right = min(win_w, math.ceil(changed[2]))
+        bottom = min(win_h, math.ceil(changed[3]))
+        return (left, top, max(0, right - left), max(0, bottom - top))
+
+    def paint(self, cairo_cr, animation: Animation):
+        """Paint the surface onto cairo_cr, with the fork positions."""
+        cairo_cr.set_source_surface(self.surface, 0, 0)
+        cairo_cr.paint()
+
+        x, y, scale = self.transform
+        cairo_cr.translate(x, y)
+        cairo_cr.scale(scale, scale)
+        if animation.strokes:
+            cairo_cr.set_source_rgba(
+                *divide_by_100(animation.strokes[-1].color))
+        else:
+            cairo_cr.set_source_rgb(0.0, 0.0, 0.0)
+        draw_positions(cairo_cr, animation, self.batched)
+
+    def _forget_deleted(self, animation: Animation, win_w, win_h) -> bool:
+        """
+        Forget strokes animation has deleted, and return True if any of
+        them were on the part of the surface we can see.
+        """
+        ret = False
+        num = animation.num_deleted - self._num_deleted
+        self._num_deleted = animation.num_deleted
+        for _ in range(min(num, len(self._drawn))):
+            left, top, right, bottom = _stroke_bounds(
+                self._drawn.popleft(), self.transform)
+            if right > 0 and bottom > 0 and left < win_w and top < win_h:
+                ret = True
+        return ret
+
+    def _moved(self, transform, win_w, win_h) -> bool:
+        x, y, scale = transform
+        old_x, old_y, old_scale = self.transform
+        zoom_drift = abs(scale / old_scale - 1) * max(win_w, win_h)
+        return (
+            abs(x - old_x) > max_drift_pixels or
+            abs(y - old_y) > max_drift_pixels or
+            zoom_drift > max_drift_pixels
+        )
+
+    def _context(self):
+        cairo_cr = cairo.Context(self.surface)
+        x, y, scale = self.transform
+        cairo_cr.translate(x, y)
+        cairo_cr.scale(scale, scale)
+        return cairo_cr
+
+    def _redraw(self, animation: Animation, transform, win_w, win_h):
+        if (
+            self.surface is None or
+            self.surface.get_width() != win_w or
+            self.surface.get_height() != win_h
+        ):
+            self.surface = cairo.ImageSurface(
+                cairo.FORMAT_ARGB32, win_w, win_h)
+        self.transform = transform
+        self.full_redraws += 1
+
+        cairo_cr = self._context()
+        cairo_cr.set_source_rgb(1.0, 1.0, 1.0)
+        cairo_cr.paint()
+        draw_strokes(
+            cairo_cr,
+            animation.visible_strokes(transform, win_w, win_h),
+            transform[2],
+            self.batched,
+        )
+
+        self._drawn = deque(animation.strokes)
+        self._num_added = animation.num_deleted + len(animation.strokes)
+
+    def _draw_new(self, animation: Animation):
+        start = max(0, self._num_added - animation.num_deleted)
+        new = animation.strokes[start:]
+        self._num_added = animation.num_deleted + len(animation.strokes)
+        if not new:
+            return None
+
+        self._drawn.extend(new)
+
+        # Only draw the new strokes we can see
+        win_w = self.surface.get_width()
+        win_h = self.surface.get_height()
+        visible = []
+        ret = None
+        for stroke in new:
+            bounds = _stroke_bounds(stroke, self.transform)
+            left, top, right, bottom = bounds
+            if right > 0 and bottom > 0 and left < win_w and top < win_h:
+                visible.append(stroke)
+                ret = _union(ret, bounds)
+        if visible:
+            draw_strokes(
+                self._context(), visible, self.transform[2], self.batched)
+        return ret
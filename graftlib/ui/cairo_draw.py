@@ -1,6 +1,6 @@
 import math
 
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 import cairo
 
@@ -12,6 +12,14 @@ from graftlib.line import Line
 min_visible_line_width = 1.0
 default_line_width = 3.0
 
+# The side in pixels of the squares draw_strokes_batched divides the
+# drawing into, to see which strokes overlap.
+group_square_size = 32
+
+# Strokes touching more squares than this are treated as touching all
+# of them.
+max_group_squares = 16
+
 
 def calc_line_size(s: float, scale: float) -> float:
     width = (abs(s) / 5.0) * default_line_width
@@ -47,24 +55,126 @@ def draw_dot(cairo_cr, dot: Dot):
     cairo_cr.stroke()
 
 
-def cairo_draw(animation: Animation, cairo_cr, win_w, win_h):
-
-    x, y, scale = animation.animate_window(win_w, win_h)
-    cairo_cr.translate(x, y)
-    cairo_cr.scale(scale, scale)
+def _squares(
+        stroke, scale: float, side: float) -> Optional[List[Tuple[int, int]]]:
+    """
+    The squares of side (in the same units as strokes) that stroke
+    touches, when drawn at this scale, as (x, y) of the square, or None
+    if there are more than max_group_squares.
+    """
+    if type(stroke) == Line:
+        x1, y1 = stroke.start.x, stroke.start.y
+        x2, y2 = stroke.end.x, stroke.end.y
+        if x1 > x2:
+            x1, x2 = x2, x1
+        if y1 > y2:
+            y1, y2 = y2, y1
+        r = calc_line_size(stroke.size, scale) / 2
+    else:  # Dot
+        x1 = x2 = stroke.pos.x
+        y1 = y2 = stroke.pos.y
+        r = abs(stroke.size) / 2
+    # One more pixel for antialiasing
+    r += 1.0 / scale
+    left = math.floor((x1 - r) / side)
+    right = math.floor((x2 + r) / side)
+    bottom = math.floor((y1 - r) / side)
+    top = math.floor((y2 + r) / side)
+    if (right - left + 1) * (top - bottom + 1) > max_group_squares:
+        return None
+    return [
+        (sx, sy)
+        for sx in range(left, right + 1)
+        for sy in range(bottom, top + 1)
+    ]
+
+
+def _group_strokes(strokes, scale) -> List[Tuple[Tuple, List]]:
+    """
+    Sort strokes into groups that can be drawn as one path: lines with
+    the same colour and size, and dots with the same colour.  Return
+    (key, strokes) for each group, in the order to draw them.
+
+    A stroke joins the last group like it, unless a later group has a
+    stroke near it, in which case it starts a new group, so strokes
+    that overlap are still drawn in their original order.
+    """
+    side = group_square_size / scale
+    ret = []
+    last_group = {}  # key -> index in ret of the last group with that key
+    last_in_square = {}  # square -> index of the last group drawn there
+    for stroke in strokes:
+        if type(stroke) == Line:
+            key = (Line, stroke.color, stroke.size)
+        else:  # Dot
+            key = (Dot, stroke.color)
+        i = last_group.get(key, -1)
+        squares = _squares(stroke, scale, side)
+        if squares is None:
+            if i < len(ret) - 1:  # It touches every group
+                i = -1
+        elif i >= 0:
+            for square in squares:
+                if last_in_square.get(square, -1) > i:
+                    i = -1
+                    break
+        if i < 0:
+            i = len(ret)
+            last_group[key] = i
+            ret.append((key, []))
+        ret[i][1].append(stroke)
+        for square in squares or ():
+            last_in_square[square] = i
+    return ret
+
+
+def draw_strokes_batched(cairo_cr, strokes, scale):
+    """
+    Draw strokes in groups (see _group_strokes), with one call to stroke
+    or fill per group.  This is much faster when there are lots of
+    strokes.  Strokes that overlap strokes of another colour or size are
+    drawn in their original order, but where see-through strokes in the
+    same group overlap, they don't darken each other.
+    """
+    for key, group in _group_strokes(strokes, scale):
+        cairo_cr.set_source_rgba(*divide_by_100(key[1]))
+        if key[0] == Line:
+            cairo_cr.set_line_width(calc_line_size(key[2], scale))
+            for line in group:
+                # Minus signs on y coords because we are reversing the y
+                # axis.  See the same thing in extents too.
+                cairo_cr.move_to(line.start.x, -line.start.y)
+                cairo_cr.line_to(line.end.x, -line.end.y)
+            cairo_cr.stroke()
+        else:  # Dot
+            for dot in group:
+                cairo_cr.new_sub_path()
+                cairo_cr.arc(
+                    dot.pos.x, -dot.pos.y, dot.size / 2, 0.0, 2 * math.pi)
+            cairo_cr.fill()
 
-    cairo_cr.set_source_rgb(1.0, 1.0, 1.0)
-    cairo_cr.paint()
 
+def draw_strokes(cairo_cr, strokes, scale, batched=False):
     cairo_cr.set_line_cap(cairo.LINE_CAP_ROUND)
-
-    for stroke in animation.strokes:
+    if batched:
+        draw_strokes_batched(cairo_cr, strokes, scale)
+        return
+    for stroke in strokes:
         if type(stroke) == Line:
             draw_line(cairo_cr, stroke, scale)
         else:  # Dot
             draw_dot(cairo_cr, stroke)
 
+
+def draw_positions(cairo_cr, animation: Animation, batched=False):
+    """
+    Draw a dot where each fork is now, in the current colour, which is
+    normally the colour of the last stroke drawn.  If batched is True,
+    fill them all at once.
+    """
     for p in animation.poss:
+        if batched:
+            cairo_cr.new_sub_path()
         cairo_cr.arc(
             p.x,
             -p.y,
@@ -72,4 +182,49 @@ def cairo_draw(animation: Animation, cairo_cr, win_w, win_h):
             0,
             2 * math.pi
         )
+        if not batched:
+            cairo_cr.fill()
+    if batched:
         cairo_cr.fill()
+
+
+def cairo_draw(animation: Animation, cairo_cr, win_w, win_h, batched=False):
+
+    transform = animation.animate_window(win_w, win_h)
+    x, y, scale = transform
+    cairo_cr.translate(x, y)
+    cairo_cr.scale(scale, scale)
+
+    cairo_cr.set_source_rgb(1.0, 1.0, 1.0)
+    cairo_cr.paint()
+
+    strokes = animation.visible_strokes(transform, win_w, win_h)
+    draw_strokes(cairo_cr, strokes, scale, batched)
+    draw_positions(cairo_cr, animation, batched)
+
+
+def draw_hud(cairo_cr, tracer) -> Tuple[int, int, int, int]:
+    """
+    Draw the frames per second, and how long each stage of the last
+    frame took (see FrameTracer), in the top left corner.  Return the
+    (x, y, width, height) in pixels of what we drew.
+    """
+    lines = ["%5.1f fps" % tracer.fps()] + [
+        "%6.2f ms  %s" % (seconds * 1000, name)
+        for name, seconds in tracer.last_frame.items()
+    ]
+    line_height = 14
+    width = 220
+    height = line_height * len(lines) + 6
+
+    cairo_cr.set_source_rgba(0.0, 0.0, 0.0, 0.6)
+    cairo_cr.rectangle(0, 0, width, height)
+    cairo_cr.fill()
+    cairo_cr.set_source_rgb(1.0, 1.0, 1.0)
+    cairo_cr.select_font_face(
+        "monospace", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+    cairo_cr.set_font_size(11)
+    for i, line in enumerate(lines):
+        cairo_cr.move_to(4, line_height * (i + 1))
+        cairo_cr.show_text(line)
+    return (0, 0, width, height)
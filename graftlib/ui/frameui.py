@@ -0,0 +1,45 @@
+from typing import Tuple
+import cairo
+
+from graftlib.animation import Animation
+from graftlib.ui.backbuffer import BackBuffer
+
+
+class FrameUi:
+    """
+    Draws each frame of an animation onto the same surface, and passes
+    its pixels straight to writer, which must have add_frame(data, stride)
+    and close() methods, e.g. a GifWriter or a Y4mWriter.
+    If group_strokes is True, see draw_strokes_batched.
+    """
+
+    def __init__(
+            self,
+            animation: Animation,
+            writer,
+            image_size: Tuple[int, int],
+            group_strokes: bool = False,
+    ):
+        self.animation = animation
+        self.writer = writer
+        self.image_size = image_size
+        self.group_strokes = group_strokes
+
+    def run(self):
+        ims = cairo.ImageSurface(
+            cairo.FORMAT_ARGB32, self.image_size[0], self.image_size[1])
+        back_buffer = BackBuffer(self.group_strokes)
+        tracer = self.animation.tracer
+        more_frames = self.animation.step()
+        while more_frames:
+            with tracer.stage("draw"):
+                self._draw_frame(ims, back_buffer)
+            with tracer.stage("encode"):
+                self.writer.add_frame(ims.get_data(), ims.get_stride())
+            more_frames = self.animation.step()
+        self.writer.close()
+
+    def _draw_frame(self, ims, back_buffer: BackBuffer):
+        back_buffer.update(self.animation, ims.get_width(), ims.get_height())
+        back_buffer.paint(cairo.Context(ims), self.animation)
+        ims.flush()
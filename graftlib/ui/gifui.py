@@ -1,10 +1,8 @@
-import subprocess
-from typing import Tuple
-import cairo
+from typing import Optional, Tuple
 
 from graftlib.animation import Animation
-from graftlib.world import World
-from graftlib.ui.cairo_draw import cairo_draw
+from graftlib.gifwriter import GifWriter
+from graftlib.ui.pipelineui import frame_ui
 
 
 class GifUi:
@@ -12,70 +10,23 @@ class GifUi:
             self,
             animation: Animation,
             filename: str,
-            world: World,
             image_size: Tuple[int, int],
+            group_strokes: bool = False,
+            render_workers: Optional[int] = None,
     ):
         self.animation = animation
         self.filename = filename
-        self.world = world
         self.image_size = image_size
+        self.group_strokes = group_strokes
+        self.render_workers = render_workers
 
     def run(self):
-        with self.world.fs.tmpdir() as tmpdir:
-            n = 0
-            more_frames = self.animation.step()
-            while more_frames:
-                n += 1
-                self._draw_frame(n, tmpdir)
-                more_frames = self.animation.step()
-
-            # Copy the frame images so we can examine them
-            # args = [
-            #      "cp",
-            #      "-r",
-            #      "{dir_}/".format(dir_=tmpdir),
-            #      "./",
-            # ]
-            # self.world.stdout.write("$ %s\n" % (" ".join(args)))
-            # subprocess.run(args)
-
-            # Create gif using ffmpeg
-            # args = [
-            #     "ffmpeg",
-            #     "-loglevel",
-            #     "warning",
-            #     "-y",
-            #     "-i",
-            #     "{dir_}/frame_%d.png".format(dir_=tmpdir),
-            #     self.filename
-            # ]
-            # self.world.stdout.write("$ %s\n" % (" ".join(args)))
-            # subprocess.run(args)
-
-            args = [
-                "convert",
-                "-delay",
-                "5",
-                "{dir_}/frame_*.png".format(dir_=tmpdir),
-                self.filename
-            ]
-            # self.world.stdout.write("$ %s\n" % (" ".join(args)))
-            subprocess.run(args)
-
-    def _draw_frame(self, frame_number, tmpdir):
-        ims = cairo.ImageSurface(
-            cairo.FORMAT_ARGB32, self.image_size[0], self.image_size[1])
-
-        cairo_cr = cairo.Context(ims)
-
-        cairo_draw(
-            self.animation,
-            cairo_cr,
-            ims.get_width(),
-            ims.get_height(),
-        )
-
-        ret = "{dir_}/frame_{num:04}.png".format(dir_=tmpdir, num=frame_number)
-
-        ims.write_to_png(ret)
-        return ret
+        with open(self.filename, "wb") as f:
+            writer = GifWriter(f, self.image_size[0], self.image_size[1])
+            frame_ui(
+                self.animation,
+                writer,
+                self.image_size,
+                self.group_strokes,
+                self.render_workers,
+            ).run()
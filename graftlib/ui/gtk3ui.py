@@ -6,14 +6,21 @@ from gi.repository import Gtk, GObject
 from typing import Optional, Tuple
 
 from graftlib.animation import Animation
-from graftlib.ui.cairo_draw import cairo_draw
+from graftlib.ui.backbuffer import BackBuffer
+from graftlib.ui.cairo_draw import draw_hud
 
 
 ms_per_frame = 50
 
 
 class Gtk3Ui:
-    def __init__(self, animation: Animation, image_size: Tuple[int, int]):
+    def __init__(
+            self,
+            animation: Animation,
+            image_size: Tuple[int, int],
+            group_strokes: bool = False,
+            hud: bool = False,
+    ):
         self.win = Gtk.Window(resizable=True)
         self.canvas = Gtk.DrawingArea()
         self.canvas.set_size_request(*image_size)
@@ -23,23 +30,47 @@ class Gtk3Ui:
         self.timeout_id = GObject.timeout_add(
             ms_per_frame, self.on_timeout, None)
         self.animation = animation
+        self.back_buffer = BackBuffer(group_strokes)
+        self.hud = hud
+        self.hud_rect = (0, 0, 0, 0)
 
     def run(self):
         self.win.show_all()
         Gtk.main()
         return 0
 
-    def on_draw(self, _win, cr, _user_data: Optional):
-        cairo_draw(
+    def _update(self):
+        return self.back_buffer.update(
             self.animation,
-            cr,
             self.canvas.get_allocated_width(),
             self.canvas.get_allocated_height(),
         )
 
+    def on_draw(self, _win, cr, _user_data: Optional):
+        surface = self.back_buffer.surface
+        if (
+            surface is None or
+            surface.get_width() != self.canvas.get_allocated_width() or
+            surface.get_height() != self.canvas.get_allocated_height()
+        ):
+            self._update()
+        with self.animation.tracer.stage("paint"):
+            cr.save()
+            self.back_buffer.paint(cr, self.animation)
+            cr.restore()
+        if self.hud:
+            self.hud_rect = draw_hud(cr, self.animation.tracer)
+
     def on_timeout(self, _user_data):
+        tracer = self.animation.tracer
         more_frames = self.animation.step()
-        self.canvas.queue_draw()
-        while Gtk.events_pending():
-            Gtk.main_iteration_do(True)
+        with tracer.stage("draw"):
+            changed = self._update()
+        with tracer.stage("queue_draw"):
+            # Only the part of the window that changed needs to be drawn
+            self.canvas.queue_draw_area(*changed)
+            if self.hud:
+                self.canvas.queue_draw_area(*self.hud_rect)
+            while Gtk.events_pending():
+                Gtk.main_iteration_do(True)
         return more_frames
@@ -0,0 +1,172 @@
+from collections import deque
+from typing import Optional, Tuple
+import multiprocessing
+import queue
+import threading
+
+import attr
+import cairo
+
+from graftlib.animation import Animation
+from graftlib.ui.cairo_draw import divide_by_100, draw_positions, draw_strokes
+from graftlib.ui.frameui import FrameUi
+
+
+@attr.s(frozen=True)
+class FrameSnapshot:
+    """
+    Everything needed to draw one frame, taken from an Animation so
+    another process can draw it while the animation moves on.  It has
+    poss and dot_size like an Animation, so draw_positions can use it.
+    """
+    transform: Tuple[float, float, float] = attr.ib()
+    strokes: Tuple = attr.ib()
+    poss: Tuple = attr.ib()
+    dot_size: float = attr.ib()
+    color: Optional[Tuple[float, float, float, float]] = attr.ib()
+
+
+def snapshot(animation: Animation, win_w: int, win_h: int) -> FrameSnapshot:
+    """Move animation on to its next frame, and return what to draw."""
+    transform = animation.animate_window(win_w, win_h)
+    return FrameSnapshot(
+        transform,
+        tuple(animation.visible_strokes(transform, win_w, win_h)),
+        tuple(animation.poss),
+        animation.dot_size,
+        animation.strokes[-1].color if animation.strokes else None,
+    )
+
+
+# Each worker process draws every frame it is given onto the same surface
+_surface: Optional[cairo.ImageSurface] = None
+_batched = False
+
+
+def _init_worker(width: int, height: int, batched: bool):
+    global _surface, _batched
+    _surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    _batched = batched
+
+
+def _rasterise(frame: FrameSnapshot) -> Tuple[bytes, int]:
+    """Draw frame, returning its pixels and stride (see GifWriter)."""
+    cairo_cr = cairo.Context(_surface)
+    cairo_cr.set_source_rgb(1.0, 1.0, 1.0)
+    cairo_cr.paint()
+
+    x, y, scale = frame.transform
+    cairo_cr.translate(x, y)
+    cairo_cr.scale(scale, scale)
+    draw_strokes(cairo_cr, frame.strokes, scale, _batched)
+
+    if frame.color is None:
+        cairo_cr.set_source_rgb(0.0, 0.0, 0.0)
+    else:
+        cairo_cr.set_source_rgba(*divide_by_100(frame.color))
+    draw_positions(cairo_cr, frame, _batched)
+
+    _surface.flush()
+    return bytes(_surface.get_data()), _surface.get_stride()
+
+
+class _EncoderThread(threading.Thread):
+    """
+    Passes frames to writer in a separate thread, so we can carry on
+    running the animation while it encodes them.
+    """
+
+    def __init__(self, writer, max_waiting: int):
+        super().__init__(daemon=True)
+        self.writer = writer
+        self.frames = queue.Queue(max_waiting)
+        self.error: Optional[Exception] = None
+
+    def run(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue  # Keep taking frames so put() doesn't block
+            try:
+                self.writer.add_frame(*frame)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        self.frames.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        self.writer.close()
+
+
+class PipelineUi:
+    """
+    Like FrameUi, but draws the frames in a pool of worker processes.
+    We run the animation and take a FrameSnapshot of each frame, the
+    workers draw them, and a separate thread passes the drawn frames to
+    writer in order.  Only a few frames are allowed to wait at each
+    stage, so memory use stays small however many frames there are.
+
+    Each frame is drawn from scratch, so this only helps when there
+    are several CPU cores.
+
+    Only what happens in this process is traced (see FrameTracer):
+    taking snapshots, and waiting for the workers to draw them.
+    """
+
+    def __init__(
+            self,
+            animation: Animation,
+            writer,
+            image_size: Tuple[int, int],
+            group_strokes: bool = False,
+            workers: int = 2,
+    ):
+        self.animation = animation
+        self.writer = writer
+        self.image_size = image_size
+        self.group_strokes = group_strokes
+        self.workers = workers
+
+    def run(self):
+        width, height = self.image_size
+        encoder = _EncoderThread(self.writer, self.workers)
+        encoder.start()
+        drawing = deque()
+        tracer = self.animation.tracer
+        with multiprocessing.Pool(
+                self.workers,
+                _init_worker,
+                (width, height, self.group_strokes),
+        ) as pool:
+            while self.animation.step():
+                with tracer.stage("snapshot"):
+                    frame = snapshot(self.animation, width, height)
+                drawing.append(pool.apply_async(_rasterise, (frame,)))
+                if len(drawing) >= 2 * self.workers:
+                    with tracer.stage("wait for workers"):
+                        drawn = drawing.popleft().get()
+                        encoder.frames.put(drawn)
+            while drawing:
+                encoder.frames.put(drawing.popleft().get())
+        encoder.close()
+
+
+def frame_ui(
+        animation: Animation,
+        writer,
+        image_size: Tuple[int, int],
+        group_strokes: bool = False,
+        render_workers: Optional[int] = None,
+):
+    """
+    Return a PipelineUi if render_workers is given, or a FrameUi if not.
+    """
+    if render_workers:
+        return PipelineUi(
+            animation, writer, image_size, group_strokes, render_workers)
+    else:
+        return FrameUi(animation, writer, image_size, group_strokes)
@@ -0,0 +1,56 @@
+from typing import Optional, TextIO, Tuple
+import subprocess
+import sys
+
+from graftlib.animation import Animation
+from graftlib.videowriter import RawVideoWriter, ffmpeg_args
+from graftlib.ui.pipelineui import frame_ui
+
+
+class VideoUi:
+    """
+    Makes a video file (e.g. MP4 or WebM, depending on the filename)
+    by piping raw frames into ffmpeg as they are drawn.
+    """
+
+    def __init__(
+            self,
+            animation: Animation,
+            filename: str,
+            image_size: Tuple[int, int],
+            group_strokes: bool = False,
+            render_workers: Optional[int] = None,
+            stderr: TextIO = sys.stderr,
+    ):
+        self.animation = animation
+        self.filename = filename
+        self.image_size = image_size
+        self.group_strokes = group_strokes
+        self.render_workers = render_workers
+        self.stderr = stderr
+
+    def run(self) -> int:
+        width, height = self.image_size
+        try:
+            encoder = subprocess.Popen(
+                ffmpeg_args(self.filename, width, height),
+                stdin=subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            self.stderr.write(
+                "--video requires ffmpeg, but we couldn't find it.  " +
+                "(Try --raw-frames and convert the file yourself.)\n"
+            )
+            return 3
+        writer = RawVideoWriter(encoder.stdin, width, height)
+        try:
+            frame_ui(
+                self.animation,
+                writer,
+                self.image_size,
+                self.group_strokes,
+                self.render_workers,
+            ).run()
+        finally:
+            encoder.stdin.close()
+        return encoder.wait()
@@ -0,0 +1,124 @@
+from typing import BinaryIO, List
+import sys
+
+
+# How many frames per second videos play at.  (The same speed as gifs,
+# which show each frame for 5/100ths of a second.)
+frames_per_second = 20
+
+
+def packed_pixels(data, width: int, height: int, stride: int):
+    """
+    Return the pixels of a cairo ImageSurface with FORMAT_ARGB32, given
+    its data and stride, without any padding at the ends of the rows.
+    """
+    pixels = memoryview(data).cast("B")
+    if stride == width * 4:
+        return pixels
+    return b"".join(
+        pixels[y * stride:y * stride + width * 4] for y in range(height))
+
+
+def raw_pixel_format() -> str:
+    """
+    The ffmpeg name for the byte order of cairo's ARGB32 pixels, which
+    are stored as native-endian 32-bit numbers.
+    """
+    return "bgra" if sys.byteorder == "little" else "argb"
+
+
+def ffmpeg_args(filename: str, width: int, height: int) -> List[str]:
+    """The command to turn raw frames on stdin into a video file."""
+    return [
+        "ffmpeg",
+        "-loglevel", "warning",
+        "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", raw_pixel_format(),
+        "-s", "%dx%d" % (width, height),
+        "-r", str(frames_per_second),
+        "-i", "-",
+        "-pix_fmt", "yuv420p",
+        filename,
+    ]
+
+
+class RawVideoWriter:
+    """
+    Writes each frame to file as soon as it is added, as raw pixels
+    in the format given by raw_pixel_format().  Usually file is the
+    stdin of an encoder like ffmpeg (see ffmpeg_args).
+    """
+
+    def __init__(self, file: BinaryIO, width: int, height: int):
+        self.file = file
+        self.width = width
+        self.height = height
+
+    def add_frame(self, data, stride: int):
+        self.file.write(
+            packed_pixels(data, self.width, self.height, stride))
+
+    def close(self):
+        self.file.flush()
+
+
+def _ycbcr(pixel: int):
+    r = (pixel >> 16) & 0xff
+    g = (pixel >> 8) & 0xff
+    b = pixel & 0xff
+    # ITU-R BT.601, with Y in 16-235 and Cb, Cr in 16-240
+    return (
+        round(16 + (65.738 * r + 129.057 * g + 25.064 * b) / 256),
+        round(128 + (-37.945 * r - 74.494 * g + 112.439 * b) / 256),
+        round(128 + (112.439 * r - 94.154 * g - 18.285 * b) / 256),
+    )
+
+
+class _Planes(dict):
+    """
+    Maps a 0xAARRGGBB pixel to one of its Y, Cb or Cr values, working
+    out and remembering all three the first time we see the pixel.
+    """
+
+    def __init__(self, others: List["_Planes"], index: int):
+        super().__init__()
+        self.others = others
+        self.index = index
+
+    def __missing__(self, pixel: int) -> int:
+        values = _ycbcr(pixel)
+        for plane in self.others:
+            plane[pixel] = values[plane.index]
+        return values[self.index]
+
+
+class Y4mWriter:
+    """
+    Writes frames to file as a YUV4MPEG2 (y4m) video stream, which
+    most video tools can read.  Each frame is written as soon as it is
+    added, with no chroma subsampling.
+    """
+
+    def __init__(self, file: BinaryIO, width: int, height: int):
+        self.file = file
+        self.width = width
+        self.height = height
+        self._planes = []
+        for i in range(3):
+            self._planes.append(_Planes(self._planes, i))
+
+        file.write(
+            b"YUV4MPEG2 W%d H%d F%d:1 Ip A1:1 C444\n" %
+            (width, height, frames_per_second)
+        )
+
+    def add_frame(self, data, stride: int):
+        pixels = memoryview(
+            packed_pixels(data, self.width, self.height, stride)).cast("I")
+        self.file.write(b"FRAME\n")
+        for plane in self._planes:
+            self.file.write(bytes(map(plane.__getitem__, pixels)))
+
+    def close(self):
+        self.file.flush()
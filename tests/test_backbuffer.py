@@ -0,0 +1,176 @@
+import random
+import struct
+
+import pytest
+
+cairo = pytest.importorskip("cairo")
+
+from graftlib.animation import Animation  # noqa: E402
+from graftlib.dot import Dot  # noqa: E402
+from graftlib.eval_cell import eval_cell  # noqa: E402
+from graftlib.graftrun import graftrun  # noqa: E402
+from graftlib.lex_cell import lex_cell  # noqa: E402
+from graftlib.line import Line  # noqa: E402
+from graftlib.parse_cell import parse_cell  # noqa: E402
+from graftlib.pt import Pt  # noqa: E402
+from graftlib.strokeoptimiser import StrokeOptimiser  # noqa: E402
+from graftlib.ui.backbuffer import BackBuffer, _stroke_bounds  # noqa: E402
+from graftlib.ui.cairo_draw import cairo_draw, draw_strokes  # noqa: E402
+
+
+# --- Utils ---
+
+
+white = 0xffffffff
+
+
+def render(draw, win_w, win_h):
+    """
+    Call draw(cairo_cr) on a white surface of this size, and return
+    its pixels as a list of rows of ints.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, win_w, win_h)
+    cairo_cr = cairo.Context(surface)
+    cairo_cr.set_source_rgb(1.0, 1.0, 1.0)
+    cairo_cr.paint()
+    draw(cairo_cr)
+    surface.flush()
+    data = bytes(surface.get_data())
+    stride = surface.get_stride()
+    return [
+        struct.unpack_from("=%dI" % win_w, data, row * stride)
+        for row in range(win_h)
+    ]
+
+
+def render_strokes(strokes, transform, win_w, win_h):
+    def draw(cairo_cr):
+        x, y, scale = transform
+        cairo_cr.translate(x, y)
+        cairo_cr.scale(scale, scale)
+        draw_strokes(cairo_cr, strokes, scale)
+    return render(draw, win_w, win_h)
+
+
+def drawn_pixels(pixels):
+    return [
+        (px, py)
+        for py, row in enumerate(pixels)
+        for px, pixel in enumerate(row)
+        if pixel != white
+    ]
+
+
+def channel_difference(row1, row2):
+    return max(
+        abs(((p1 >> shift) & 0xff) - ((p2 >> shift) & 0xff))
+        for p1, p2 in zip(row1, row2)
+        for shift in (0, 8, 16, 24)
+    )
+
+
+def make_animation(program, max_strokes):
+    opt = StrokeOptimiser(
+        graftrun(
+            parse_cell(lex_cell(program)),
+            60,
+            random.Random(1).uniform,
+            20,
+            eval_cell,
+        )
+    )
+    return Animation(opt, opt, 10, max_strokes, 5)
+
+
+def random_stroke_near(rand, transform, win_w, win_h):
+    """A Line or Dot somewhere in or near the window."""
+    x, y, scale = transform
+
+    def pt():
+        return Pt(
+            (rand.uniform(-20, win_w + 20) - x) / scale,
+            (y - rand.uniform(-20, win_h + 20)) / scale,
+        )
+
+    size = rand.choice([0.1, 2, 5, 20, 100, 400])
+    if rand.random() < 0.5:
+        return Dot(pt(), size=size)
+    elif rand.random() < 0.2:
+        start = pt()
+        far = Pt(start.x + rand.uniform(-5000, 5000), start.y + 3000)
+        return Line(start, far, size=size)  # Often ends up in _big
+    else:
+        return Line(pt(), pt(), size=size * rand.choice([1, -1]))
+
+
+# --- Culling ---
+
+
+def test_Every_pixel_drawn_is_inside_the_culling_bounds():
+    rand = random.Random(2)
+    win_w, win_h = 40, 30
+    num_drawn = 0
+    for _ in range(1000):
+        transform = (
+            rand.uniform(-20, 60), rand.uniform(-20, 50),
+            rand.choice([0.02, 0.1, 0.5, 1.0, 3.0]),
+        )
+        stroke = random_stroke_near(rand, transform, win_w, win_h)
+        drawn = drawn_pixels(
+            render_strokes([stroke], transform, win_w, win_h))
+        if not drawn:
+            continue
+        num_drawn += 1
+
+        # The StrokeGrid finds it
+        animation = Animation(iter([]), None, 0, 10, 5)
+        animation.stroke_grid.add(stroke)
+        assert animation.visible_strokes(transform, win_w, win_h) == [stroke]
+
+        # BackBuffer knows which pixels it might change
+        left, top, right, bottom = _stroke_bounds(stroke, transform)
+        for px, py in drawn:
+            assert left <= px and px + 1 <= right
+            assert top <= py and py + 1 <= bottom
+
+    assert num_drawn > 300
+
+
+# --- Drawing frames ---
+
+
+def test_Back_buffer_frames_look_like_full_redraws():
+    programs = [
+        ("d+=10 S()", 1000),  # Settles down, so mostly new strokes
+        ("d+=23 s+=0.5 r+=3 S() D()", 40),  # Zooms out, and deletes
+        ("T(3,F) d=f*120 ^ d+=7 S() g+=5", 25),  # Forks
+    ]
+    win_w, win_h = 80, 60
+    for program, max_strokes in programs:
+        for batched in (False, True):
+            animation1 = make_animation(program, max_strokes)
+            animation2 = make_animation(program, max_strokes)
+            back_buffer = BackBuffer(batched)
+            frames = 0
+            while animation1.step():
+                assert animation2.step()
+                frames += 1
+                back_buffer.update(animation1, win_w, win_h)
+                kept = render(
+                    lambda cr: back_buffer.paint(cr, animation1),
+                    win_w,
+                    win_h,
+                )
+                redrawn = render(
+                    lambda cr: cairo_draw(
+                        animation2, cr, win_w, win_h, batched),
+                    win_w,
+                    win_h,
+                )
+                # The back buffer can be up to max_drift_pixels out
+                for row1, row2 in zip(kept, redrawn):
+                    assert channel_difference(row1, row2) < 96
+            assert not animation2.step()
+
+            # Some frames were drawn from scratch, and some were not
+            assert 1 < back_buffer.full_redraws < frames
@@ -0,0 +1,128 @@
+import random
+
+import pytest
+from graftlib.batchrun import CannotBatch, compile_batch, run_batch
+from graftlib.dot import Dot
+from graftlib.eval_cell import eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.line import Line
+from graftlib.make_graft_env import make_graft_env
+from graftlib.numbervalue import NumberValue
+from graftlib.parse_cell import parse_cell
+from graftlib.pt import Pt
+
+numpy = pytest.importorskip("numpy")
+
+
+# --- Utils ---
+
+
+def compiled(inp):
+    [statement] = parse_cell(lex_cell(inp))
+    return compile_batch(statement)
+
+
+def envs(*setups):
+    ret = []
+    for setup in setups:
+        env = make_graft_env()
+        for name, value in setup.items():
+            env.set(name, NumberValue(value))
+        ret.append(env)
+    return ret
+
+
+def run(program, n, batch):
+    return list(
+        graftrun(
+            parse_cell(lex_cell(program)),
+            n,
+            random.Random(7).uniform,
+            50,
+            eval_cell,
+            batch,
+        )
+    )
+
+
+# --- Compiling ---
+
+
+def test_Turtle_natives_and_arithmetic_can_be_batched():
+    assert compiled("S()") is not None
+    assert compiled("D()") is not None
+    assert compiled("d+=360/7") is not None
+    assert compiled("x=y*2-f") is not None
+
+
+def test_Other_statements_cannot_be_batched():
+    assert compiled("F()") is None
+    assert compiled("R()") is None
+    assert compiled("S(3)") is None
+    assert compiled("d=R()") is None
+    assert compiled("T(3,S)") is None
+    assert compiled("'x'") is None
+
+
+# --- Running ---
+
+
+def test_Step_moves_and_draws_for_each_env():
+    es = envs({"x": 1}, {"s": 2})
+    strokes = run_batch(compiled("S()"), es)
+    assert strokes == [
+        [Line(Pt(1.0, 0.0), Pt(1.0, 10.0), (0.0, 0.0, 0.0, 100.0), 5.0)],
+        [Line(Pt(0.0, 0.0), Pt(0.0, 2.0), (0.0, 0.0, 0.0, 100.0), 5.0)],
+    ]
+    assert es[0].get("xprev").value == 1.0
+    assert es[1].get("y").value == 2.0
+    assert es[1].get("yprev").value == 0.0
+
+
+def test_Modifying_a_variable_changes_it_in_each_env():
+    es = envs({"d": 1}, {"d": 2})
+    assert run_batch(compiled("d*=3+1"), es) == [None, None]
+    assert es[0].get("d") == NumberValue(4.0)
+    assert es[1].get("d") == NumberValue(8.0)
+
+
+def test_Setting_x_remembers_the_previous_value():
+    es = envs({"x": 3, "yprev": 0}, {"x": 4, "yprev": 0})
+    run_batch(compiled("x=-1"), es)
+    assert run_batch(compiled("L()"), es) == [
+        [Line(Pt(3.0, 0.0), Pt(-1.0, 0.0), (0.0, 0.0, 0.0, 100.0), 5.0)],
+        [Line(Pt(4.0, 0.0), Pt(-1.0, 0.0), (0.0, 0.0, 0.0, 100.0), 5.0)],
+    ]
+
+
+def test_Dot_uses_each_envs_colour():
+    es = envs({"r": 50}, {"g": 20, "z": 2})
+    assert run_batch(compiled("D()"), es) == [
+        [Dot(Pt(0.0, 0.0), (50.0, 0.0, 0.0, 100.0), 5.0)],
+        [Dot(Pt(0.0, 0.0), (0.0, 20.0, 0.0, 100.0), 2.0)],
+    ]
+
+
+def test_Unsuitable_envs_are_left_unchanged():
+    es = envs({"d": 1}, {"d": 0})
+    with pytest.raises(CannotBatch):
+        run_batch(compiled("d=1/d"), es)
+    with pytest.raises(CannotBatch):
+        run_batch(compiled("d=unknown"), es)
+    es[1].set("S", es[1].get("J"))
+    with pytest.raises(CannotBatch):
+        run_batch(compiled("S()"), es)
+    assert es[0].get("d") == NumberValue(1)
+    assert es[0].get("x") == NumberValue(0)
+
+
+def test_Batched_programs_draw_the_same():
+    programs = [
+        "T(20,F) d=f*7 ^ S() d+=f/10 x+=1 S() r=f D()",
+        "dd=0 ^ T(3,F) d=f*30 d+=dd T(10,S) dd+=1",
+        "T(9,F) ^ d+=R() S() J() L() z=f/2+1",
+        "T(9,F) S=J ^ S() d+=10",
+    ]
+    for program in programs:
+        assert run(program, 40, True) == run(program, 40, False)
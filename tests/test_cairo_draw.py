@@ -0,0 +1,123 @@
+import random
+import struct
+
+import pytest
+
+cairo = pytest.importorskip("cairo")
+
+from graftlib.dot import Dot  # noqa: E402
+from graftlib.line import Line  # noqa: E402
+from graftlib.pt import Pt  # noqa: E402
+from graftlib.ui.cairo_draw import _group_strokes, draw_strokes  # noqa: E402
+
+
+# --- Utils ---
+
+
+red = (100.0, 0.0, 0.0, 100.0)
+blue = (0.0, 0.0, 100.0, 100.0)
+
+
+def render(strokes, batched, win_w=60, win_h=40, scale=2.0):
+    """
+    Draw strokes with (0, 0) in the middle of a white surface, and
+    return its pixels as ints.
+    """
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, win_w, win_h)
+    cairo_cr = cairo.Context(surface)
+    cairo_cr.set_source_rgb(1.0, 1.0, 1.0)
+    cairo_cr.paint()
+    cairo_cr.translate(win_w / 2, win_h / 2)
+    cairo_cr.scale(scale, scale)
+    draw_strokes(cairo_cr, strokes, scale, batched)
+    surface.flush()
+    data = bytes(surface.get_data())
+    stride = surface.get_stride()
+    return [
+        pixel
+        for row in range(win_h)
+        for pixel in struct.unpack_from("=%dI" % win_w, data, row * stride)
+    ]
+
+
+def channel_difference(pixel1, pixel2):
+    return max(
+        abs(((pixel1 >> shift) & 0xff) - ((pixel2 >> shift) & 0xff))
+        for shift in (0, 8, 16, 24)
+    )
+
+
+def groups(strokes):
+    return [group for _, group in _group_strokes(strokes, 1.0)]
+
+
+def random_opaque_stroke(rand):
+    color = rand.choice([red, blue, (0.0, 80.0, 0.0, 100.0)])
+    pt = Pt(rand.uniform(-15, 15), rand.uniform(-10, 10))
+    if rand.random() < 0.3:
+        return Dot(pt, color, rand.choice([2.0, 6.0]))
+    end = Pt(pt.x + rand.uniform(-8, 8), pt.y + rand.uniform(-8, 8))
+    return Line(pt, end, color, rand.choice([1.0, 5.0]))
+
+
+# --- Grouping ---
+
+
+def test_Strokes_of_the_same_style_are_grouped_in_order():
+    lines = [Line(Pt(i * 100, 0), Pt(i * 100 + 10, 0), red) for i in range(3)]
+    dots = [Dot(Pt(i * 100, 50), blue) for i in range(3)]
+    mixed = [lines[0], dots[0], lines[1], dots[1], lines[2], dots[2]]
+    assert groups(mixed) == [lines, dots]
+
+
+def test_Overlapping_strokes_of_different_styles_stay_in_order():
+    red1 = Line(Pt(0, 0), Pt(20, 0), red)
+    blue1 = Line(Pt(10, -10), Pt(10, 10), blue)
+    red2 = Line(Pt(0, 5), Pt(20, 5), red)  # Crosses blue1
+    red3 = Line(Pt(500, 0), Pt(520, 0), red)  # Far from everything
+    assert groups([red1, blue1, red2, red3]) == [
+        [red1], [blue1], [red2, red3]]
+
+
+def test_Dots_overlapping_lines_of_the_same_colour_stay_in_order():
+    line1 = Line(Pt(0, 0), Pt(20, 0), red)
+    dot = Dot(Pt(10, 0), blue)
+    line2 = Line(Pt(0, 0), Pt(20, 0), blue)
+    dot2 = Dot(Pt(10, 0), red)
+    assert groups([line1, dot, line2, dot2]) == [
+        [line1], [dot], [line2], [dot2]]
+
+
+def test_Huge_strokes_are_drawn_after_everything_before_them():
+    small = Line(Pt(0, 0), Pt(1, 0), red)
+    other = Line(Pt(500, 0), Pt(501, 0), blue)
+    huge = Line(Pt(-5000, 0), Pt(5000, 0), red)
+    assert groups([small, other, huge]) == [[small], [other], [huge]]
+
+
+# --- Drawing ---
+
+
+def test_Grouped_strokes_cover_later_strokes_of_other_styles_in_order():
+    strokes = [
+        Line(Pt(-20, 0), Pt(20, 0), red),
+        Line(Pt(0, -10), Pt(0, 10), blue),
+        Line(Pt(-20, 1), Pt(20, 1), red),
+    ]
+    assert render(strokes, True) == render(strokes, False)
+
+
+def test_Grouped_opaque_strokes_look_like_ungrouped_ones():
+    rand = random.Random(3)
+    for _ in range(20):
+        strokes = [random_opaque_stroke(rand) for _ in range(30)]
+        grouped = render(strokes, True)
+        ungrouped = render(strokes, False)
+        # Only the antialiased edges of strokes of the same style that
+        # overlap each other differ, and not by as much as a stroke
+        # drawn in the wrong order would.
+        differences = [
+            channel_difference(p1, p2) for p1, p2 in zip(grouped, ungrouped)
+        ]
+        assert max(differences) < 128
+        assert sum(1 for d in differences if d > 0) < len(grouped) / 20
@@ -0,0 +1,203 @@
+import pytest
+from graftlib.compile_cell import CellCompiler
+from graftlib.env import Env
+from graftlib.eval_cell import (
+    ArrayValue,
+    NativeFunctionValue,
+    NoneValue,
+    NumberValue,
+    StringValue,
+    eval_cell,
+)
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.parse_cell import FunctionCallTree, NumberTree, parse_cell
+from graftlib.programenv import ProgramEnv
+from graftlib import make_graft_env
+
+
+# --- Utils ---
+
+
+def make_env(compiler):
+    ret = ProgramEnv(Env(), None, None, compiler)
+    make_graft_env.add_cell_symbols(ret)
+    return ret
+
+
+def evald(inp, env=None):
+    if env is None:
+        env = make_env(CellCompiler())
+    ret = NoneValue()
+    for expr in parse_cell(lex_cell(inp)):
+        ret = env.eval_expr(env, expr)
+    return ret
+
+
+def assert_prog_fails(program, error, env=None):
+    with pytest.raises(
+        Exception,
+        match=error
+    ):
+        evald(program, env)
+
+
+def run(chars, n, eval_expr, rand=None):
+    return list(
+        graftrun(parse_cell(lex_cell(chars)), n, rand, 10, eval_expr)
+    )
+
+
+# --- Evaluating ---
+
+
+def test_Evaluating_an_empty_program_gives_none():
+    assert evald("") == NoneValue()
+
+
+def test_Evaluating_a_primitive_returns_itself():
+    assert evald("3") == NumberValue(3)
+    assert evald("-3.1") == NumberValue(-3.1)
+    assert evald("'foo'") == StringValue("foo")
+
+
+def test_Arithmetic_expressions_come_out_correct():
+    assert evald("3+4") == NumberValue(7)
+    assert evald("3-4") == NumberValue(-1)
+    assert evald("3*-4") == NumberValue(-12)
+    assert evald("3/4") == NumberValue(0.75)
+
+
+def test_Comparisons_come_out_correct():
+    assert evald("3>4") == NumberValue(0)
+    assert evald("3<4") == NumberValue(1)
+    assert evald("4>=4") == NumberValue(1)
+    assert evald("5<=4") == NumberValue(0)
+    assert evald("4==4") == NumberValue(1)
+
+
+def test_Modifying_arithmetic_expressions_come_out_correct():
+    assert evald("r=3 r+=4 r") == NumberValue(7)
+    assert evald("r=3 r-=4 r") == NumberValue(-1)
+    assert evald("r=3 r*=4 r") == NumberValue(12)
+    assert evald("r=3 r/=4 r") == NumberValue(0.75)
+
+
+def test_Undefined_variables_are_equal_to_0():
+    assert evald("foo") == NumberValue(0)
+
+
+def test_Functions_can_be_defined_and_called():
+    assert evald("add={:(x,y)x+y} add(20,2.2)") == NumberValue(22.2)
+    assert evald("{10 11}()") == NumberValue(11)
+
+
+def test_Functions_see_changes_to_enclosing_variables():
+    assert evald("x=1 f={x} x=2 f()") == NumberValue(2)
+
+
+def test_Arrays_are_evaluated():
+    assert (
+        evald("[1+1,'a']") ==
+        ArrayValue([NumberValue(2), StringValue("a")])
+    )
+
+
+def test_Native_function_gets_called():
+    def native_fn(_env, x, y):
+        return NumberValue(x.value + y.value)
+    env = make_env(CellCompiler())
+    env.set("native_fn", NativeFunctionValue(native_fn))
+    assert evald("native_fn(2,8)", env) == NumberValue(10)
+
+
+def test_Stdlib_functions_can_be_called():
+    assert evald("x=0 While({x<3},{x+=1}) x") == NumberValue(3)
+    assert evald("For(Range(4),{:(i)i*2})") == ArrayValue(
+        [NumberValue(0), NumberValue(2), NumberValue(4), NumberValue(6)])
+
+
+def test_Runtime_calls_made_by_natives_are_not_cached():
+    compiler = CellCompiler()
+    env = make_env(compiler)
+    fn = evald("{3}", env)
+    num_cached = len(compiler._statements)
+    assert compiler(env, FunctionCallTree(fn, [])) == NumberValue(3)
+    assert compiler(env, FunctionCallTree(fn, [])) == NumberValue(3)
+    assert len(compiler._statements) == num_cached
+
+
+def test_Wrong_number_of_arguments_to_a_function_is_an_error():
+    assert_prog_fails(
+        "x={:(a,b,c)} x(3,2)",
+        (
+            r"2 arguments passed to function SymbolTree\(value='x'\), " +
+            "but it requires 3 arguments."
+        ),
+    )
+
+
+def test_Parameters_holding_nothing_are_unknown_symbols():
+    assert_prog_fails(
+        "ff={:(n) n*2+s} p=ff({D() S()}())",
+        "Unknown symbol 'n'.",
+        ProgramEnv(
+            make_graft_env.make_graft_env(), None, None, CellCompiler()),
+    )
+
+
+def test_Calling_a_non_function_is_an_error():
+    assert_prog_fails(
+        "x=3 x()",
+        "Attempted to call something that is not a function",
+    )
+
+
+# --- Running whole programs ---
+
+
+def test_Compiled_programs_draw_the_same_as_tree_walking():
+    programs = [
+        "S() d+=10",
+        "s=100 J() d+=90 S() d+=90 S() d+=90 S() d+=90 d+=15",
+        "dd=0 ^ T(11,F) d=f*30 d+=dd T(10,S) dd+=1",
+        "b=70 a=90 s=20 d-=10 T(10,{S() d+=4}) T(35,F) s=10 r=f g=f " +
+        "b=f r*=20 g*=45 b*=75 d=f*10 T(4,{S() d+=10}) " +
+        "T(6,{a-=20 S() d+=10}) ^ s=1 d+=10 S()",
+        "x=-5 y=3 L() D() S()",
+        "h={:(d) S() d+=45 S() d} h(90) S() z=2 {z+=1 D() r=50}() D()",
+        "q={:(x) x+=3 S() L() y=x} q(2) S() L() T(2,{x+=1 L()})",
+    ]
+    for program in programs:
+        assert (
+            run(program, 50, CellCompiler()) ==
+            run(program, 50, eval_cell)
+        )
+
+
+def test_Parameters_shadow_outer_names_and_can_be_changed():
+    assert evald("a=1 {:(a)a+=2 a}(10)") == NumberValue(12)
+    assert evald("a=1 {:(a)a+=2 a}(10) a") == NumberValue(1)
+    assert evald("{:(a){:(b)a=a+b}}(1)(2)") == NumberValue(3)
+    assert evald("f={:(a){a}} f(4)()") == NumberValue(4)
+
+
+def test_Number_literals_are_shared():
+    number = CellCompiler().compile(NumberTree("3"))
+    assert number(None) is number(None)
+    assert number(None) == NumberValue(3)
+
+
+def test_Arithmetic_is_done_on_floats():
+    [expr] = parse_cell(lex_cell("2*-3+1"))
+    assert CellCompiler().compile_float(expr)(None) == -5.0
+    assert CellCompiler().compile(expr)(None) == NumberValue(-5.0)
+
+
+def test_A_call_site_notices_when_its_function_changes():
+    assert evald("g={:(h)h()} g({1}) g({2})") == NumberValue(2)
+    assert_prog_fails(
+        "g={:(h)h()} g({1}) g({:(a)a})",
+        r"0 arguments passed to function SymbolTree\(value='h'\), " +
+        "but it requires 1 arguments.",
+    )
@@ -1,5 +1,5 @@
 import pytest
-from graftlib.env import Env
+from graftlib.env import Env, SlotEnv
 
 
 def test_Getting_a_name_after_setting_returns_its_value():
@@ -73,3 +73,82 @@ def test_Cloned_env_and_parents_are_independent():
     # Old stuff was unaffected
     assert child.get("p") == 1010
     assert child.get("c") == 1008
+
+
+def test_SlotEnv_values_are_found_by_name_and_by_slot():
+    parent = Env()
+    parent.set("p", 10)
+    child = parent.make_slot_child({"a": 0, "b": 1}, [1, 2])
+    assert child.get("a") == 1
+    assert child.get("b") == 2
+    assert child.get("p") == 10
+    assert child.frame(0).slots == [1, 2]
+    assert child.frame(1) is parent
+
+
+def test_Setting_a_slot_name_updates_its_slot():
+    child = Env().make_slot_child({"a": 0}, [1])
+    grandchild = child.make_child()
+    grandchild.set("a", 5)
+    child.set("c", 6)
+    assert child.slots == [5]
+    assert child.local_items() == {"a": 5, "c": 6}
+    assert not grandchild.contains("a")
+
+
+def test_Cloned_SlotEnv_has_independent_slots():
+    child = Env().make_slot_child({"a": 0}, [1])
+    new_child = child.clone()
+    new_child.set("a", 2)
+    assert child.get("a") == 1
+    assert new_child.get("a") == 2
+
+
+def test_Cloned_env_shares_values_until_changed():
+    env = Env()
+    env.set("p", [1])
+    new_env = env.clone()
+    assert new_env.get("p") is env.get("p")
+
+    new_env.get("unknown")  # Creates a default value
+    new_env.set("q", 2)
+    assert not env.contains("unknown")
+    assert not env.contains("q")
+    assert new_env.get("p") is env.get("p")
+
+
+def test_Sealed_env_values_can_be_hidden_but_not_changed():
+    sealed = Env()
+    sealed.set("s", 1)
+    sealed.seal()
+    child = sealed.make_child()
+    child.set("s", 2)
+    assert child.get("s") == 2
+    assert sealed.get("s") == 1
+    assert child.clone().parent() is sealed
+    with pytest.raises(Exception, match="Can't change s in a sealed Env."):
+        sealed.set("s", 3)
+
+
+def test_Unknown_names_are_created_outside_sealed_envs():
+    sealed = Env()
+    sealed.seal()
+    glob = sealed.make_child()
+    child = glob.make_child()
+    assert child.get("u").value == 0.0
+    assert glob.contains("u")
+    assert not sealed.contains("u")
+
+
+def test_Globals_are_found_from_inside_unless_hidden():
+    glob = SlotEnv(Env(), {"x": 0, "d": 1}, [1, 2], is_globals=True)
+    child = glob.make_child()
+    assert child.make_slot_child({"a": 0}, [3]).globals is glob
+    assert child.make_slot_child({"x": 0}, [3]).globals is None
+    hiding = child.make_child()
+    hiding.set_new("d", 4)
+    assert hiding.globals is None
+    assert hiding.make_child().globals is None
+    assert hiding.clone().globals is None
+    assert child.clone().globals is not glob
+    assert child.clone().globals.slots == [1, 2]
@@ -3,12 +3,12 @@ import itertools
 from typing import Iterable, List, Optional, Tuple, Union
 
 from graftlib.dot import Dot
-from graftlib.env import Env
-from graftlib.graftrun import graftrun, graftrun_debug
+from graftlib.env import Env, SlotEnv
+from graftlib.graftrun import RunningProgram, graftrun, graftrun_debug
 from graftlib.eval_cell import eval_cell
 from graftlib.lex_cell import lex_cell
 from graftlib.line import Line
-from graftlib.make_graft_env import make_graft_env
+from graftlib.make_graft_env import builtins_env, make_graft_env
 from graftlib.numbervalue import NumberValue
 from graftlib.pt import Pt
 from graftlib.parse_cell import parse_cell
@@ -44,24 +44,20 @@ def rounded_dict(env):
     Float values are rounded.
     """
 
-    default_env = make_graft_env()
+    default_items = {}
     ret = {}
 
-    def add_items(env):
+    def add_items(env, items):
         if env.parent() is not None:
-            add_items(env.parent())
+            add_items(env.parent(), items)
         for k, v in env.local_items().items():
-            v = round_value(v)
-            if (
-                k in default_env.local_items() and
-                round_value(default_env.local_items()[k]) == v
-            ):
-                if k in ret:
-                    del ret[k]
-            else:
-                ret[k] = v
-
-    add_items(env)
+            items[k] = round_value(v)
+
+    add_items(make_graft_env(), default_items)
+    add_items(env, ret)
+    for k, v in default_items.items():
+        if k in ret and ret[k] == v:
+            del ret[k]
     return ret
 
 
@@ -729,3 +725,29 @@ def test_For_myrange():
             [Dot(Pt(40.0, 0.0))],
         ]
     )
+
+
+def test_forks_share_the_program_and_do_not_nest_envs():
+    forks = []
+    program = list(parse_cell(lex_cell("F() F()")))
+    prog = RunningProgram(
+        program, None, forks.append, make_graft_env(), eval_cell)
+    prog.next()
+    forks[0].next()
+    assert forks[1].program is program
+    assert type(forks[1].env.env) == SlotEnv
+
+
+def test_stdlib_functions_can_draw():
+    assert (
+        do_eval("i=0 While({i<2},{i+=1 S()})", 2) ==
+        [
+            [Line(Pt(0.0, 0.0), Pt(0.0, 10.0))],
+            [Line(Pt(0.0, 10.0), Pt(0.0, 20.0))],
+        ]
+    )
+
+
+def test_builtins_can_be_hidden_by_programs():
+    assert do_eval("S=J S() S=D S()", 1) == [[Dot(Pt(0.0, 10.0))]]
+    assert make_graft_env().get("S") == builtins_env().get("S")
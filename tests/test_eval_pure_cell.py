@@ -426,3 +426,9 @@ def test_Maths_functions_give_correct_answers():
     assert r(evald("Sqrt(16)")) == evald("4")
     assert r(evald("Pow(2,3)")) == evald("8")
     assert r(evald("Hypot(3,4)")) == evald("5")
+
+
+def test_Native_function_arity_excludes_the_env():
+    def native_fn(_env, x, y):
+        return NumberValue(x.value + y.value)
+    assert NativeFunctionValue(native_fn).arity == 2
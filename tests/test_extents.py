@@ -0,0 +1,68 @@
+import random
+
+from graftlib.dot import Dot
+from graftlib.extents import Extents, WindowExtents
+from graftlib.line import Line
+from graftlib.pt import Pt
+
+
+# --- Utils ---
+
+
+def bounds(extents):
+    return extents.centre(), extents.size()
+
+
+def brute_force(strokes):
+    ret = Extents()
+    for stroke in strokes:
+        ret.add_cmd(stroke)
+    return ret
+
+
+# --- Extents ---
+
+
+def test_A_single_point_has_zero_size():
+    extents = Extents()
+    extents.add(Pt(3, -2))
+    assert extents.centre() == (3, -2)
+    assert extents.size() == (0, 0)
+
+
+def test_Max_is_updated_when_the_first_point_is_the_min():
+    extents = Extents()
+    extents.add(Pt(1, 1))
+    extents.add(Pt(5, 3))
+    assert extents.size() == (4, 2)
+
+
+# --- Window extents ---
+
+
+def test_Removed_strokes_no_longer_count():
+    window = WindowExtents()
+    window.add_cmd(Line(Pt(-10, 0), Pt(0, 0)))
+    window.add_cmd(Dot(Pt(2, 2)))
+    window.add_cmd(Dot(Pt(1, -1)))
+    assert bounds(window.extents()) == ((-4, 0.5), (12, 3))
+    window.remove_oldest(1)
+    assert bounds(window.extents()) == ((1.5, 0.5), (1, 3))
+    window.remove_oldest(2)
+    assert bounds(window.extents()) == bounds(Extents())
+
+
+def test_Window_extents_match_adding_up_every_stroke():
+    rand = random.Random(3)
+    strokes = []
+    window = WindowExtents()
+    for _ in range(500):
+        pt = Pt(rand.randrange(-50, 50), rand.randrange(-50, 50))
+        stroke = rand.choice([Dot(pt), Line(Pt(0, 0), pt)])
+        strokes.append(stroke)
+        window.add_cmd(stroke)
+        if len(strokes) > 20:
+            num = rand.randrange(len(strokes) - 20)
+            strokes = strokes[num:]
+            window.remove_oldest(num)
+        assert bounds(window.extents()) == bounds(brute_force(strokes))
@@ -0,0 +1,90 @@
+import io
+import json
+
+from graftlib.animation import Animation
+from graftlib.dot import Dot
+from graftlib.frametracer import FrameTracer, null_tracer
+from graftlib.pt import Pt
+
+
+# --- Utils ---
+
+
+class KeepOpen(io.StringIO):
+    def close(self):
+        pass
+
+
+def dot(x):
+    return Dot(Pt(x, 0), (0, 0, 0, 100), 5)
+
+
+class NoDeletes:
+    def delete_stroke(self, _stroke):
+        pass
+
+
+# --- Stages ---
+
+
+def test_Stages_inside_other_stages_are_not_counted_twice():
+    tracer = FrameTracer()
+    tracer.next_frame()
+    with tracer.stage("outer"):
+        with tracer.stage("inner"):
+            sum(range(100000))
+    tracer.next_frame()
+    assert list(tracer.last_frame.keys()) == ["inner", "outer"]
+    assert tracer.last_frame["outer"] < tracer.last_frame["inner"]
+
+
+def test_Iterating_gives_the_same_items_and_times_each_step():
+    tracer = FrameTracer()
+    tracer.next_frame()
+    assert list(tracer.iterate("count", iter([1, 2, 3]))) == [1, 2, 3]
+    tracer.next_frame()
+    assert "count" in tracer.last_frame
+
+
+def test_Not_tracing_changes_nothing():
+    items = iter([1, 2])
+    assert null_tracer.iterate("count", items) is items
+    with null_tracer.stage("anything"):
+        pass
+    assert null_tracer.last_frame == {}
+
+
+# --- Trace files ---
+
+
+def test_Trace_file_holds_a_chrome_trace_event_for_each_stage():
+    f = KeepOpen()
+    tracer = FrameTracer(f)
+    tracer.next_frame()
+    with tracer.stage("draw"):
+        pass
+    tracer.next_frame()
+    with tracer.stage("encode"):
+        pass
+    tracer.close()
+
+    events = [e for e in json.loads(f.getvalue()) if e["ph"] == "X"]
+    assert [(e["name"], e["args"]["frame"]) for e in events] == [
+        ("draw", 1),
+        ("encode", 2),
+    ]
+    assert events[0]["ts"] + events[0]["dur"] <= events[1]["ts"]
+
+
+def test_Animations_trace_their_own_stages():
+    f = KeepOpen()
+    tracer = FrameTracer(f)
+    commands = tracer.iterate("run", [[dot(1)], [dot(2)], [dot(3)]])
+    animation = Animation(commands, NoDeletes(), 2, 10, 5, tracer)
+    while animation.step():
+        animation.animate_window(100, 100)
+    tracer.close()
+
+    names = {e["name"] for e in json.loads(f.getvalue()) if e["ph"] == "X"}
+    assert names == {"extents", "run", "step", "animate_window"}
+    assert tracer.frame == 4
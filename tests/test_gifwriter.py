@@ -0,0 +1,152 @@
+import io
+import random
+import struct
+
+from graftlib.gifwriter import GifWriter, lzw_encode, palette
+
+
+# --- Utils ---
+
+
+def lzw_decode(data: bytes, min_code_size: int = 8) -> bytes:
+    clear = 1 << min_code_size
+    end = clear + 1
+    bits = int.from_bytes(data, "little")
+    pos = 0
+    out = bytearray()
+    table = None
+    code_size = min_code_size + 1
+    prev = None
+    while True:
+        code = (bits >> pos) & ((1 << code_size) - 1)
+        pos += code_size
+        if code == clear:
+            table = [bytes([i]) for i in range(clear)] + [b"", b""]
+            code_size = min_code_size + 1
+            prev = None
+            continue
+        elif code == end:
+            return bytes(out)
+        if code < len(table):
+            entry = table[code]
+            if prev is not None:
+                table.append(prev + entry[:1])
+        else:
+            entry = prev + prev[:1]
+            table.append(entry)
+        out.extend(entry)
+        prev = entry
+        if len(table) == 1 << code_size and code_size < 12:
+            code_size += 1
+
+
+def read_frames(gif: bytes, width: int, height: int):
+    """Return the pixels (as palette indices) of each frame."""
+    assert gif[:6] == b"GIF89a"
+    pos = 13 + 3 * 256
+    screen = bytearray(width * height)
+    frames = []
+    while gif[pos] != 0x3b:
+        if gif[pos] == 0x21:  # Extension - skip
+            pos += 2
+            while gif[pos] != 0:
+                pos += gif[pos] + 1
+            pos += 1
+        else:
+            _, left, top, w, h, _ = struct.unpack(
+                "<BHHHHB", gif[pos:pos + 10])
+            pos += 11
+            data = bytearray()
+            while gif[pos] != 0:
+                data.extend(gif[pos + 1:pos + 1 + gif[pos]])
+                pos += gif[pos] + 1
+            pos += 1
+            pixels = lzw_decode(bytes(data))
+            for y in range(h):
+                start = (top + y) * width + left
+                screen[start:start + w] = pixels[y * w:(y + 1) * w]
+            frames.append(bytes(screen))
+    return frames
+
+
+def argb(indices, width, stride=None):
+    """Make ARGB32 pixel data that should map onto these palette indices."""
+    stride = width * 4 if stride is None else stride
+    ret = bytearray()
+    for y in range(len(indices) // width):
+        for i in indices[y * width:(y + 1) * width]:
+            ret.extend(struct.pack("=I", 0xff000000 | palette[i]))
+        ret.extend(b"\0" * (stride - width * 4))
+    return bytes(ret)
+
+
+# --- Compressing ---
+
+
+def test_Compressed_data_decompresses_to_the_same():
+    rand = random.Random(1)
+    for inp in (
+        b"\x01",
+        b"\x00" * 10000,
+        bytes(rand.randrange(256) for _ in range(20000)),
+        bytes(rand.randrange(4) for _ in range(50000)),
+    ):
+        assert lzw_decode(lzw_encode(inp)) == inp
+
+
+# --- Writing ---
+
+
+def test_Palette_has_mixes_of_graft_colours_and_greys():
+    assert len(palette) == 256
+    assert 0xffffff in palette
+    assert 0x000000 in palette
+    assert 0xff0000 in palette
+    assert 0x339966 in palette  # r=20 g=60 b=40
+
+
+def test_Frames_are_written_as_they_are_added():
+    rand = random.Random(2)
+    frame1 = [0] * 12
+    frame2 = list(frame1)
+    frame2[5] = rand.randrange(256)
+    frame3 = [rand.randrange(256) for _ in range(12)]
+
+    f = io.BytesIO()
+    writer = GifWriter(f, 4, 3)
+    for frame in (frame1, frame2, frame2, frame3):
+        writer.add_frame(argb(frame, 4), 16)
+    writer.close()
+
+    assert read_frames(f.getvalue(), 4, 3) == [
+        bytes(frame1), bytes(frame2), bytes(frame2), bytes(frame3)
+    ]
+
+
+def test_Padding_at_the_end_of_rows_is_ignored():
+    frame = [3, 200, 7, 215, 255, 0]
+    f = io.BytesIO()
+    writer = GifWriter(f, 3, 2)
+    writer.add_frame(argb(frame, 3, stride=16), 16)
+    writer.close()
+    assert read_frames(f.getvalue(), 3, 2) == [bytes(frame)]
+
+
+def test_Colours_near_a_palette_entry_map_onto_it():
+    f = io.BytesIO()
+    writer = GifWriter(f, 4, 4)
+    writer.add_frame(struct.pack("=I", 0xff320000) * 16, 16)
+    writer.close()
+    [frame] = read_frames(f.getvalue(), 4, 4)
+    assert [palette[i] for i in frame] == [0x330000] * 16
+
+
+def test_Colours_between_palette_entries_are_dithered():
+    f = io.BytesIO()
+    writer = GifWriter(f, 8, 8)
+    writer.add_frame(struct.pack("=I", 0xff7f0000) * 64, 32)
+    writer.close()
+    [frame] = read_frames(f.getvalue(), 8, 8)
+    reds = [palette[i] >> 16 for i in frame]
+    assert set(reds) == {0x66, 0x99}
+    assert abs(sum(reds) / len(reds) - 0x7f) < 4
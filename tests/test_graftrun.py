@@ -0,0 +1,89 @@
+import random
+
+from graftlib.eval_cell import eval_cell
+from graftlib.graftrun import (
+    MultipleRunningPrograms,
+    evict_newest,
+    evict_oldest,
+    graftrun,
+)
+from graftlib.lex_cell import lex_cell
+from graftlib.parse_cell import parse_cell
+
+
+# --- Utils ---
+
+
+def programs(inp, max_forks, evict=evict_oldest, batch=False):
+    return MultipleRunningPrograms(
+        list(parse_cell(lex_cell(inp))),
+        random.Random(1).uniform,
+        max_forks,
+        eval_cell,
+        batch,
+        evict=evict,
+    )
+
+
+def fork_ids(progs):
+    return [prog.env.get("f").value for prog, _ in progs.programs]
+
+
+# --- Scheduling ---
+
+
+def test_Oldest_forks_are_evicted_by_default():
+    progs = programs("T(4,F) S()", 3)
+    progs.next()
+    assert fork_ids(progs) == [2, 3, 4]
+    assert progs.stats.evictions == 2
+
+
+def test_Evicting_newest_keeps_the_original_program_running():
+    progs = programs("T(4,F) S()", 3, evict_newest)
+    progs.next()
+    assert fork_ids(progs) == [0, 1, 2]
+    assert progs.stats.evictions == 2
+
+
+def test_Strokes_wait_in_a_queue_until_their_turn():
+    progs = programs("T(1000,S)", 10)
+    [(stroke, _)] = progs.next()
+    assert stroke is not None
+    assert progs.stats.max_queue_depth == 1000
+    assert progs.queued() == 999
+    for _ in range(999):
+        progs.next()
+    assert progs.queued() == 0
+
+
+def test_Queued_strokes_are_counted_as_forks_run_and_are_evicted():
+    for batch in (False, True):
+        progs = programs(
+            "T(3,S) ^ F() T(R()*4,{S() d+=R()})", 6, batch=batch)
+        for _ in range(50):
+            progs.next()
+            assert progs.queued() == sum(
+                len(queue) for _, queue in progs.programs)
+        assert progs.stats.evictions > 0
+
+
+def test_graftrun_can_evict_the_newest_forks():
+    def directions(evict):
+        [frame] = graftrun(
+            parse_cell(lex_cell("T(4,F) d=f*90 S()")),
+            1,
+            None,
+            3,
+            eval_cell,
+            evict=evict,
+        )
+        return [
+            (round(ln.end.x - ln.start.x), round(ln.end.y - ln.start.y))
+            for ln in frame
+        ]
+
+    # Forks 2, 3 and 4 are left, so d is 180, 270 and 360
+    assert directions(evict_oldest) == [(0, -10), (-10, 0), (0, 10)]
+    # Forks 0, 1 and 2 are left, so d is 0, 90 and 180
+    assert directions(evict_newest) == [(0, 10), (10, 0), (0, -10)]
@@ -248,3 +248,17 @@ def test_Square_brackets_produce_array_tokens():
             EndArrayToken(),
         ]
     )
+
+
+def test_Tokens_know_where_they_start():
+    assert (
+        [tok.pos for tok in lexed("x+=10  S(\"a b\")")] ==
+        [0, 1, 3, 5, 7, 8, 9, 14]
+    )
+
+
+def test_Characters_from_any_iterable_are_lexed_like_a_string():
+    assert (
+        list(lex_cell(iter("d+=1 S()"))) ==
+        lexed("d+=1 S()")
+    )
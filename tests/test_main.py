@@ -0,0 +1,52 @@
+import io
+import random
+
+import pytest
+
+pytest.importorskip("cairo")
+pytest.importorskip("gi")
+
+from graftlib.main import main  # noqa: E402
+from graftlib.world import World  # noqa: E402
+
+
+# --- Utils ---
+
+
+def run_main(*args):
+    stdout = io.TextIOWrapper(io.BytesIO())
+    stderr = io.StringIO()
+    ret = main(
+        World(
+            ["graft"] + list(args),
+            None,
+            stdout,
+            stderr,
+            random.Random(1),
+            None,
+        )
+    )
+    stdout.flush()
+    return ret, stdout.buffer.getvalue(), stderr.getvalue()
+
+
+# --- Output ---
+
+
+def test_Raw_frames_can_be_written_to_stdout():
+    ret, out, err = run_main(
+        "--frames=3", "--width=20", "--height=10", "--raw-frames=-", "S()")
+    assert ret == 0
+    assert err == ""
+    header, frames = out.split(b"\n", 1)
+    assert header.startswith(b"YUV4MPEG2 W20 H10 ")
+    frame_size = len(b"FRAME\n") + 3 * 20 * 10  # Y, U and V planes
+    assert len(frames) == 3 * frame_size
+
+
+def test_Video_without_ffmpeg_is_an_error(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))  # Where there is no ffmpeg
+    ret, _, err = run_main(
+        "--frames=3", "--video", str(tmp_path / "out.mp4"), "S()")
+    assert ret == 3
+    assert "--video requires ffmpeg" in err
@@ -0,0 +1,83 @@
+import io
+import random
+
+from graftlib.animation import Animation
+from graftlib.eval_cell import eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.memreport import MemoryReporter, count_arrays, fork_memory
+from graftlib.parse_cell import parse_cell
+from graftlib.strokeoptimiser import StrokeOptimiser
+
+
+# --- Utils ---
+
+
+def run(source, n, mem_reporter, max_forks=10):
+    program = list(parse_cell(lex_cell(source)))
+    opt = StrokeOptimiser(
+        graftrun(
+            program,
+            n,
+            random.Random(3).uniform,
+            max_forks,
+            eval_cell,
+            programs_listener=mem_reporter.watch_programs,
+        )
+    )
+    animation = Animation(mem_reporter.iterate(opt), opt, 5, 100, 5)
+    mem_reporter.watch(animation, opt)
+    while animation.step():
+        pass
+    return animation
+
+
+# --- Counting ---
+
+
+def test_Forks_are_measured_without_the_builtins():
+    mem_reporter = MemoryReporter(1000, io.StringIO())
+    run("F() S()", 10, mem_reporter)
+    forks = [
+        fork_memory(prog.env, queue)
+        for prog, queue in mem_reporter.programs.programs
+    ]
+    assert len(forks) == 10
+    for fork in forks:
+        assert fork.frames == 1
+        assert fork.names >= 10  # x, y, d, s, r, g, b, a, z, f
+        assert fork.env_bytes > 0
+
+
+def test_Arrays_in_arrays_and_closures_are_counted_once():
+    mem_reporter = MemoryReporter(1000, io.StringIO())
+    run("arr=[1,[2,3]] fn={arr2=[4] {Len(arr2)}}() S()", 3, mem_reporter)
+    programs = mem_reporter.programs.programs
+    arrays = count_arrays(prog.env for prog, _ in programs)
+    assert arrays.arrays == 3
+    assert arrays.elements == 5
+
+
+# --- Reporting ---
+
+
+def test_Memory_is_reported_every_n_steps():
+    out = io.StringIO()
+    animation = run("F() d+=R()*90 S()", 25, MemoryReporter(10, out))
+    report = out.getvalue()
+    assert report.count("--- Memory after") == 2
+    assert "--- Memory after 20 steps ---" in report
+    assert "animation: " in report
+    assert "seen strokes" in report
+    assert "forks: 10 running" in report
+    assert len(animation.strokes) > 0
+
+
+def test_Only_totals_and_the_largest_forks_are_reported():
+    out = io.StringIO()
+    mem_reporter = MemoryReporter(1000, out)
+    run("F() d+=R()*90 S()", 40, mem_reporter, max_forks=1000)
+    assert len(mem_reporter.programs.programs) > 100
+    lines = mem_reporter.describe().splitlines()
+    assert len(lines) < 20
+    assert any(line.startswith("  all forks: ") for line in lines)
@@ -0,0 +1,186 @@
+from graftlib.compile_cell import CellCompiler
+from graftlib.eval_cell import NoneValue, StringValue, eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.nativefunctionvalue import NativeFunctionValue
+from graftlib.numbervalue import NumberValue
+from graftlib.optimise_cell import optimise_cell
+from graftlib.parse_cell import (
+    AssignmentTree,
+    FunctionCallTree,
+    FunctionDefTree,
+    ModifyTree,
+    OperationTree,
+    SymbolTree,
+    parse_cell,
+)
+
+
+# --- Utils ---
+
+
+def optimised(inp):
+    return optimise_cell(parse_cell(lex_cell(inp)))
+
+
+def run(program, n, eval_expr):
+    return list(graftrun(program, n, None, 10, eval_expr))
+
+
+# --- Optimising ---
+
+
+def test_Literals_become_values():
+    assert (
+        optimised("3 'x'") ==
+        ([NumberValue(3.0), StringValue("x")], 2)
+    )
+
+
+def test_Constant_arithmetic_is_folded():
+    assert (
+        optimised("d+=360/7") ==
+        (
+            [ModifyTree("+=", SymbolTree("d"), NumberValue(360 / 7))],
+            3,
+        )
+    )
+    assert optimised("-3*-4") == ([NumberValue(12.0)], 5)
+    assert optimised("2>1") == ([NumberValue(1.0)], 3)
+
+
+def test_Arithmetic_involving_variables_is_not_folded():
+    assert (
+        optimised("x+1") ==
+        ([OperationTree("+", SymbolTree("x"), NumberValue(1.0))], 1)
+    )
+
+
+def test_Dividing_by_zero_is_left_to_fail_at_runtime():
+    assert (
+        optimised("1/0") ==
+        ([OperationTree("/", NumberValue(1.0), NumberValue(0.0))], 2)
+    )
+
+
+def test_Immediately_called_functions_are_inlined():
+    assert optimised("{S()}()") == (
+        [FunctionCallTree(SymbolTree("S"), [])], 1)
+    assert optimised("{}()") == ([NoneValue()], 1)
+    assert optimised("{:(a,b)a*b}(2,3)") == ([NumberValue(6.0)], 4)
+
+
+def test_Functions_with_several_statements_are_inlined_into_bodies():
+    assert (
+        optimised("{{J() S()}()}") ==
+        (
+            [
+                FunctionDefTree(
+                    [],
+                    [
+                        FunctionCallTree(SymbolTree("J"), []),
+                        FunctionCallTree(SymbolTree("S"), []),
+                    ]
+                )
+            ],
+            1,
+        )
+    )
+
+
+def test_Functions_that_change_variables_are_not_inlined():
+    [call], rewrites = optimised("{x=1}()")
+    assert call == FunctionCallTree(
+        FunctionDefTree([], [AssignmentTree(SymbolTree("x"), NumberValue(1))]),
+        [],
+    )
+    assert rewrites == 1
+
+
+def test_Parameters_that_natives_could_see_are_not_inlined():
+    [call], _ = optimised("{:(d)S()}(90)")
+    assert type(call) == FunctionCallTree
+    _, call = optimised("s=1 {:(a)a}(s)")[0]
+    assert type(call) == FunctionCallTree
+
+
+def test_Named_functions_are_inlined_after_they_are_defined():
+    [call, _, value], rewrites = optimised("q() q={S()} x=q()")
+    assert call == FunctionCallTree(SymbolTree("q"), [])
+    assert value == AssignmentTree(
+        SymbolTree("x"), FunctionCallTree(SymbolTree("S"), []))
+    assert rewrites == 1
+    body = optimised("q={J() S()} {q()}")[0][1].body
+    assert body == [
+        FunctionCallTree(SymbolTree("J"), []),
+        FunctionCallTree(SymbolTree("S"), []),
+    ]
+    assert optimised("sq={:(x)x*x} sq(3)")[0][1] == NumberValue(9.0)
+
+
+def test_Named_functions_that_are_changed_are_not_inlined():
+    for program in ("q={S()} q={J()} q()", "q={S()} q+=1 q()"):
+        assert optimised(program)[0][-1] == (
+            FunctionCallTree(SymbolTree("q"), []))
+
+
+def test_Named_functions_are_not_inlined_in_programs_that_fork():
+    # The fork's q changes the d of the program that defined q
+    assert optimised("q={d+=10} F() q()")[0][-1] == (
+        FunctionCallTree(SymbolTree("q"), []))
+
+
+def test_Named_functions_are_not_inlined_where_names_could_be_hidden():
+    # Inside w, d is w's parameter, but inside q it is the global d
+    [_, w], _ = optimised("q={d+=1} w={:(d) q()}")
+    assert w.value.body == [FunctionCallTree(SymbolTree("q"), [])]
+    [_, w], _ = optimised("q={d+=1} w={d=3 q()}")
+    assert w.value.body[1] == FunctionCallTree(SymbolTree("q"), [])
+
+
+def test_Functions_passed_to_T_and_For_are_run_without_calling_them():
+    for program in (
+        "T(10,{S() d+=4})",
+        "T(3,{x=1 S()})",
+        "For([1,2],{:(x) d+=x})",
+        "q={S()} T(2,q)",
+    ):
+        loop = optimised(program)[0][-1]
+        assert type(loop.fn) == NativeFunctionValue
+        assert len(loop.args) == 1
+
+
+def test_T_and_For_are_not_inlined_if_they_might_not_be_the_builtins():
+    [loop, _], _ = optimised("T(3,{S()}) T=For")
+    assert loop.fn == SymbolTree("T")
+    [fn], _ = optimised("{:(For) For([1],{:(x) S()})}")
+    assert fn.body[0].fn == SymbolTree("For")
+    [_, fn], _ = optimised("q={d+=1} w={:(d) T(2,q)}")
+    assert fn.value.body[0].fn == SymbolTree("T")
+
+
+def test_T_and_For_are_not_inlined_if_the_function_takes_wrong_args():
+    assert optimised("T(3,{:(a) S()})")[0][0].fn == SymbolTree("T")
+    assert optimised("For([1],{S()})")[0][0].fn == SymbolTree("For")
+
+
+def test_Optimised_programs_draw_the_same():
+    programs = [
+        "S() d+=360/7",
+        "r=100 z=10 d+=10+10 {S() d+=1}() T(10,{S() d+=4})",
+        "dd=0 ^ T(11,F) d=f*30 d+=dd T(10,S) dd+=1",
+        "x=0 While({x<3},{{x+=1}() {S() J()}()})",
+        "q={d+=10 S()} w={q() q()} ^ T(3,q) w() S()",
+        "q={d+=10 S()} w={q() q()} ^ F() T(3,q) w() S()",
+        "For([10,20,30],{:(d) S()}) T(2,{y=3 S()}) S()",
+        "T(3,{For([1,2],{:(a) d+=a*10 S()})}) F()",
+        "q={S()} w={:(d) q() q()} w(90) S()",
+        "a=[] T(20,{Add(a,Len(a)*17)}) For(a,{:(x) d=x S()})",
+        "T={S()} T() S()",
+    ]
+    for program in programs:
+        trees = list(parse_cell(lex_cell(program)))
+        expected = run(trees, 50, eval_cell)
+        opt, _ = optimise_cell(trees)
+        assert run(opt, 50, eval_cell) == expected
+        assert run(opt, 50, CellCompiler()) == expected
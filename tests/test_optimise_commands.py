@@ -156,3 +156,14 @@ def test_identical_strokes_from_different_parallel_streams_are_elided():
         [y, e(a)]
     ]
     assert opt(bef) == aft
+
+
+def test_memory_footprint_counts_the_strokes_we_remember():
+    strokes = [[n(p(i, 0), p(0, i))] for i in range(5)]
+    optimiser = StrokeOptimiser(iter(strokes))
+    empty = optimiser.memory_footprint()
+    [ln for ln in optimiser]
+    full = optimiser.memory_footprint()
+    assert full > empty
+    optimiser.delete_stroke(n(p(1, 0), p(0, 1)))
+    assert optimiser.memory_footprint() < full
@@ -156,6 +156,15 @@ def test_Label_is_parsed():
     )
 
 
+def test_Operators_and_calls_after_a_label_are_parsed():
+    assert (
+        parsed("^+1") ==
+        [OperationTree("+", LabelTree(), NumberTree("1"))]
+    )
+    assert parsed("^(2)") == [FunctionCallTree(LabelTree(), [NumberTree("2")])]
+    assert parsed("x ^==8")[1].left.pos == 2
+
+
 def test_Comparisons_are_parsed():
     assert (
         parsed("12<3") ==
@@ -500,3 +509,85 @@ def test_Trailing_comma_in_array_is_ignored():
             )
         ]
     )
+
+
+def test_Trees_know_where_they_start():
+    [assign, call] = parsed("x=-(2+3)\n  T(4,{:(a) a*2})")
+    assert assign.pos == 0
+    assert assign.value.pos == 2
+    assert call.pos == 11
+    [num, fn] = call.args
+    assert num.pos == 13
+    assert fn.pos == 15
+    assert fn.body[0].pos == 21
+
+
+def test_Multiplication_happens_before_addition_and_comparison():
+    assert (
+        parsed("x=1+2*3<4") ==
+        [
+            AssignmentTree(
+                SymbolTree("x"),
+                OperationTree(
+                    "<",
+                    OperationTree(
+                        "+",
+                        NumberTree("1"),
+                        OperationTree("*", NumberTree("2"), NumberTree("3")),
+                    ),
+                    NumberTree("4"),
+                ),
+            )
+        ]
+    )
+
+
+def test_Operators_of_the_same_precedence_group_from_the_left():
+    assert (
+        parsed("8-4-2") ==
+        [
+            OperationTree(
+                "-",
+                OperationTree("-", NumberTree("8"), NumberTree("4")),
+                NumberTree("2"),
+            )
+        ]
+    )
+
+
+def test_Minus_only_negates_the_value_after_it():
+    assert (
+        parsed("-3*4+5") ==
+        [
+            OperationTree(
+                "+",
+                OperationTree(
+                    "*", NegativeTree(NumberTree("3")), NumberTree("4")),
+                NumberTree("5"),
+            )
+        ]
+    )
+
+
+def test_Legacy_operators_take_everything_to_their_right():
+    assert (
+        list(parse_cell(lex_cell("-3*4+5"), legacy_operators=True)) ==
+        [
+            NegativeTree(
+                OperationTree(
+                    "*",
+                    NumberTree("3"),
+                    OperationTree("+", NumberTree("4"), NumberTree("5")),
+                )
+            )
+        ]
+    )
+
+
+def test_Long_expressions_and_deep_nesting_parse():
+    [total] = parsed("+".join(["1"] * 10000))
+    assert total.right == NumberTree("1")
+    [nested] = parsed("[" * 5000 + "]" * 5000)
+    for _ in range(4999):
+        [nested] = nested.value
+    assert nested == ArrayTree([])
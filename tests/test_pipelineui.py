@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+pytest.importorskip("cairo")
+
+from graftlib.animation import Animation  # noqa: E402
+from graftlib.eval_cell import eval_cell  # noqa: E402
+from graftlib.graftrun import graftrun  # noqa: E402
+from graftlib.lex_cell import lex_cell  # noqa: E402
+from graftlib.parse_cell import parse_cell  # noqa: E402
+from graftlib.strokeoptimiser import StrokeOptimiser  # noqa: E402
+from graftlib.ui.frameui import FrameUi  # noqa: E402
+from graftlib.ui.pipelineui import PipelineUi, frame_ui  # noqa: E402
+
+
+# --- Utils ---
+
+
+class FramesWriter:
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def add_frame(self, data, stride: int):
+        assert not self.closed
+        self.frames.append((bytes(data), stride))
+
+    def close(self):
+        self.closed = True
+
+
+def make_animation(program):
+    opt = StrokeOptimiser(
+        graftrun(
+            parse_cell(lex_cell(program)),
+            40,
+            random.Random(1).uniform,
+            20,
+            eval_cell,
+        )
+    )
+    return Animation(opt, opt, 10, 30, 5)
+
+
+def draw_frames(program, render_workers, group_strokes=False):
+    writer = FramesWriter()
+    frame_ui(
+        make_animation(program),
+        writer,
+        (60, 40),
+        group_strokes,
+        render_workers,
+    ).run()
+    assert writer.closed
+    return writer.frames
+
+
+def difference(frame1, frame2):
+    """The largest difference in any channel of any pixel."""
+    (data1, stride1), (data2, stride2) = frame1, frame2
+    assert stride1 == stride2
+    return max(abs(b1 - b2) for b1, b2 in zip(data1, data2))
+
+
+# --- Drawing ---
+
+
+def test_frame_ui_uses_a_pipeline_only_with_render_workers():
+    animation = make_animation("S()")
+    assert type(frame_ui(animation, None, (60, 40))) == FrameUi
+    assert type(frame_ui(animation, None, (60, 40), False, 2)) == PipelineUi
+
+
+def test_Pipeline_frames_look_like_FrameUi_frames_in_the_same_order():
+    programs = [
+        "d+=23 s+=0.5 r+=3 S() D()",
+        "T(3,F) d=f*120 ^ d+=7 S() g+=5",
+    ]
+    for program in programs:
+        for group_strokes in (False, True):
+            expected = draw_frames(program, None, group_strokes)
+            frames = draw_frames(program, 2, group_strokes)
+            assert len(frames) == len(expected) == 40
+            for frame, expected_frame in zip(frames, expected):
+                # FrameUi's BackBuffer can be up to max_drift_pixels out
+                assert difference(frame, expected_frame) < 96
+
+            # Frames often change by more than that, so we would notice
+            # frames in the wrong order.
+            changes = sum(
+                1
+                for before, after in zip(expected, expected[1:])
+                if difference(before, after) >= 96
+            )
+            assert changes > 10
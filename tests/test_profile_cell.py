@@ -0,0 +1,125 @@
+import random
+
+import pytest
+
+from graftlib.compile_cell import CellCompiler
+from graftlib.eval_cell import eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.parse_cell import parse_cell
+from graftlib.profile_cell import CellProfiler
+
+
+# --- Utils ---
+
+
+def run(source, eval_expr, n=10, profiler=None):
+    program = list(parse_cell(lex_cell(source)))
+    if profiler is not None:
+        program = profiler.instrument(program)
+        eval_expr = profiler.wrap(eval_expr)
+    rand = random.Random(3).uniform
+    return list(graftrun(program, n, rand, 10, eval_expr))
+
+
+def profiled(source, eval_expr=eval_cell, n=10):
+    profiler = CellProfiler(source)
+    run(source, eval_expr, n, profiler)
+    return {
+        profiler.describe(key): entry.calls
+        for key, entry in profiler.entries.items()
+    }
+
+
+def error(source, eval_expr, profiler=None):
+    with pytest.raises(Exception) as e:
+        run(source, eval_expr, 10, profiler)
+    return str(e.value)
+
+
+program = "Sq={:(x) x*x}\nd+=Sq(3) T(2,{S()}) For([1],{:(v) D()})"
+
+
+# --- Profiling ---
+
+
+def test_Profiling_does_not_change_what_is_drawn():
+    source = program + " d+=R()*10 F()"
+    for eval_expr in (eval_cell, CellCompiler()):
+        profiler = CellProfiler(source)
+        assert (
+            run(source, eval_expr, 50, profiler) ==
+            run(source, eval_cell, 50)
+        )
+
+
+def test_Calls_are_counted_with_where_they_are_in_the_program():
+    for eval_expr in (eval_cell, CellCompiler()):
+        # 3 steps: the 2 S()s and the D(), so the program runs once
+        assert profiled(program, eval_expr, 3) == {
+            "statement at 1:1  Sq={:(x) x*x}": 1,
+            "statement at 2:1  d+=Sq(3) T(2,{S()}) For([1]...": 1,
+            "function at 1:4  {:(x) x*x}": 1,
+            "statement at 2:10  T(2,{S()}) For([1],{:(v) D()})": 1,
+            "native T": 1,
+            "function at 2:14  {S()}) For([1],{:(v) D()})": 2,
+            "native S": 2,
+            "statement at 2:21  For([1],{:(v) D()})": 1,
+            "native For": 1,
+            "function at 2:29  {:(v) D()})": 1,
+            "native D": 1,
+        }
+
+
+def test_Standard_library_functions_are_counted_by_name():
+    calls = profiled("i=0 While({i<3},{i+=1}) S()", n=1)
+    assert calls["function While"] == 1
+    assert calls["function at 1:17  {i+=1}) S()"] == 3
+
+
+def test_Recursive_calls_are_only_timed_once():
+    source = "Fib={:(n) If(n<2,{n},{Fib(n-1)+Fib(n-2)})} x=Fib(10) S()"
+    profiler = CellProfiler(source)
+    run(source, eval_cell, 1, profiler)
+    [fib] = [
+        entry for key, entry in profiler.entries.items()
+        if key == ("function", 4)
+    ]
+    [statement] = [
+        entry for key, entry in profiler.entries.items()
+        if key == ("statement", 43)
+    ]
+    assert fib.calls == 177
+    assert fib.cumulative <= statement.cumulative
+    assert "function at 1:5" in profiler.report()
+
+
+def test_Profiling_does_not_change_error_messages():
+    sources = [
+        "Sq={:(x) x*x} d+=Sq() S()",  # Wrong number of arguments
+        "While({1},{:(x) x}) S()",  # In the standard library
+        "x=3 x(2) S()",  # Not a function
+    ]
+    for source in sources:
+        for make_eval_expr in (lambda: eval_cell, CellCompiler):
+            profiler = CellProfiler(source)
+            assert (
+                error(source, make_eval_expr(), profiler) ==
+                error(source, make_eval_expr())
+            )
+
+
+def test_Errors_name_program_functions_as_they_are():
+    source = "T(2,{:(x) S()})"  # T() calls the function with no arguments
+    for make_eval_expr in (lambda: eval_cell, CellCompiler):
+        profiler = CellProfiler(source)
+        message = error(source, make_eval_expr(), profiler)
+        # Its body is instrumented, and holds addresses, so stop before it
+        assert message.startswith(
+            "0 arguments passed to function UserFunctionValue(" +
+            "params=[SymbolTree(value='x')], body="
+        )
+        assert (
+            message.split("body=")[0] ==
+            error(source, make_eval_expr()).split("body=")[0]
+        )
@@ -0,0 +1,68 @@
+from graftlib.lex_cell import lex_cell
+from graftlib.parse_cell import (
+    AssignmentTree,
+    FunctionCallTree,
+    FunctionDefTree,
+    OperationTree,
+    SymbolTree,
+    parse_cell,
+)
+from graftlib.resolve_cell import SlotTree, resolve_body, resolve_cell
+
+
+# --- Utils ---
+
+
+def resolved(inp):
+    return [resolve_cell(expr) for expr in parse_cell(lex_cell(inp))]
+
+
+# --- Resolving ---
+
+
+def test_Top_level_symbols_are_left_alone():
+    assert (
+        resolved("x=y") ==
+        [AssignmentTree(SymbolTree("x"), SymbolTree("y"))]
+    )
+
+
+def test_Parameters_are_resolved_to_slots():
+    assert (
+        resolved("{:(a,b)b+c}") ==
+        [
+            FunctionDefTree(
+                [SymbolTree("a"), SymbolTree("b")],
+                [
+                    OperationTree(
+                        "+",
+                        SlotTree("b", 0, 1),
+                        SymbolTree("c"),
+                    )
+                ]
+            )
+        ]
+    )
+
+
+def test_Parameters_of_enclosing_functions_are_further_up():
+    [outer] = resolved("{:(a,b){:(b)a+b}}")
+    [inner] = outer.body
+    assert (
+        inner.body ==
+        [OperationTree("+", SlotTree("a", 2, 0), SlotTree("b", 0, 0))]
+    )
+
+
+def test_Assigning_to_a_parameter_uses_its_slot():
+    [fn] = resolved("{:(a,x)a=3 x=4}")
+    assert fn.body[0].symbol == SlotTree("a", 0, 0)
+    assert fn.body[1].symbol == SymbolTree("x")  # x and y are magic
+
+
+def test_Function_bodies_can_be_resolved_directly():
+    body = list(parse_cell(lex_cell("a(S)")))
+    assert (
+        resolve_body([SymbolTree("a")], body) ==
+        [FunctionCallTree(SlotTree("a", 0, 0), [SymbolTree("S")])]
+    )
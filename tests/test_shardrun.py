@@ -0,0 +1,156 @@
+import random
+
+import pytest
+
+from graftlib.compile_cell import CellCompiler
+from graftlib.eval_cell import UserFunctionValue, eval_cell
+from graftlib.graftrun import graftrun
+from graftlib.lex_cell import lex_cell
+from graftlib.env import Env
+from graftlib.make_graft_env import builtins_env, make_graft_env
+from graftlib.numbervalue import NumberValue
+from graftlib.parse_cell import parse_cell
+from graftlib.programenv import ProgramEnv
+from graftlib.shardrun import (
+    Shard,
+    ShardedRunningPrograms,
+    dump_fork,
+    fork_rand,
+    load_fork,
+)
+
+
+# --- Utils ---
+
+
+def run(program, n, workers, max_forks=10, eval_expr=eval_cell):
+    return list(
+        graftrun(
+            parse_cell(lex_cell(program)),
+            n,
+            random.Random(3).uniform,
+            max_forks,
+            eval_expr,
+            False,
+            workers,
+        )
+    )
+
+
+def run_sharded(program, n, workers, block_steps, max_forks=10):
+    progs = ShardedRunningPrograms(
+        list(parse_cell(lex_cell(program))),
+        3,
+        max_forks,
+        eval_cell,
+        workers,
+        block_steps=block_steps,
+    )
+    try:
+        return [[stroke for stroke, _ in progs.next()] for _ in range(n)]
+    finally:
+        progs.close()
+
+
+# --- Sending forks between processes ---
+
+
+def test_Forks_are_sent_without_the_builtins():
+    env = make_graft_env()
+    env.set("x", NumberValue(3.0))
+    env.set("s", env.get("Sin"))
+    pc, label, loaded = load_fork(dump_fork(4, 2, env))
+    assert (pc, label) == (4, 2)
+    assert loaded.get("x") == NumberValue(3.0)
+    assert loaded.get("s") is builtins_env().get("Sin")
+    assert loaded.parent() is builtins_env()
+
+
+def test_Closures_are_sent_without_the_program_around_them():
+    everything_else = [make_graft_env() for _ in range(100)]
+    env = ProgramEnv(
+        make_graft_env(), None, everything_else.append, eval_cell)
+    closure = env.make_child()
+    closure.set("y", NumberValue(2.0))
+    env.set("f", UserFunctionValue([], [], closure))
+    data = dump_fork(0, 0, env.env)
+    _, _, loaded = load_fork(data)
+    assert type(loaded.get("f").env) == Env
+    assert loaded.get("f").env.get("y") == NumberValue(2.0)
+    assert len(data) < 1000
+
+
+def test_Copies_of_a_function_share_its_body():
+    env = make_graft_env()
+    f = UserFunctionValue([], list(parse_cell(lex_cell("S()"))), Env())
+    env.set("f", f)
+    data = dump_fork(0, 0, env)
+    _, _, loaded1 = load_fork(data)
+    _, _, loaded2 = load_fork(data)
+    assert loaded1.get("f") is not loaded2.get("f")
+    assert loaded1.get("f").body is loaded2.get("f").body
+
+
+def test_Each_fork_has_its_own_random_numbers():
+    assert fork_rand(1, 2)(0, 10) == fork_rand(1, 2)(0, 10)
+    assert fork_rand(1, 2)(0, 10) != fork_rand(1, 3)(0, 10)
+    assert fork_rand(1, 2)(0, 10) != fork_rand(2, 2)(0, 10)
+
+
+# --- Running ---
+
+
+def test_Shards_run_a_block_of_steps_until_something_forks():
+    env = make_graft_env()
+    shard = Shard(list(parse_cell(lex_cell("^ S()"))), eval_cell, 1, False)
+    steps, parents = shard.run_block(0, [(0, dump_fork(0, 0, env))], 5)
+    assert len(steps) == 5
+    assert parents == []
+
+    shard = Shard(list(parse_cell(lex_cell("^ S() F()"))), eval_cell, 1, False)
+    steps, parents = shard.run_block(0, [(0, dump_fork(0, 0, env))], 5)
+    assert len(steps) == 3  # The label, S() and F()
+    assert parents == [0]
+
+
+def test_Sharded_programs_draw_the_same_as_one_process():
+    programs = [
+        "T(3,F) d=f*90 ^ S() d+=f",
+        "dd=0 ^ T(3,F) d=f*30 d+=dd T(4,S) dd+=1",
+        "T(20,F) ^ S() r=f D()",
+    ]
+    for program in programs:
+        expected = run(program, 30, None)
+        assert run(program, 30, 1) == expected
+        assert run(program, 30, 3) == expected
+
+
+def test_Random_numbers_do_not_depend_on_the_number_of_workers():
+    program = "T(5,F) ^ d+=R() S() F()"
+    expected = run(program, 30, 1)
+    assert run(program, 30, 2) == expected
+    assert run(program, 30, 4, eval_expr=CellCompiler()) == expected
+
+
+def test_Output_does_not_depend_on_how_many_steps_workers_run_at_once():
+    programs = [
+        # Forks rarely, and drops the oldest forks
+        "^ S() d+=7 If(d>100,{d=f F()},{0})",
+        # Forks often, in bursts
+        "dd=0 ^ T(3,F) d=f*30 d+=dd T(4,S) dd+=1",
+    ]
+    for program in programs:
+        assert run(program, 60, 3, max_forks=3) == run(
+            program, 60, None, max_forks=3)
+        expected = run_sharded(program, 60, 1, 1, 3)
+        for block_steps in (3, 32):
+            assert run_sharded(program, 60, 1, block_steps, 3) == expected
+            assert run_sharded(program, 60, 3, block_steps, 3) == expected
+
+
+def test_Errors_in_workers_are_raised_in_the_main_process():
+    program = "f={:(a) a} T(3,F) ^ f()"
+    with pytest.raises(Exception, match="0 arguments passed to function"):
+        run(program, 3, None)
+    with pytest.raises(Exception, match="0 arguments passed to function"):
+        run(program, 3, 2)
@@ -0,0 +1,168 @@
+import random
+
+import attr
+
+from graftlib.animation import Animation
+from graftlib.dot import Dot
+from graftlib.line import Line
+from graftlib.pt import Pt
+from graftlib.strokegrid import StrokeGrid
+
+
+# --- Utils ---
+
+
+def overlaps(stroke, left, bottom, right, top):
+    if type(stroke) == Line:
+        pts = (stroke.start, stroke.end)
+    else:
+        pts = (stroke.pos,)
+    return (
+        max(p.x for p in pts) >= left and
+        min(p.x for p in pts) <= right and
+        max(p.y for p in pts) >= bottom and
+        min(p.y for p in pts) <= top
+    )
+
+
+def random_stroke(rand):
+    pt = Pt(rand.uniform(-1000, 1000), rand.uniform(-1000, 1000))
+    if rand.random() < 0.5:
+        return Dot(pt)
+    length = rand.choice([10, 10, 10, 2000])
+    end = Pt(pt.x + rand.uniform(-length, length), pt.y)
+    return Line(pt, end)
+
+
+def drawn_overlaps(stroke, scale, left, bottom, right, top):
+    """
+    Whether stroke might be drawn inside the rectangle: its bounding
+    box, plus half its size, or half a pixel at this scale for thin
+    lines.
+    """
+    r = max(abs(stroke.size) / 2, 0.5 / scale)
+    if type(stroke) == Line:
+        pts = (stroke.start, stroke.end)
+    else:
+        pts = (stroke.pos,)
+    return (
+        max(p.x for p in pts) + r >= left and
+        min(p.x for p in pts) - r <= right and
+        max(p.y for p in pts) + r >= bottom and
+        min(p.y for p in pts) - r <= top
+    )
+
+
+def edge_strokes(rand, left, bottom, right, top):
+    """
+    Thick lines whose middles are just outside the rectangle, and dots
+    whose middles are on its edges or just outside.
+    """
+    ret = []
+    for _ in range(4):
+        size = rand.choice([4, 40, 400])
+        off = rand.choice([0, size * 0.49, -size * 0.49])
+        x = rand.uniform(left, right)
+        y = rand.uniform(bottom, top)
+        ret += [
+            Dot(Pt(left - off, y), size=size),
+            Dot(Pt(right + off, y), size=size),
+            Dot(Pt(x, bottom - off), size=size),
+            Dot(Pt(x, top + off), size=size),
+            Line(Pt(left - off, y), Pt(left - off, y + 5), size=size),
+            Line(Pt(x, top + off), Pt(x + 5, top + off), size=-size),
+        ]
+    return ret
+
+
+# --- Finding ---
+
+
+def test_Only_strokes_near_the_rectangle_are_found():
+    grid = StrokeGrid()
+    near = Dot(Pt(10, 10))
+    far = Dot(Pt(1000, -500))
+    grid.add(near)
+    grid.add(far)
+    assert grid.find(0, 0, 20, 20) == [near]
+    assert grid.find(900, -600, 1100, -400) == [far]
+    assert grid.find(-1000, -1000, 1000, 1000) == [near, far]
+
+
+def test_Long_lines_are_found_anywhere_along_them():
+    grid = StrokeGrid()
+    line = Line(Pt(-5000, 0), Pt(5000, 0))
+    grid.add(line)
+    assert grid.find(-10, -10, 10, 10) == [line]
+    assert grid.find(4000, -10, 4010, 10) == [line]
+    assert grid.find(0, 100, 10, 110) == [line]  # Near enough
+
+
+def test_Removed_strokes_are_not_found():
+    grid = StrokeGrid()
+    strokes = [Dot(Pt(i, i)) for i in range(5)]
+    for stroke in strokes:
+        grid.add(stroke)
+    grid.remove_oldest(strokes[:3])
+    assert grid.find(-10, -10, 10, 10) == strokes[3:]
+
+
+def test_Found_strokes_include_all_overlapping_in_order():
+    rand = random.Random(4)
+    grid = StrokeGrid()
+    strokes = []
+    for _ in range(2000):
+        stroke = random_stroke(rand)
+        strokes.append(stroke)
+        grid.add(stroke)
+        if len(strokes) > 500:
+            grid.remove_oldest(strokes[:10])
+            strokes = strokes[10:]
+
+    for _ in range(50):
+        x = rand.uniform(-1000, 1000)
+        y = rand.uniform(-1000, 1000)
+        size = rand.choice([5, 100, 3000])
+        rect = (x, y, x + size, y + size)
+        found = grid.find(*rect)
+        assert found == [s for s in strokes if s in found]
+        assert (
+            [s for s in strokes if overlaps(s, *rect)] ==
+            [s for s in found if overlaps(s, *rect)]
+        )
+
+
+def test_Visible_strokes_include_all_that_might_be_drawn_in_the_window():
+    rand = random.Random(5)
+    win_w, win_h = 200, 150
+    animation = Animation(iter([]), None, 0, 1000000, 5)
+    strokes = []
+    for _ in range(3000):
+        stroke = attr.evolve(
+            random_stroke(rand),
+            size=rand.choice([0.1, 5, 60, 400]) * rand.choice([1, -1]),
+        )
+        strokes.append(stroke)
+        animation.stroke_grid.add(stroke)
+
+    for _ in range(40):
+        scale = rand.choice([0.05, 0.5, 1.0, 4.0])
+        x = rand.uniform(-1000, 1000) * scale
+        y = rand.uniform(-1000, 1000) * scale
+        left, right = -x / scale, (win_w - x) / scale
+        bottom, top = (y - win_h) / scale, y / scale
+        rect = (left, bottom, right, top)
+        for stroke in edge_strokes(rand, *rect):
+            strokes.append(stroke)
+            animation.stroke_grid.add(stroke)
+
+        visible = animation.visible_strokes((x, y, scale), win_w, win_h)
+        ids = set(id(s) for s in visible)
+        assert visible == [s for s in strokes if id(s) in ids]
+        assert all(
+            id(s) in ids
+            for s in strokes if drawn_overlaps(s, scale, *rect)
+        )
+
+    # Some were too big to be put in the grid
+    assert len(animation.stroke_grid._big) > 0
@@ -0,0 +1,68 @@
+import io
+import struct
+
+from graftlib.videowriter import (
+    RawVideoWriter,
+    Y4mWriter,
+    ffmpeg_args,
+    packed_pixels,
+    raw_pixel_format,
+)
+
+
+# --- Utils ---
+
+
+def argb(*pixels):
+    return struct.pack("=%dI" % len(pixels), *pixels)
+
+
+white = 0xffffffff
+black = 0xff000000
+red = 0xffff0000
+
+
+# --- Pixels ---
+
+
+def test_Padding_is_removed_from_the_ends_of_rows():
+    data = argb(1, 2, 0, 3, 4, 0)
+    assert bytes(packed_pixels(data, 2, 2, 12)) == argb(1, 2, 3, 4)
+    assert bytes(packed_pixels(data, 3, 2, 12)) == data
+
+
+# --- Raw video ---
+
+
+def test_Raw_frames_are_written_as_they_are_added():
+    f = io.BytesIO()
+    writer = RawVideoWriter(f, 1, 2)
+    writer.add_frame(argb(white, 0, black, 0), 8)
+    assert f.getvalue() == argb(white, black)
+    writer.add_frame(argb(red, 0, red, 0), 8)
+    writer.close()
+    assert f.getvalue() == argb(white, black, red, red)
+
+
+def test_Ffmpeg_reads_raw_frames_of_the_right_size():
+    args = ffmpeg_args("out.mp4", 320, 240)
+    assert args[0] == "ffmpeg"
+    assert args[-1] == "out.mp4"
+    assert "320x240" in args
+    assert raw_pixel_format() in args
+
+
+# --- y4m ---
+
+
+def test_Y4m_has_a_header_and_three_planes_per_frame():
+    f = io.BytesIO()
+    writer = Y4mWriter(f, 2, 1)
+    writer.add_frame(argb(white, black), 8)
+    writer.add_frame(argb(red, white), 8)
+    writer.close()
+    assert f.getvalue() == (
+        b"YUV4MPEG2 W2 H1 F20:1 Ip A1:1 C444\n" +
+        b"FRAME\n" + bytes([235, 16, 128, 128, 128, 128]) +
+        b"FRAME\n" + bytes([81, 235, 90, 128, 240, 128])
+    )